@@ -0,0 +1,135 @@
+"""
+Admission control: per-route concurrency limits with bounded, prioritised queues.
+
+Every request is assigned to a pool, and each pool admits a limited number of
+requests at a time, so a flood of public searches can't take the capacity that
+logins and bookings need. Requests over the limit wait in a bounded queue for
+at most ADMISSION_QUEUE_TIMEOUT seconds; beyond that, or when the queue is
+full, they are shed with 503 and Retry-After instead of piling up.
+
+Waiters are served by priority: authenticated booking traffic first, then
+other authenticated requests, then anonymous browsing. When a queue is full a
+higher-priority request takes the place of the lowest-priority waiter, which
+is shed.
+
+Pool sizes come from ADMISSION_<POOL>_LIMIT and ADMISSION_<POOL>_QUEUE.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+
+ENABLED = os.getenv('ADMISSION_CONTROL', 'on') != 'off'
+QUEUE_TIMEOUT = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', 2))
+RETRY_AFTER_SECONDS = int(os.getenv('ADMISSION_RETRY_AFTER', 1))
+
+# Pool -> (concurrent requests, queued requests)
+DEFAULT_POOLS = {
+    'auth': (8, 16),
+    'booking': (16, 64),
+    'browse': (32, 64),
+    'default': (16, 32)
+}
+
+# Endpoints that bypass admission control: cheap, or long-lived streams with their own cap
+EXEMPT_ENDPOINTS = {'health_check', 'get_metrics', 'static', 'properties.stream_plot_availability'}
+
+PRIORITY_BOOKING = 0
+PRIORITY_AUTHENTICATED = 1
+PRIORITY_ANONYMOUS = 2
+
+def pool_for(endpoint, method):
+    """Pool name for a Flask endpoint ('blueprint.function') and HTTP method"""
+    blueprint = endpoint.split('.', 1)[0] if '.' in endpoint else ''
+    if blueprint == 'auth':
+        return 'auth'
+    if blueprint == 'booking':
+        return 'booking'
+    if blueprint == 'properties' and method == 'GET':
+        return 'browse'
+    return 'default'
+
+def priority_for(pool, authenticated):
+    if not authenticated:
+        return PRIORITY_ANONYMOUS
+    return PRIORITY_BOOKING if pool == 'booking' else PRIORITY_AUTHENTICATED
+
+class _Waiter:
+    __slots__ = ('priority', 'sequence', 'shed')
+
+    def __init__(self, priority, sequence):
+        self.priority = priority
+        self.sequence = sequence
+        self.shed = False
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+class Gate:
+    """Concurrency limit with a bounded priority queue of waiters"""
+
+    def __init__(self, name, limit, queue_size, timeout=QUEUE_TIMEOUT):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, priority):
+        """True once admitted; False if the request should be shed"""
+        with self._condition:
+            if self.active < self.limit and not self._waiters:
+                self.active += 1
+                return True
+
+            if len(self._waiters) >= self.queue_size:
+                lowest = max(self._waiters)
+                if lowest.priority <= priority:
+                    return False
+                # Make room by shedding a lower-priority waiter
+                lowest.shed = True
+                self._waiters.remove(lowest)
+                heapq.heapify(self._waiters)
+                self._condition.notify_all()
+
+            waiter = _Waiter(priority, next(self._sequence))
+            heapq.heappush(self._waiters, waiter)
+            deadline = time.monotonic() + self.timeout
+            while True:
+                if waiter.shed:
+                    return False
+                if self.active < self.limit and self._waiters[0] is waiter:
+                    heapq.heappop(self._waiters)
+                    self.active += 1
+                    # Another slot may still be free for the next waiter
+                    self._condition.notify_all()
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                    self._condition.notify_all()
+                    return False
+                self._condition.wait(remaining)
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+
+    def stats(self):
+        return {'active': self.active, 'queued': len(self._waiters), 'limit': self.limit, 'queue_size': self.queue_size}
+
+def _configured(name, limit, queue_size):
+    prefix = f'ADMISSION_{name.upper()}'
+    return Gate(name, int(os.getenv(f'{prefix}_LIMIT', limit)), int(os.getenv(f'{prefix}_QUEUE', queue_size)))
+
+gates = {name: _configured(name, limit, queue_size) for name, (limit, queue_size) in DEFAULT_POOLS.items()}
+
+def stats():
+    return {name: gate.stats() for name, gate in gates.items()}
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Month-end analytics job for Haveli Housing.
+
+Streams bookings and clients from MongoDB in batches, converts each batch to
+columnar NumPy arrays and folds it into running group-by totals, so memory is
+bounded by the batch size rather than the collection size. Results are written
+to the `reports` collection.
+
+Usage:
+    python analytics_job.py --month 2026-10 --batch-size 50000
+"""
+
+import argparse
+from datetime import datetime, timedelta
+from itertools import chain, islice
+
+import numpy as np
+
+from archive import ARCHIVES
+from database import get_database
+from ids import id_created_at
+
+# Ageing buckets (days outstanding) for payment.remaining
+AGEING_EDGES = [31, 61, 91]
+AGEING_LABELS = ['0-30', '31-60', '61-90', '90+', 'unknown']
+
+class KeyIndex:
+    """Stable mapping from group keys to dense integer codes across batches"""
+
+    def __init__(self):
+        self.codes = {}
+        self.keys = []
+
+    def encode(self, values):
+        # Factorize the batch with NumPy, then only map the distinct keys
+        uniques, inverse = np.unique(values, return_inverse=True)
+        mapping = np.empty(len(uniques), dtype=np.int64)
+        for i, key in enumerate(uniques.tolist()):
+            code = self.codes.get(key)
+            if code is None:
+                code = len(self.keys)
+                self.codes[key] = code
+                self.keys.append(key)
+            mapping[i] = code
+        return mapping[inverse.reshape(-1)]
+
+    def __len__(self):
+        return len(self.keys)
+
+class GroupTotals:
+    """Running per-key sums backed by growable NumPy arrays"""
+
+    def __init__(self, *columns):
+        self.index = KeyIndex()
+        self.totals = {column: np.zeros(0, dtype=np.float64) for column in columns}
+
+    def add(self, keys, **weights):
+        codes = self.index.encode(keys)
+        size = len(self.index)
+        for column, total in self.totals.items():
+            if len(total) < size:
+                total = np.pad(total, (0, size - len(total)))
+            column_weights = weights.get(column)
+            total += np.bincount(codes, weights=column_weights, minlength=size)
+            self.totals[column] = total
+
+    def rows(self, key_name, order_by=None):
+        order = np.arange(len(self.index))
+        if order_by:
+            order = np.argsort(-self.totals[order_by], kind='stable')
+        rows = []
+        for i in order.tolist():
+            row = {key_name: self.index.keys[i]}
+            for column, total in self.totals.items():
+                row[column] = _number(total[i])
+            rows.append(row)
+        return rows
+
+def _number(value):
+    value = float(value)
+    return int(value) if value.is_integer() else round(value, 2)
+
+def _batches(cursor, batch_size):
+    while True:
+        batch = list(islice(cursor, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def _key_column(batch, field):
+    return np.array([str(doc.get(field) or '') for doc in batch], dtype=object).astype(str)
+
+def _number_column(batch, getter):
+    return np.fromiter((getter(doc) or 0 for doc in batch), dtype=np.float64, count=len(batch))
+
+def _month_bounds(month):
+    start = datetime.strptime(month, '%Y-%m')
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start, end
+
+def aggregate_bookings(db, start, end, batch_size):
+    """Revenue by property and employee league table for bookings in [start, end)"""
+    by_property = GroupTotals('bookings', 'confirmed', 'revenue')
+    by_employee = GroupTotals('bookings', 'confirmed', 'revenue')
+    rows = 0
+
+    # Cancelled bookings from older months may have been archived
+    cursor = chain.from_iterable(
+        collection.find(
+            {'booking_date': {'$gte': start, '$lt': end}},
+            {'property_id': 1, 'saled_by': 1, 'status': 1, 'amount': 1, '_id': 0}
+        ).batch_size(batch_size)
+        for collection in (db.bookings, db[ARCHIVES['bookings']])
+    )
+
+    for batch in _batches(cursor, batch_size):
+        amounts = _number_column(batch, lambda doc: doc.get('amount'))
+        confirmed = np.fromiter((doc.get('status') == 'confirmed' for doc in batch), dtype=bool, count=len(batch))
+        ones = np.ones(len(batch))
+        weights = {
+            'bookings': ones,
+            'confirmed': confirmed.astype(np.float64),
+            'revenue': np.where(confirmed, amounts, 0.0)
+        }
+
+        by_property.add(_key_column(batch, 'property_id'), **weights)
+
+        # Bookings without a seller don't belong in the league table
+        sellers = _key_column(batch, 'saled_by')
+        has_seller = sellers != ''
+        by_employee.add(sellers[has_seller], **{k: v[has_seller] for k, v in weights.items()})
+
+        rows += len(batch)
+        print(f"Processed {rows} bookings...")
+
+    return by_property, by_employee, rows
+
+def aggregate_outstanding(db, as_of, batch_size):
+    """Outstanding collections by property and ageing bucket on payment.remaining"""
+    by_property = GroupTotals('clients', 'remaining')
+    ageing_amounts = np.zeros(len(AGEING_LABELS))
+    ageing_counts = np.zeros(len(AGEING_LABELS))
+    rows = 0
+
+    cursor = db.clients.find(
+        {'payment.remaining': {'$gt': 0}},
+        {'project_id': 1, 'payment.remaining': 1}
+    ).batch_size(batch_size)
+
+    for batch in _batches(cursor, batch_size):
+        # Clients carry no creation date, so age them by their ObjectId timestamp
+        ages = np.fromiter(
+            ((as_of - created).days if created else np.nan
+             for created in map(id_created_at, (doc['_id'] for doc in batch))),
+            dtype=np.float64,
+            count=len(batch)
+        )
+        # Clients created after as_of weren't owing anything yet (unknown ages are kept)
+        existed = ~(ages < 0)
+        if not existed.all():
+            batch = [doc for doc, keep in zip(batch, existed) if keep]
+            ages = ages[existed]
+            if not batch:
+                continue
+
+        remaining = _number_column(batch, lambda doc: doc.get('payment', {}).get('remaining'))
+        by_property.add(_key_column(batch, 'project_id'), clients=np.ones(len(batch)), remaining=remaining)
+
+        buckets = np.where(np.isnan(ages), len(AGEING_LABELS) - 1, np.digitize(np.nan_to_num(ages), AGEING_EDGES))
+        ageing_amounts += np.bincount(buckets, weights=remaining, minlength=len(AGEING_LABELS))
+        ageing_counts += np.bincount(buckets, minlength=len(AGEING_LABELS))
+
+        rows += len(batch)
+        print(f"Processed {rows} clients...")
+
+    ageing = [
+        {'bucket': label, 'clients': _number(count), 'remaining': _number(amount)}
+        for label, count, amount in zip(AGEING_LABELS, ageing_counts, ageing_amounts)
+    ]
+    return by_property, ageing, rows
+
+def run_month_end(month=None, batch_size=50000):
+    db = get_database()
+    month = month or datetime.utcnow().strftime('%Y-%m')
+    start, end = _month_bounds(month)
+
+    bookings_by_property, bookings_by_employee, booking_rows = aggregate_bookings(db, start, end, batch_size)
+    outstanding_by_property, ageing, client_rows = aggregate_outstanding(db, end, batch_size)
+
+    outstanding = outstanding_by_property.rows('property_id', order_by='remaining')
+    report = {
+        'type': 'month_end',
+        'month': month,
+        'generated_at': datetime.utcnow(),
+        'bookings_processed': booking_rows,
+        'clients_processed': client_rows,
+        'revenue_by_property': bookings_by_property.rows('property_id', order_by='revenue'),
+        'employee_league_table': bookings_by_employee.rows('employee_id', order_by='revenue'),
+        'collections_outstanding': {
+            'total': _number(sum(row['remaining'] for row in outstanding)),
+            'by_property': outstanding
+        },
+        'ageing': ageing
+    }
+
+    db.reports.replace_one({'_id': f'month_end:{month}'}, report, upsert=True)
+    print(f"Month-end report for {month} written to reports collection")
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compute month-end sales and collections reports')
+    parser.add_argument('--month', help='Reporting month as YYYY-MM (default: current month)')
+    parser.add_argument('--batch-size', type=int, default=50000, help='Documents per batch (bounds memory use)')
+    args = parser.parse_args()
+
+    run_month_end(args.month, args.batch_size)
@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, session
+from flask import Flask, request, jsonify, session, g
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
@@ -9,6 +9,13 @@ from auth import auth_bp
 from properties import properties_bp
 from employees import employees_bp
 from booking import booking_bp
+from reports import reports_bp
+from metrics import metrics
+import admission
+import deadlines
+import resilience
+import outbox
+import holds
 
 # Load environment variables
 load_dotenv()
@@ -27,6 +34,74 @@ app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(properties_bp, url_prefix='/api/properties')
 app.register_blueprint(employees_bp, url_prefix='/api/employees')
 app.register_blueprint(booking_bp, url_prefix='/api/booking')
+app.register_blueprint(reports_bp, url_prefix='/api/reports')
+
+# Applies queued booking side effects (see outbox.py)
+outbox.start_worker_thread()
+# Cancels pending bookings whose hold has expired (see holds.py)
+holds.start_scheduler()
+
+@app.before_request
+def start_deadline():
+    # Registered first, so time spent queueing for admission counts against it
+    deadlines.start(request.endpoint, request.headers.get(deadlines.DEADLINE_HEADER))
+
+@app.before_request
+def admit_request():
+    """Admission control: wait for a slot in the route's pool, or shed with 503"""
+    endpoint = request.endpoint
+    if not admission.ENABLED or endpoint is None or endpoint in admission.EXEMPT_ENDPOINTS:
+        return None
+    if request.method == 'OPTIONS':
+        return None
+    
+    pool = admission.pool_for(endpoint, request.method)
+    gate = admission.gates[pool]
+    if not gate.acquire(admission.priority_for(pool, 'user_id' in session)):
+        metrics.incr(f'admission.shed.{pool}')
+        metrics.incr(f'admission.shed.route.{endpoint}')
+        response = jsonify({
+            'success': False,
+            'error': 'Server is busy, please retry shortly'
+        })
+        response.headers['Retry-After'] = str(admission.RETRY_AFTER_SECONDS)
+        return response, 503
+    
+    g.admission_gate = gate
+    return None
+
+@app.teardown_request
+def release_admission(error=None):
+    gate = g.pop('admission_gate', None)
+    if gate is not None:
+        gate.release()
+
+@app.after_request
+def report_deadline(response):
+    """Turn errors caused by an exceeded deadline into 504s"""
+    if deadlines.exceeded() and response.status_code == 500:
+        metrics.incr('deadline.exceeded')
+        metrics.incr(f'deadline.exceeded.route.{request.endpoint}')
+        response = jsonify({
+            'success': False,
+            'error': 'The request took too long and was cancelled'
+        })
+        response.status_code = 504
+    return response
+
+@app.after_request
+def report_unavailable(response):
+    """Turn errors caused by an unreachable database into 503s"""
+    if response.status_code == 500 and g.get('database_unavailable'):
+        metrics.incr('resilience.unavailable')
+        metrics.incr(f'resilience.unavailable.route.{request.endpoint}')
+        response = jsonify({
+            'success': False,
+            'error': 'The database is temporarily unavailable, please try again shortly'
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(max(1, resilience.breaker.retry_after()))
+    return response
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -35,6 +110,15 @@ def health_check():
         'message': 'Haveli Housing API is running'
     })
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify({
+        'success': True,
+        'metrics': metrics.snapshot(),
+        'admission': admission.stats(),
+        'database': {'circuit': resilience.breaker.state}
+    })
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Archival of old cancelled bookings and completed clients.
+
+`bookings` and `clients` only need the documents that are still being worked
+on. This job moves cancelled bookings older than ARCHIVE_BOOKINGS_AFTER_DAYS
+(by `booking_date`) and completed clients older than ARCHIVE_CLIENTS_AFTER_DAYS
+(by their ObjectId timestamp, as clients have no creation date) into
+`bookings_archive` and `clients_archive`, in batches, so the hot collections
+and their indexes stay small as history accumulates.
+
+Each batch is copied first and then deleted from the hot collection, only if
+it still matches; a document that changed in between stays hot and its copy
+is dropped, and a rerun after a crash skips copies that already exist. List
+endpoints read the hot collections unless asked for `include_archived`.
+
+Usage:
+    python archive.py [--batch-size 1000] [--dry-run]
+"""
+
+import argparse
+import heapq
+import os
+from datetime import datetime, timedelta
+from itertools import islice
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from database import get_database
+import multiget
+
+BOOKINGS_AFTER_DAYS = int(os.getenv('ARCHIVE_BOOKINGS_AFTER_DAYS', 180))
+CLIENTS_AFTER_DAYS = int(os.getenv('ARCHIVE_CLIENTS_AFTER_DAYS', 365))
+BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 1000))
+
+ARCHIVES = {
+    'bookings': 'bookings_archive',
+    'clients': 'clients_archive'
+}
+
+def include_archived(args):
+    return args.get('include_archived', '').lower() in ('1', 'true')
+
+def archive_queries(now=None):
+    """Hot collection -> (filter for archivable documents, batch order)"""
+    now = now or datetime.utcnow()
+    client_cutoff = ObjectId.from_datetime(now - timedelta(days=CLIENTS_AFTER_DAYS))
+    return {
+        'bookings': (
+            {'status': 'cancelled', 'booking_date': {'$lt': now - timedelta(days=BOOKINGS_AFTER_DAYS)}},
+            'booking_date'
+        ),
+        'clients': ({'status': 'completed', '_id': {'$lt': client_cutoff}}, '_id')
+    }
+
+def archive_collection(db, name, query, order, batch_size=BATCH_SIZE):
+    """Move documents matching `query` from `name` to its archive; returns how many moved"""
+    hot, cold = db[name], db[ARCHIVES[name]]
+    moved = 0
+    while True:
+        documents = list(hot.find(query).sort(order, 1).limit(batch_size))
+        if not documents:
+            return moved
+        ids = [doc['_id'] for doc in documents]
+        archived_at = datetime.utcnow()
+        for doc in documents:
+            doc['archived_at'] = archived_at
+
+        try:
+            cold.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Copies left by an interrupted run are already there
+            if any(error.get('code') != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+
+        # $and, as the query may have its own condition on _id
+        hot.delete_many({'$and': [{'_id': {'$in': ids}}, query]})
+        still_hot = [doc['_id'] for doc in hot.find({'_id': {'$in': ids}}, {'_id': 1})]
+        if still_hot:
+            cold.delete_many({'_id': {'$in': still_hot}})
+
+        moved += len(ids) - len(still_hot)
+        print(f"Archived {moved} {name}...")
+        if len(documents) < batch_size:
+            return moved
+
+def run_archive(db=None, batch_size=BATCH_SIZE, dry_run=False):
+    db = db or get_database()
+    for name, (query, order) in archive_queries().items():
+        if dry_run:
+            print(f"Would archive {db[name].count_documents(query)} {name}")
+        else:
+            print(f"Moved {archive_collection(db, name, query, order, batch_size)} {name} to {ARCHIVES[name]}")
+
+def find_one(db, name, query, projection=None):
+    """A document from the hot collection, else from its archive"""
+    return db[name].find_one(query, projection) or db[ARCHIVES[name]].find_one(query, projection)
+
+def fetch_by_ids(db, name, ids, projection=None):
+    """multiget.fetch_by_ids over the hot collection, then its archive for the IDs not found"""
+    documents, missing = multiget.fetch_by_ids(db[name], ids, projection=projection)
+    if not missing:
+        return documents, missing
+    archived, missing = multiget.fetch_by_ids(db[ARCHIVES[name]], missing, projection=projection)
+    # Back into request order
+    by_id = {doc['_id']: doc for doc in documents + archived}
+    return [by_id[i] for i in ids if i in by_id], missing
+
+def count(db, name, query, archived=False):
+    total = db[name].count_documents(query)
+    if archived:
+        total += db[ARCHIVES[name]].count_documents(query)
+    return total
+
+def page(db, name, query, skip, limit, sort=None, archived=False):
+    """One page of documents from the hot collection, or from it and its archive.
+
+    With `sort` as (field, direction) both collections are read in that order
+    and merged, which costs skip + limit documents from each; without it the
+    archive simply follows the hot collection.
+    """
+    hot = db[name]
+    if not archived:
+        cursor = hot.find(query).skip(skip).limit(limit)
+        return list(cursor.sort(*sort) if sort else cursor)
+
+    cold = db[ARCHIVES[name]]
+    if sort:
+        field, direction = sort
+        sources = [collection.find(query).sort(field, direction).limit(skip + limit) for collection in (hot, cold)]
+        merged = heapq.merge(*sources, key=lambda doc: doc.get(field), reverse=direction < 0)
+        return list(islice(merged, skip, skip + limit))
+
+    documents = list(hot.find(query).skip(skip).limit(limit))
+    if len(documents) < limit:
+        cold_skip = max(0, skip - hot.count_documents(query)) if not documents else 0
+        documents += list(cold.find(query).skip(cold_skip).limit(limit - len(documents)))
+    return documents
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move old cancelled bookings and completed clients to archive collections')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Documents moved per batch')
+    parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+    args = parser.parse_args()
+    run_archive(batch_size=args.batch_size, dry_run=args.dry_run)
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, session
 from database import get_database
-from models import User
+from models import User, ValidationError, REGISTER_REQUEST_SCHEMA
+from ids import decode_id, encode_id
 import bcrypt
 
 auth_bp = Blueprint('auth', __name__)
@@ -33,14 +34,14 @@ def login():
         # Check password
         if bcrypt.checkpw(password.encode('utf-8'), user_data['password_hash']):
             # Store user session
-            session['user_id'] = str(user_data['_id'])
+            session['user_id'] = encode_id(user_data['_id'])
             session['user_email'] = user_data['email']
             session.permanent = True
 
             return jsonify({
                 'success': True,
                 'user': {
-                    'id': str(user_data['_id']),
+                    'id': encode_id(user_data['_id']),
                     'email': user_data['email'],
                     'name': user_data['name']
                 }
@@ -60,11 +61,15 @@ def login():
 @auth_bp.route('/register', methods=['POST'])
 def register():
     try:
-        data = request.get_json()
-        email = data.get('email')
-        name = data.get('name')
-        password = data.get('password')
+        try:
+            data = REGISTER_REQUEST_SCHEMA.validate(request.get_json())
+        except ValidationError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
 
+        email, name, password = data['email'], data['name'], data['password']
         if not email or not name or not password:
             return jsonify({
                 'success': False,
@@ -89,14 +94,14 @@ def register():
         result = users_collection.insert_one(user.to_dict())
 
         # Store user session
-        session['user_id'] = str(result.inserted_id)
+        session['user_id'] = encode_id(result.inserted_id)
         session['user_email'] = email
         session.permanent = True
 
         return jsonify({
             'success': True,
             'user': {
-                'id': str(result.inserted_id),
+                'id': encode_id(result.inserted_id),
                 'email': email,
                 'name': name
             }
@@ -135,7 +140,7 @@ def get_current_user():
         db = get_database()
         users_collection = db.users
         
-        user_data = users_collection.find_one({'_id': user_id})
+        user_data = users_collection.find_one({'_id': decode_id(user_id)})
         
         if not user_data:
             return jsonify({
@@ -146,7 +151,7 @@ def get_current_user():
         return jsonify({
             'success': True,
             'user': {
-                'id': str(user_data['_id']),
+                'id': encode_id(user_data['_id']),
                 'email': user_data['email'],
                 'name': user_data['name']
             }
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Backfill GeoJSON `location` on properties that don't have one.
+
+Runs offline, without calling any geocoding service. Coordinates come from the
+property's `map_url` when it embeds them (`@lat,lng` or `q=lat,lng`); otherwise
+from a gazetteer CSV of locality centroids (columns city, area, lat, lng),
+matched on area within the city and then on the city alone. Properties that
+match neither are listed so their location can be set by hand.
+
+Usage:
+    python backfill_locations.py [--gazetteer data/localities.csv] [--batch-size 1000] [--dry-run]
+"""
+
+import argparse
+import csv
+import os
+
+from pymongo import UpdateOne
+
+from changefeed import timestamp
+from database import get_database
+from geo import coordinates_from_map_url, point
+
+DEFAULT_GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'localities.csv')
+
+def normalize(text):
+    return ' '.join((text or '').casefold().split())
+
+def load_gazetteer(path):
+    """{(city, area): (lat, lng)}, with area '' for a whole city"""
+    gazetteer = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            gazetteer[(normalize(row['city']), normalize(row.get('area')))] = (float(row['lat']), float(row['lng']))
+    return gazetteer
+
+def locate(document, gazetteer):
+    """(lat, lng, source) for a property, or None"""
+    coordinates = coordinates_from_map_url(document.get('map_url'))
+    if coordinates:
+        return coordinates + ('map_url',)
+    address = document.get('address') or {}
+    city, area = normalize(address.get('city')), normalize(address.get('area'))
+    for key, source in (((city, area), 'area'), ((city, ''), 'city')):
+        if key in gazetteer:
+            return gazetteer[key] + (source,)
+    return None
+
+def backfill_locations(gazetteer_path=DEFAULT_GAZETTEER, batch_size=1000, dry_run=False):
+    db = get_database()
+    gazetteer = load_gazetteer(gazetteer_path)
+    counts = {'map_url': 0, 'area': 0, 'city': 0}
+    unresolved = []
+    last_id = None
+
+    while True:
+        # Keyset walk, so documents left unresolved aren't fetched again
+        query = {'location': None}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        batch = list(
+            db.properties.find(query, {'map_url': 1, 'address': 1, 'name': 1})
+            .sort('_id', 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+        last_id = batch[-1]['_id']
+
+        updates = []
+        for doc in batch:
+            found = locate(doc, gazetteer)
+            if found is None:
+                unresolved.append(doc.get('name') or str(doc['_id']))
+                continue
+            lat, lng, source = found
+            counts[source] += 1
+            # Bump updated_at and version like an API edit, so synced clients pick it up
+            updates.append(UpdateOne(
+                {'_id': doc['_id'], 'location': None},
+                {'$set': {'location': point(lat, lng), 'updated_at': timestamp()}, '$inc': {'version': 1}}
+            ))
+
+        if updates and not dry_run:
+            db.properties.bulk_write(updates, ordered=False)
+
+    action = 'Would set' if dry_run else 'Set'
+    print(f"{action} {sum(counts.values())} locations "
+          f"({counts['map_url']} from map URLs, {counts['area']} by area, {counts['city']} by city)")
+    if unresolved:
+        print(f"No location found for {len(unresolved)} properties (e.g. {unresolved[:5]})")
+    return counts, unresolved
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill GeoJSON locations on properties')
+    parser.add_argument('--gazetteer', default=DEFAULT_GAZETTEER, help='CSV of city, area, lat, lng')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+    args = parser.parse_args()
+
+    backfill_locations(args.gazetteer, args.batch_size, args.dry_run)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+End-to-end HTTP benchmark for the API, with regression baselines.
+
+Boots app.py on a local port (in this process, on Werkzeug's threaded server),
+seeds it with `seed_data.py --scale`, then drives each scenario below with
+concurrent clients and reports throughput and p50/p95/p99 latency. With
+`--url` it targets a server that is already running and seeded instead.
+
+Results are compared with a stored baseline: a scenario regresses when its p95
+grows, or its throughput drops, by more than `--tolerance`, or when more than
+1% of its requests fail. Any regression makes the script exit with status 1.
+Baselines are machine-specific; record one with `--update-baseline` on the
+machine that runs the comparison.
+
+Usage:
+    python benchmarks/bench_http.py [--backend memory|mongo] [--scale 10] [--concurrency 16]
+                                    [--requests 1000] [--repeat 3] [--scenario properties.list ...]
+                                    [--baseline PATH] [--update-baseline] [--tolerance 0.25]
+    python benchmarks/bench_http.py --url http://localhost:5000 --no-baseline
+
+The mongo backend seeds the database named by MONGODB_URI, which clears it first.
+"""
+
+import argparse
+import http.cookiejar
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from itertools import count
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+LOGIN = {'email': 'harshit@havelhousing.com', 'password': '12345678'}
+SEARCH_TERMS = ['Jaipur', 'Tonk', 'Jagatpura', 'Sikar', 'Vaishali', 'Enclave', 'VRB', 'Park']
+MAX_ERROR_RATE = 0.01
+
+class Client:
+    """One simulated user: a cookie jar (session) and an opener"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def login(self):
+        status, _ = self.request('POST', '/api/auth/login', LOGIN)
+        if status != 200:
+            raise RuntimeError(f'Benchmark login failed with HTTP {status}; is the database seeded?')
+
+def new_booking(ctx, rng):
+    serial = next(ctx['serial'])
+    return 'POST', '/api/booking/', {
+        'property_id': rng.choice(ctx['property_ids']),
+        # Far above any real plot number, so benchmark bookings never collide
+        'plot_number': 1000000 + serial,
+        'amount': 500000,
+        'client_name': 'Benchmark Client',
+        'client_phone': '9000000000',
+        'client_aadhar': f'bench-{ctx["run_id"]}-{serial}',
+        'cash_payment': 100000,
+        'employee_id': rng.choice(ctx['employee_ids'])
+    }
+
+# Scenario name -> (needs login, share of --requests, request factory(context, rng, n))
+SCENARIOS = {
+    'auth.login': (False, 0.05, lambda ctx, rng, n: ('POST', '/api/auth/login', LOGIN)),
+    'properties.list': (False, 1, lambda ctx, rng, n: (
+        'GET', f'/api/properties/?page={rng.randint(1, ctx["property_pages"])}&limit=10', None)),
+    'properties.search': (False, 1, lambda ctx, rng, n: (
+        'GET', f'/api/properties/?search={rng.choice(SEARCH_TERMS)}&limit=10', None)),
+    'properties.detail': (False, 1, lambda ctx, rng, n: (
+        'GET', f'/api/properties/{rng.choice(ctx["property_ids"])}', None)),
+    'booking.list': (True, 1, lambda ctx, rng, n: (
+        'GET', f'/api/booking/?page={rng.randint(1, 20)}&limit=20', None)),
+    'booking.clients': (True, 1, lambda ctx, rng, n: (
+        'GET', f'/api/booking/clients?page={rng.randint(1, 20)}&limit=20', None)),
+    'employees.list': (True, 1, lambda ctx, rng, n: ('GET', '/api/employees/', None)),
+    # Writes run last so the read scenarios always see the freshly seeded data
+    'booking.create': (True, 0.5, lambda ctx, rng, n: new_booking(ctx, rng))
+}
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def run_scenario(base_url, name, context, total, concurrency, seed):
+    needs_login, _, make_request = SCENARIOS[name]
+    clients = [Client(base_url) for _ in range(concurrency)]
+    if needs_login:
+        for client in clients:
+            client.login()
+
+    sequence = count()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = clients[index]
+        local_latencies = []
+        local_errors = 0
+        while True:
+            n = next(sequence)
+            if n >= total:
+                break
+            method, path, body = make_request(context, rng, n)
+            started = time.perf_counter()
+            try:
+                status, _ = client.request(method, path, body)
+            except Exception:
+                status = None
+            local_latencies.append(time.perf_counter() - started)
+            if status is None or status >= 400:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+def boot_server(backend, scale, seed):
+    """Seed the selected backend and serve app.py on a free local port"""
+    os.environ['DATA_BACKEND'] = backend
+
+    from werkzeug.serving import make_server, WSGIRequestHandler
+    from app import app
+    from seed_data import seed_database
+
+    seed_database(scale=scale, seed=seed)
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+def build_context(base_url):
+    client = Client(base_url)
+    status, body = client.request('GET', '/api/properties/?limit=100')
+    if status != 200:
+        raise RuntimeError(f'Could not list properties (HTTP {status})')
+    listing = json.loads(body)
+    property_ids = [p['_id'] for p in listing['properties']]
+    if not property_ids:
+        raise RuntimeError('No properties to benchmark against; seed the database first')
+    client.login()
+    status, body = client.request('GET', '/api/employees/?limit=100')
+    if status != 200:
+        raise RuntimeError(f'Could not list employees (HTTP {status})')
+    employee_ids = [e['_id'] for e in json.loads(body)['employees']]
+    if not employee_ids:
+        raise RuntimeError('No employees to credit benchmark bookings to; seed the database first')
+    return {
+        'property_ids': property_ids,
+        'employee_ids': employee_ids,
+        'property_pages': max(1, listing['pagination']['total_count'] // 10),
+        # Unique across runs and repeats, for documents the benchmark creates
+        'run_id': f'{time.time():.0f}',
+        'serial': count()
+    }
+
+def compare(results, baseline, tolerance):
+    """Human-readable regressions of `results` against `baseline`"""
+    regressions = []
+    for name, result in results.items():
+        if result['requests'] and result['errors'] / result['requests'] > MAX_ERROR_RATE:
+            regressions.append(f"{name}: {result['errors']} of {result['requests']} requests failed")
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        if result['p95_ms'] > expected['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']} ms vs baseline {expected['p95_ms']} ms")
+        if result['throughput_rps'] < expected['throughput_rps'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: {result['throughput_rps']} req/s vs baseline {expected['throughput_rps']} req/s"
+            )
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='HTTP benchmark with regression baselines')
+    parser.add_argument('--backend', choices=['memory', 'mongo'], default='memory')
+    parser.add_argument('--url', help='Benchmark an already running, seeded server instead of booting one')
+    parser.add_argument('--scale', type=int, default=10, help='seed_data.py --scale for the booted server')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=1000, help='Requests per scenario (before its share)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per scenario; the median run is reported')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help='Run only these scenarios')
+    parser.add_argument('--baseline', help='Baseline JSON (default: benchmarks/baselines/http-<backend>-s<scale>.json)')
+    parser.add_argument('--update-baseline', action='store_true', help='Store these results as the new baseline')
+    parser.add_argument('--no-baseline', action='store_true', help="Report only, don't compare")
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95/throughput change (0.25 = 25%%)')
+    parser.add_argument('--output', help='Also write the results as JSON here')
+    args = parser.parse_args()
+
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        _, base_url = boot_server(args.backend, args.scale, args.seed)
+
+    context = build_context(base_url)
+    results = {}
+    print(f"{'scenario':<20} {'requests':>8} {'errors':>6} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name in args.scenario or SCENARIOS:
+        total = max(args.concurrency, int(args.requests * SCENARIOS[name][1]))
+        # Unrecorded warm-up run, then the median of --repeat runs by throughput to damp noise
+        run_scenario(base_url, name, context, max(args.concurrency, total // 10), args.concurrency, args.seed)
+        runs = sorted(
+            (run_scenario(base_url, name, context, total, args.concurrency, args.seed + i) for i in range(args.repeat)),
+            key=lambda run: run['throughput_rps']
+        )
+        result = results[name] = runs[len(runs) // 2]
+        print(f"{name:<20} {result['requests']:>8} {result['errors']:>6} {result['throughput_rps']:>9} "
+              f"{result['p50_ms']:>8} {result['p95_ms']:>8} {result['p99_ms']:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    baseline_path = args.baseline or os.path.join(BENCH_DIR, 'baselines', f'http-{args.backend}-s{args.scale}.json')
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+        print(f"Baseline written to {baseline_path}")
+        return 0
+
+    baseline = {}
+    if not args.no_baseline:
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+        else:
+            print(f"No baseline at {baseline_path}; run with --update-baseline to record one")
+
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: time and memory to convert 10k property documents into models.
+
+Compares the slotted models in models.py against the previous dict-backed
+classes (reproduced below) and against keeping the raw documents.
+
+Usage:
+    python benchmarks/bench_models.py [--count 10000] [--repeat 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import Property
+
+class DictProperty:
+    """The dict-backed Property class models.py used before __slots__"""
+
+    def __init__(self, name, rera_number, address, specification, rate, total_plots, description, map_url, _id=None):
+        self._id = _id or ObjectId()
+        self.name = name
+        self.rera_number = rera_number
+        self.address = address
+        self.specification = specification
+        self.rate = rate
+        self.total_plots = total_plots
+        self.description = description
+        self.map_url = map_url
+
+    @staticmethod
+    def from_dict(data):
+        return DictProperty(
+            _id=data.get('_id'),
+            name=data['name'],
+            rera_number=data['rera_number'],
+            address=data['address'],
+            specification=data['specification'],
+            rate=data['rate'],
+            total_plots=data['total_plots'],
+            description=data['description'],
+            map_url=data['map_url']
+        )
+
+def make_documents(count):
+    return [
+        {
+            '_id': ObjectId(),
+            'name': f'Property {i}',
+            'rera_number': f'RAJ2025BENCH{i:06d}',
+            'address': {'city': 'Jaipur', 'area': f'Area {i % 50}'},
+            'specification': 'Benchmark Layout',
+            'rate': 2500 + i % 1000,
+            'total_plots': 50 + i % 100,
+            'description': 'Synthetic property used for benchmarking',
+            'map_url': ''
+        }
+        for i in range(count)
+    ]
+
+def measure(label, convert, documents, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        convert(documents)
+        timings.append(time.perf_counter() - start)
+
+    # Memory retained by the converted objects (documents themselves excluded)
+    tracemalloc.start()
+    result = convert(documents)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    best = min(timings)
+    print(f"{label:<28} {best * 1000:9.2f} ms {best / len(documents) * 1e6:8.2f} us/doc "
+          f"{retained / 1024:10.1f} KiB retained {peak / 1024:10.1f} KiB peak")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark model conversion')
+    parser.add_argument('--count', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    documents = make_documents(args.count)
+    print(f"Converting {args.count} property documents (best of {args.repeat})")
+
+    measure('raw dicts (list copy)', list, documents, args.repeat)
+    measure('dict-backed from_dict', lambda docs: [DictProperty.from_dict(d) for d in docs], documents, args.repeat)
+    measure('slotted from_dict', lambda docs: [Property.from_dict(d) for d in docs], documents, args.repeat)
+    measure('slotted from_documents', Property.from_documents, documents, args.repeat)
+    measure('slotted to_dict', lambda docs: [p.to_dict() for p in docs], Property.from_documents(documents), args.repeat)
+
+if __name__ == '__main__':
+    main()
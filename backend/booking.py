@@ -1,11 +1,57 @@
 from flask import Blueprint, request, jsonify, session
 from database import get_database
-from models import Booking, Client
+from models import (Booking, Client, ValidationError, BOOKING_REQUEST_SCHEMA, BOOKING_STATUS_SCHEMA,
+                    BOOKING_TRANSITIONS, PAYMENT_REQUEST_SCHEMA)
+from outbox import enqueue, enqueue_many, booking_payload
+from pubsub import publish_plot_change
+from ids import decode_id, encode_id
+from pymongo import ReturnDocument, UpdateMany
 from bson import ObjectId
-from datetime import datetime
+from multiget import parse_id_list, invalid_ids, fetch_by_ids
+from cache import property_cache
+from resilience import insert_with_retry
+from idempotency import idempotent
+from holds import scheduler as hold_scheduler
+from payments import opening_entries, record_payment
+import archive
+from datetime import datetime, timezone
 
 booking_bp = Blueprint('booking', __name__)
 
+# Referenced documents that `expand` can join onto bookings, with the fields returned
+EXPANSIONS = {
+    'client': ('client_id', 'clients', {'name': 1, 'phone_number': 1, 'status': 1, 'payment': 1}),
+    'property': ('property_id', 'properties', {'name': 1, 'rera_number': 1, 'address': 1, 'rate': 1})
+}
+
+# Booking fields status changes need for their side effects
+STATUS_PROJECTION = {'property_id': 1, 'plot_number': 1, 'amount': 1, 'status': 1, 'saled_by': 1}
+
+# Bookings one bulk status update may change
+MAX_STATUS_BATCH_IDS = 500
+
+def expand_bookings(db, bookings, expand):
+    """Attach referenced documents using one $in query per referenced collection"""
+    for name in expand:
+        field, collection_name, projection = EXPANSIONS[name]
+        ids = list({b[field] for b in bookings if decode_id(b.get(field)) is not None})
+        
+        if collection_name == 'properties':
+            # Full property documents are cached, so reuse them instead of projecting
+            documents, _ = fetch_by_ids(db.properties, ids, cache=property_cache)
+            documents = [
+                {k: v for k, v in doc.items() if k == '_id' or k in projection}
+                for doc in documents
+            ]
+        else:
+            # Completed clients may have been archived
+            documents, _ = archive.fetch_by_ids(db, collection_name, ids, projection=projection)
+        
+        by_id = {doc['_id']: doc for doc in documents}
+        for booking in bookings:
+            booking[name] = by_id.get(booking.get(field))
+    return bookings
+
 @booking_bp.route('/', methods=['GET'])
 def get_bookings():
     try:
@@ -17,12 +63,20 @@ def get_bookings():
             }), 401
         
         db = get_database()
-        bookings_collection = db.bookings
         
         # Get query parameters
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 10))
         status = request.args.get('status', '')
+        expand = [e.strip() for e in request.args.get('expand', '').split(',') if e.strip()]
+        archived = archive.include_archived(request.args)
+        
+        unknown = [e for e in expand if e not in EXPANSIONS]
+        if unknown:
+            return jsonify({
+                'success': False,
+                'error': f"Cannot expand {', '.join(unknown)} (allowed: {', '.join(EXPANSIONS)})"
+            }), 400
         
         # Build query
         query = {}
@@ -33,15 +87,16 @@ def get_bookings():
         skip = (page - 1) * limit
         
         # Get bookings with pagination
-        bookings_cursor = bookings_collection.find(query).skip(skip).limit(limit).sort('booking_date', -1)
-        bookings = []
+        bookings = archive.page(db, 'bookings', query, skip, limit, sort=('booking_date', -1), archived=archived)
+        
+        for booking_data in bookings:
+            booking_data['_id'] = encode_id(booking_data['_id'])
         
-        for booking_data in bookings_cursor:
-            booking_data['_id'] = str(booking_data['_id'])
-            bookings.append(booking_data)
+        if expand:
+            expand_bookings(db, bookings, expand)
         
         # Get total count
-        total_count = bookings_collection.count_documents(query)
+        total_count = archive.count(db, 'bookings', query, archived)
         
         return jsonify({
             'success': True,
@@ -62,6 +117,7 @@ def get_bookings():
         }), 500
 
 @booking_bp.route('/', methods=['POST'])
+@idempotent
 def create_booking():
     try:
         user_id = session.get('user_id')
@@ -71,16 +127,14 @@ def create_booking():
                 'error': 'Authentication required'
             }), 401
         
-        data = request.get_json()
-        
         # Validate required fields
-        required_fields = ['property_id', 'plot_number', 'amount', 'client_name', 'client_phone', 'client_aadhar']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'error': f'{field} is required'
-                }), 400
+        try:
+            data = BOOKING_REQUEST_SCHEMA.validate(request.get_json())
+        except ValidationError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
         db = get_database()
         clients_collection = db.clients
@@ -88,13 +142,14 @@ def create_booking():
         properties_collection = db.properties
         
         # Validate property exists
-        if not ObjectId.is_valid(data['property_id']):
+        property_object_id = decode_id(data['property_id'])
+        if property_object_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid property ID'
             }), 400
         
-        property_data = properties_collection.find_one({'_id': ObjectId(data['property_id'])})
+        property_data = properties_collection.find_one({'_id': property_object_id})
         if not property_data:
             return jsonify({
                 'success': False,
@@ -114,8 +169,26 @@ def create_booking():
                 'error': 'Plot is already booked'
             }), 409
         
+        # Sales are credited to the employee who made them, if one is given
+        saled_by = None
+        if data.get('employee_id'):
+            employee_object_id = decode_id(data['employee_id'])
+            if employee_object_id is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid employee ID'
+                }), 400
+            
+            if not db.employees.find_one({'_id': employee_object_id}, {'_id': 1}):
+                return jsonify({
+                    'success': False,
+                    'error': 'Employee not found'
+                }), 404
+            saled_by = encode_id(employee_object_id)
+        
         # Create or find client
         client_data = clients_collection.find_one({'aadhar_number': data['client_aadhar']})
+        new_client = None
         
         if not client_data:
             # Create new client
@@ -126,19 +199,30 @@ def create_booking():
                 project_id=data['property_id'],
                 plot_number=data['plot_number'],
                 payment={
-                    'cash': data.get('cash_payment', 0),
-                    'cheque': data.get('cheque_payment', 0),
+                    'cash': data['cash_payment'],
+                    'cheque': data['cheque_payment'],
                     'total': data['amount'],
-                    'remaining': data['amount'] - data.get('cash_payment', 0) - data.get('cheque_payment', 0)
+                    'remaining': data['amount'] - data['cash_payment'] - data['cheque_payment']
                 },
                 status='ongoing',
-                saled_by=user_id
+                saled_by=saled_by
             )
             
-            client_result = clients_collection.insert_one(client_obj.to_dict())
-            client_id = str(client_result.inserted_id)
+            new_client = client_obj.to_dict()
+            # The payment taken with the booking opens the client's ledger, written
+            # first so a crash can only leave the balance behind, never the ledger
+            payments = opening_entries(new_client, 'booking', paid_at=datetime.utcnow(), recorded_by=user_id)
+            for payment in payments:
+                insert_with_retry(db.payments, payment)
+            try:
+                # The _id is ours, so a retry after a dropped connection can't duplicate the client
+                client_id = encode_id(insert_with_retry(clients_collection, new_client))
+            except Exception:
+                if payments:
+                    db.payments.delete_many({'_id': {'$in': [payment['_id'] for payment in payments]}})
+                raise
         else:
-            client_id = str(client_data['_id'])
+            client_id = encode_id(client_data['_id'])
         
         # Create booking
         booking_obj = Booking(
@@ -147,14 +231,30 @@ def create_booking():
             plot_number=data['plot_number'],
             booking_date=datetime.utcnow(),
             status='pending',
-            amount=data['amount']
+            amount=data['amount'],
+            saled_by=saled_by
         )
         
-        result = bookings_collection.insert_one(booking_obj.to_dict())
+        booking_doc = booking_obj.to_dict()
+        booking_id = encode_id(insert_with_retry(bookings_collection, booking_doc))
+        hold_scheduler.schedule(booking_doc['_id'], booking_doc['booking_date'])
+        
+        # Counters are applied by the outbox worker. They can always be rebuilt,
+        # so a failure here must not fail the booking
+        try:
+            enqueue(db, 'booking.created', {
+                'booking': booking_payload(booking_id, booking_doc),
+                'total_plots': property_data.get('total_plots'),
+                'client_payment': new_client['payment'] if new_client else None
+            })
+        except Exception as e:
+            print(f"Failed to queue side effects for booking {booking_id}: {e}")
+        
+        publish_plot_change(data['property_id'], data['plot_number'], 'pending', booking_id)
         
         return jsonify({
             'success': True,
-            'booking_id': str(result.inserted_id),
+            'booking_id': booking_id,
             'client_id': client_id,
             'message': 'Booking created successfully'
         }), 201
@@ -165,6 +265,47 @@ def create_booking():
             'error': 'An error occurred while creating booking'
         }), 500
 
+@booking_bp.route('/batch', methods=['GET', 'POST'])
+def get_bookings_batch():
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required'
+            }), 401
+        
+        try:
+            ids = parse_id_list(request)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        invalid = invalid_ids(ids)
+        if invalid:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid booking ID',
+                'invalid_ids': invalid
+            }), 400
+        
+        db = get_database()
+        bookings, missing = archive.fetch_by_ids(db, 'bookings', ids)
+        
+        return jsonify({
+            'success': True,
+            'bookings': bookings,
+            'missing_ids': missing
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching bookings'
+        }), 500
+
 @booking_bp.route('/<booking_id>', methods=['GET'])
 def get_booking(booking_id):
     try:
@@ -175,17 +316,17 @@ def get_booking(booking_id):
                 'error': 'Authentication required'
             }), 401
         
-        # Validate ObjectId
-        if not ObjectId.is_valid(booking_id):
+        # Decode and validate ID
+        object_id = decode_id(booking_id)
+        if object_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid booking ID'
             }), 400
         
         db = get_database()
-        bookings_collection = db.bookings
         
-        booking_data = bookings_collection.find_one({'_id': ObjectId(booking_id)})
+        booking_data = archive.find_one(db, 'bookings', {'_id': object_id})
         
         if not booking_data:
             return jsonify({
@@ -193,7 +334,7 @@ def get_booking(booking_id):
                 'error': 'Booking not found'
             }), 404
         
-        booking_data['_id'] = str(booking_data['_id'])
+        booking_data['_id'] = encode_id(booking_data['_id'])
         
         return jsonify({
             'success': True,
@@ -216,47 +357,184 @@ def update_booking_status(booking_id):
                 'error': 'Authentication required'
             }), 401
         
-        # Validate ObjectId
-        if not ObjectId.is_valid(booking_id):
+        # Decode and validate ID
+        object_id = decode_id(booking_id)
+        if object_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid booking ID'
             }), 400
         
-        data = request.get_json()
-        new_status = data.get('status')
-        
-        if not new_status or new_status not in ['pending', 'confirmed', 'cancelled']:
+        try:
+            new_status = BOOKING_STATUS_SCHEMA.validate(request.get_json())['status']
+        except ValidationError as e:
             return jsonify({
                 'success': False,
-                'error': 'Valid status is required (pending, confirmed, cancelled)'
+                'error': f'Valid status is required (pending, confirmed, cancelled): {e}'
             }), 400
         
         db = get_database()
         bookings_collection = db.bookings
         
-        result = bookings_collection.update_one(
-            {'_id': ObjectId(booking_id)},
-            {'$set': {'status': new_status}}
+        # Fetch the previous status in the same round trip as the update, which
+        # only applies from a status allowed to move to the new one
+        allowed = [new_status] + [old for old, targets in BOOKING_TRANSITIONS.items() if new_status in targets]
+        previous = bookings_collection.find_one_and_update(
+            {'_id': object_id, 'status': {'$in': allowed}},
+            {'$set': {'status': new_status}},
+            projection=STATUS_PROJECTION,
+            return_document=ReturnDocument.BEFORE
         )
         
-        if result.modified_count > 0:
-            return jsonify({
-                'success': True,
-                'message': f'Booking status updated to {new_status}'
-            })
-        else:
+        if not previous:
+            current = bookings_collection.find_one({'_id': object_id}, {'status': 1})
+            if current:
+                return jsonify({
+                    'success': False,
+                    'error': f"Cannot move a {current.get('status')} booking to {new_status}"
+                }), 409
             return jsonify({
                 'success': False,
                 'error': 'Booking not found'
             }), 404
         
+        if previous.get('status') != new_status:
+            try:
+                enqueue(db, 'booking.status_changed', {
+                    'booking': booking_payload(booking_id, previous),
+                    'old_status': previous.get('status'),
+                    'new_status': new_status
+                })
+            except Exception as e:
+                print(f"Failed to queue side effects for booking {booking_id}: {e}")
+            publish_plot_change(previous.get('property_id'), previous.get('plot_number'), new_status, booking_id)
+        
+        return jsonify({
+            'success': True,
+            'message': f'Booking status updated to {new_status}'
+        })
+        
     except Exception as e:
         return jsonify({
             'success': False,
             'error': 'An error occurred while updating booking status'
         }), 500
 
+@booking_bp.route('/batch/status', methods=['PUT'])
+def update_booking_statuses():
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required'
+            }), 401
+
+        try:
+            ids = parse_id_list(request, max_ids=MAX_STATUS_BATCH_IDS)
+            new_status = BOOKING_STATUS_SCHEMA.validate(request.get_json(silent=True))['status']
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
+        db = get_database()
+        bookings_collection = db.bookings
+
+        # Outcome per requested ID, filled in as each one is decided
+        results = {booking_id: {'booking_id': booking_id} for booking_id in ids}
+        object_ids = {booking_id: decode_id(booking_id) for booking_id in ids}
+        for booking_id, object_id in object_ids.items():
+            if object_id is None:
+                results[booking_id].update(outcome='invalid', error='Invalid booking ID')
+
+        current = {
+            encode_id(booking['_id']): booking
+            for booking in bookings_collection.find(
+                {'_id': {'$in': [i for i in object_ids.values() if i is not None]}}, STATUS_PROJECTION
+            )
+        }
+
+        # Bookings to move, grouped by the status they were read with
+        by_status = {}
+        for booking_id, result in results.items():
+            if 'outcome' in result:
+                continue
+            booking = current.get(booking_id)
+            if booking is None:
+                result.update(outcome='not_found', error='Booking not found')
+                continue
+            old_status = booking.get('status')
+            result['old_status'] = old_status
+            if old_status == new_status:
+                result['outcome'] = 'unchanged'
+            elif new_status not in BOOKING_TRANSITIONS.get(old_status, ()):
+                result.update(outcome='invalid_transition', error=f'Cannot move a {old_status} booking to {new_status}')
+            else:
+                by_status.setdefault(old_status, []).append(object_ids[booking_id])
+
+        updated = []
+        if by_status:
+            # Only bookings still in the status they were read with move; the
+            # batch id tells which those were
+            batch = ObjectId()
+            bookings_collection.bulk_write([
+                UpdateMany(
+                    {'_id': {'$in': status_ids}, 'status': old_status},
+                    {'$set': {'status': new_status, 'status_batch': batch}}
+                )
+                for old_status, status_ids in by_status.items()
+            ], ordered=False)
+            sent_ids = [object_id for status_ids in by_status.values() for object_id in status_ids]
+            moved_ids = [
+                booking['_id']
+                for booking in bookings_collection.find({'_id': {'$in': sent_ids}, 'status_batch': batch}, {'_id': 1})
+            ]
+            if moved_ids:
+                bookings_collection.update_many(
+                    {'_id': {'$in': moved_ids}, 'status_batch': batch},
+                    {'$unset': {'status_batch': ''}}
+                )
+            moved = {encode_id(object_id) for object_id in moved_ids}
+            for booking_id, result in results.items():
+                if 'outcome' in result:
+                    continue
+                if booking_id in moved:
+                    result['outcome'] = 'updated'
+                    updated.append(booking_id)
+                else:
+                    result.update(outcome='conflict', error='Booking status changed meanwhile; retry it')
+
+        if updated:
+            try:
+                enqueue_many(db, [
+                    ('booking.status_changed', {
+                        'booking': booking_payload(booking_id, current[booking_id]),
+                        'old_status': current[booking_id].get('status'),
+                        'new_status': new_status
+                    })
+                    for booking_id in updated
+                ])
+            except Exception as e:
+                print(f"Failed to queue side effects for {len(updated)} bookings: {e}")
+            for booking_id in updated:
+                booking = current[booking_id]
+                publish_plot_change(booking.get('property_id'), booking.get('plot_number'), new_status, booking_id)
+
+        return jsonify({
+            'success': True,
+            'status': new_status,
+            'updated_count': len(updated),
+            'results': list(results.values())
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while updating booking statuses'
+        }), 500
+
 @booking_bp.route('/clients', methods=['GET'])
 def get_clients():
     try:
@@ -268,12 +546,12 @@ def get_clients():
             }), 401
         
         db = get_database()
-        clients_collection = db.clients
         
         # Get query parameters
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 10))
         search = request.args.get('search', '')
+        archived = archive.include_archived(request.args)
         
         # Build query
         query = {}
@@ -290,15 +568,13 @@ def get_clients():
         skip = (page - 1) * limit
         
         # Get clients with pagination
-        clients_cursor = clients_collection.find(query).skip(skip).limit(limit)
-        clients = []
+        clients = archive.page(db, 'clients', query, skip, limit, archived=archived)
         
-        for client_data in clients_cursor:
-            client_data['_id'] = str(client_data['_id'])
-            clients.append(client_data)
+        for client_data in clients:
+            client_data['_id'] = encode_id(client_data['_id'])
         
         # Get total count
-        total_count = clients_collection.count_documents(query)
+        total_count = archive.count(db, 'clients', query, archived)
         
         return jsonify({
             'success': True,
@@ -316,4 +592,173 @@ def get_clients():
         return jsonify({
             'success': False,
             'error': 'An error occurred while fetching clients'
-        }), 500
\ No newline at end of file
+        }), 500
+
+@booking_bp.route('/clients/batch', methods=['GET', 'POST'])
+def get_clients_batch():
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required'
+            }), 401
+        
+        try:
+            ids = parse_id_list(request)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        invalid = invalid_ids(ids)
+        if invalid:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid client ID',
+                'invalid_ids': invalid
+            }), 400
+        
+        db = get_database()
+        clients, missing = archive.fetch_by_ids(db, 'clients', ids)
+        
+        return jsonify({
+            'success': True,
+            'clients': clients,
+            'missing_ids': missing
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching clients'
+        }), 500
+
+def _parse_paid_at(value):
+    """Naive UTC datetime from an ISO 8601 string, as the ledger stores them"""
+    try:
+        paid_at = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValidationError('paid_at must be an ISO 8601 date or datetime')
+    if paid_at.tzinfo is not None:
+        paid_at = paid_at.astimezone(timezone.utc).replace(tzinfo=None)
+    return paid_at
+
+@booking_bp.route('/clients/<client_id>/payments', methods=['POST'])
+@idempotent
+def create_payment(client_id):
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required'
+            }), 401
+        
+        object_id = decode_id(client_id)
+        if object_id is None:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid client ID'
+            }), 400
+        
+        try:
+            data = PAYMENT_REQUEST_SCHEMA.validate(request.get_json())
+            if data['amount'] <= 0:
+                raise ValidationError('amount must be positive')
+            paid_at = _parse_paid_at(data['paid_at']) if data.get('paid_at') else None
+            if paid_at and paid_at > datetime.utcnow():
+                raise ValidationError('paid_at cannot be in the future')
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        db = get_database()
+        client_data = db.clients.find_one({'_id': object_id}, {'project_id': 1})
+        if not client_data:
+            return jsonify({
+                'success': False,
+                'error': 'Client not found'
+            }), 404
+        
+        recorded = record_payment(db, client_data, data['amount'], data['method'], paid_at=paid_at,
+                                  reference=data['reference'], recorded_by=user_id)
+        if recorded is None:
+            return jsonify({
+                'success': False,
+                'error': 'Payment exceeds the remaining balance'
+            }), 409
+        
+        payment, balance, status = recorded
+        return jsonify({
+            'success': True,
+            'payment_id': encode_id(payment['_id']),
+            'balance': balance,
+            'client_status': status,
+            'message': 'Payment recorded successfully'
+        }), 201
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while recording payment'
+        }), 500
+
+@booking_bp.route('/clients/<client_id>/payments', methods=['GET'])
+def get_payments(client_id):
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required'
+            }), 401
+        
+        object_id = decode_id(client_id)
+        if object_id is None:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid client ID'
+            }), 400
+        
+        db = get_database()
+        client_data = archive.find_one(db, 'clients', {'_id': object_id}, {'payment': 1})
+        if not client_data:
+            return jsonify({
+                'success': False,
+                'error': 'Client not found'
+            }), 404
+        
+        page = int(request.args.get('page', 1))
+        limit = int(request.args.get('limit', 10))
+        skip = (page - 1) * limit
+        
+        # Newest first, straight off the (client_id, paid_at) index
+        query = {'client_id': encode_id(object_id)}
+        payments = list(db.payments.find(query).sort('paid_at', -1).skip(skip).limit(limit))
+        for payment in payments:
+            payment['_id'] = encode_id(payment['_id'])
+        
+        total_count = db.payments.count_documents(query)
+        
+        return jsonify({
+            'success': True,
+            'payments': payments,
+            'balance': client_data.get('payment'),
+            'pagination': {
+                'current_page': page,
+                'total_pages': (total_count + limit - 1) // limit,
+                'total_count': total_count,
+                'has_next': skip + limit < total_count,
+                'has_prev': page > 1
+            }
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching payments'
+        }), 500
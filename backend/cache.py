@@ -0,0 +1,120 @@
+"""
+Small in-process caches for hot, read-mostly documents and derived indexes.
+
+Entries expire after a TTL, which bounds staleness across workers; writes in
+this worker update or evict entries directly. Cached values are shared between
+requests and must be treated as read-only.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Thread-safe LRU cache with per-entry expiry"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def get_stale(self, key):
+        """The cached value even if it has expired, for when the source is unavailable"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[1]
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] >= now:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]
+        return found
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def set_many(self, items):
+        for key, value in items.items():
+            self.set(key, value)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class RebuiltIndex:
+    """Base for in-memory indexes derived from a collection.
+
+    Subclasses implement `rebuild(db)` and swap their new state in with a single
+    assignment. Writes in this worker call `invalidate()`; the TTL picks up
+    writes made by other workers.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._built_at = None
+        self._stale = True
+        self._rebuild_lock = threading.Lock()
+
+    def invalidate(self):
+        self._stale = True
+
+    def _needs_rebuild(self):
+        return self._stale or self._built_at is None or time.monotonic() - self._built_at > self.ttl
+
+    def rebuild(self, db):
+        raise NotImplementedError
+
+    def refresh(self, db):
+        """Rebuild if stale; only one caller rebuilds, the others use the old index"""
+        if not self._needs_rebuild():
+            return
+        if self._built_at is None:
+            self._rebuild_lock.acquire()
+        elif not self._rebuild_lock.acquire(blocking=False):
+            return
+        try:
+            if self._needs_rebuild():
+                self._stale = False
+                try:
+                    self.rebuild(db)
+                except Exception:
+                    self._stale = True
+                    raise
+                self._built_at = time.monotonic()
+        finally:
+            self._rebuild_lock.release()
+
+# Property documents keyed by encoded ID, as returned by the API
+property_cache = TTLCache(
+    maxsize=int(os.getenv('PROPERTY_CACHE_SIZE', 1024)),
+    ttl=float(os.getenv('PROPERTY_CACHE_TTL', 60))
+)
@@ -0,0 +1,142 @@
+"""
+Incremental change feed for the property catalogue.
+
+Every write in properties.py stamps `updated_at`, and deletes leave a tombstone
+in `property_tombstones`. A sync token is an opaque cursor over those two
+streams, ordered by (timestamp, _id) so pages never skip or repeat documents
+that share a timestamp.
+
+A sync without a token starts with a full pass over the catalogue by `_id`,
+which also covers documents written before `updated_at` existed. It then
+switches to the delta streams from the moment the full pass began.
+
+`updated_at` is stamped before the write commits, so a write can become
+visible after later-stamped ones the cursor has already passed. Both phases
+therefore only trust timestamps older than PROPERTY_SYNC_LAG_SECONDS (by
+default the longest a request may run), which such writes are committed by.
+"""
+
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from deadlines import MAX_DEADLINE_MS
+from ids import decode_id, encode_id
+
+TOMBSTONE_RETENTION_DAYS = int(os.getenv('PROPERTY_TOMBSTONE_DAYS', 30))
+SAFETY_LAG = timedelta(seconds=float(os.getenv('PROPERTY_SYNC_LAG_SECONDS', MAX_DEADLINE_MS / 1000)))
+
+MIN_OBJECT_ID = ObjectId('0' * 24)
+EPOCH = datetime(1970, 1, 1)
+
+class TokenExpired(Exception):
+    """The token predates the tombstone retention window"""
+
+def timestamp():
+    """Current UTC time truncated to milliseconds, the precision MongoDB stores"""
+    now = datetime.utcnow()
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+def _to_ms(value):
+    return int((value - EPOCH).total_seconds() * 1000)
+
+def _from_ms(value):
+    return EPOCH + timedelta(milliseconds=value)
+
+def encode_token(state):
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_token(token):
+    """Parse a sync token. Raises ValueError if it is malformed"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError('Invalid sync token')
+    required = {'full': ('since', 'after'), 'delta': ('u', 'd', 'at')}
+    if not isinstance(state, dict) or state.get('phase') not in required:
+        raise ValueError('Invalid sync token')
+    if any(key not in state for key in required[state['phase']]):
+        raise ValueError('Invalid sync token')
+    return state
+
+def _after(field, position, until):
+    """Keyset filter for documents after (timestamp, _id) and stamped no later than `until`"""
+    ms, last_id = position
+    moment = _from_ms(ms)
+    return {'$and': [
+        {'$or': [
+            {field: {'$gt': moment}},
+            {field: moment, '_id': {'$gt': decode_id(last_id) or MIN_OBJECT_ID}}
+        ]},
+        {field: {'$lte': until}}
+    ]}
+
+def _full_pass(db, state, limit):
+    after = decode_id(state.get('after')) or MIN_OBJECT_ID
+    documents = list(db.properties.find({'_id': {'$gt': after}}).sort('_id', 1).limit(limit + 1))
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+
+    if has_more:
+        next_state = {'phase': 'full', 'since': state['since'], 'after': encode_id(documents[-1]['_id'])}
+    else:
+        since = [state['since'], '']
+        next_state = {'phase': 'delta', 'u': since, 'd': since, 'at': state['since']}
+    return documents, [], next_state, has_more
+
+def _delta(db, state, limit):
+    # Tombstones older than the retention window may already be gone
+    now = timestamp()
+    if state['at'] < _to_ms(now - timedelta(days=TOMBSTONE_RETENTION_DAYS)):
+        raise TokenExpired()
+
+    # Writes stamped after this may not have committed yet
+    until = now - SAFETY_LAG
+    documents = list(
+        db.properties.find(_after('updated_at', state['u'], until))
+        .sort([('updated_at', 1), ('_id', 1)]).limit(limit + 1)
+    )
+    tombstones = list(
+        db.property_tombstones.find(_after('deleted_at', state['d'], until))
+        .sort([('deleted_at', 1), ('_id', 1)]).limit(limit + 1)
+    )
+    has_more = len(documents) > limit or len(tombstones) > limit
+    documents = documents[:limit]
+    tombstones = tombstones[:limit]
+
+    next_state = dict(state, at=_to_ms(now))
+    if documents:
+        next_state['u'] = [_to_ms(documents[-1]['updated_at']), encode_id(documents[-1]['_id'])]
+    if tombstones:
+        next_state['d'] = [_to_ms(tombstones[-1]['deleted_at']), encode_id(tombstones[-1]['_id'])]
+    return documents, tombstones, next_state, has_more
+
+def read_changes(db, token=None, limit=500):
+    """Properties upserted and deleted since `token`.
+
+    Returns (documents, deleted_ids, next_token, has_more).
+    """
+    if token:
+        state = decode_token(token)
+    else:
+        # The deltas start far enough back to catch writes in flight during the full pass
+        state = {'phase': 'full', 'since': _to_ms(timestamp() - SAFETY_LAG), 'after': None}
+
+    if state['phase'] == 'full':
+        documents, tombstones, next_state, has_more = _full_pass(db, state, limit)
+    else:
+        documents, tombstones, next_state, has_more = _delta(db, state, limit)
+
+    deleted_ids = [encode_id(t['_id']) for t in tombstones]
+    return documents, deleted_ids, encode_token(next_state), has_more
+
+def record_tombstone(db, property_id):
+    db.property_tombstones.replace_one(
+        {'_id': property_id},
+        {'deleted_at': timestamp()},
+        upsert=True
+    )
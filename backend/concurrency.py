@@ -0,0 +1,30 @@
+"""
+Optimistic concurrency helpers.
+
+Editable documents carry an integer `version` that every update increments
+atomically. Clients send the version they last read in `If-Match`; the update
+filter includes it, so a concurrent edit makes the update match nothing and
+the route answers 412 instead of silently overwriting the other change.
+"""
+
+def parse_if_match(header):
+    """Version from an If-Match header, None if absent or '*'.
+
+    Raises ValueError for anything that isn't a version ETag.
+    """
+    if not header or header.strip() == '*':
+        return None
+    value = header.strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    return int(value.strip('"'))
+
+def version_filter(version):
+    # Documents written before versioning have no field; they count as version 0
+    if version == 0:
+        return {'version': {'$in': [None, 0]}}
+    return {'version': version}
+
+def set_version_etag(response, document):
+    response.set_etag(str(document.get('version', 0)))
+    return response
@@ -1,9 +1,82 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, GEOSPHERE
 from dotenv import load_dotenv
 import os
+import random
+import threading
+import time
+
+from deadlines import DeadlineDatabase, MAX_DEADLINE_MS
 
 load_dotenv()
 
+# Data backend: 'mongo' (default) or 'memory' (served from the bundled JSON files)
+DATA_BACKEND = os.getenv('DATA_BACKEND', 'mongo')
+MEMORY_DATA_DIR = os.getenv('MEMORY_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data'))
+
+# Secondary indexes, shared by the MongoDB and in-memory backends
+INDEXES = {
+    'users': [
+        ([('email', ASCENDING)], {'unique': True})
+    ],
+    'properties': [
+        ([('rera_number', ASCENDING)], {'unique': True}),
+        # Also serves city-only filters and rate ranges within a city
+        ([('address.city', ASCENDING), ('rate', ASCENDING)], {}),
+        ([('address.area', ASCENDING)], {}),
+        ([('rate', ASCENDING)], {}),
+        ([('total_plots', ASCENDING)], {}),
+        ([('location', GEOSPHERE)], {}),
+        ([('updated_at', ASCENDING), ('_id', ASCENDING)], {})
+    ],
+    'property_tombstones': [
+        ([('deleted_at', ASCENDING), ('_id', ASCENDING)], {}),
+        ([('deleted_at', ASCENDING)], {'expireAfterSeconds': int(os.getenv('PROPERTY_TOMBSTONE_DAYS', 30)) * 86400})
+    ],
+    'employees': [
+        ([('rera_number', ASCENDING)], {'unique': True})
+    ],
+    'clients': [
+        ([('aadhar_number', ASCENDING)], {'unique': True}),
+        # Outstanding dues, largest first, overall and per property (which also
+        # serves plain project_id lookups)
+        ([('payment.remaining', DESCENDING)], {}),
+        ([('project_id', ASCENDING), ('payment.remaining', DESCENDING)], {}),
+        # Finds completed clients old enough to archive
+        ([('status', ASCENDING), ('_id', ASCENDING)], {})
+    ],
+    'bookings': [
+        ([('property_id', ASCENDING), ('plot_number', ASCENDING), ('status', ASCENDING)], {}),
+        ([('booking_date', DESCENDING)], {}),
+        ([('status', ASCENDING), ('booking_date', DESCENDING)], {}),
+        # An employee's pending bookings (their ongoing work)
+        ([('saled_by', ASCENDING), ('status', ASCENDING)], {})
+    ],
+    'bookings_archive': [
+        ([('booking_date', DESCENDING)], {}),
+        ([('status', ASCENDING), ('booking_date', DESCENDING)], {})
+    ],
+    'payments': [
+        ([('client_id', ASCENDING), ('paid_at', DESCENDING)], {}),
+        ([('paid_at', DESCENDING)], {})
+    ],
+    'idempotency_keys': [
+        ([('created_at', ASCENDING)], {'expireAfterSeconds': int(os.getenv('IDEMPOTENCY_KEY_HOURS', 24)) * 3600})
+    ],
+    'outbox': [
+        ([('status', ASCENDING), ('available_at', ASCENDING)], {}),
+        ([('status', ASCENDING), ('locked_until', ASCENDING)], {}),
+        ([('lease', ASCENDING)], {})
+    ]
+}
+
+def ensure_indexes(db):
+    for collection_name, indexes in INDEXES.items():
+        for keys, options in indexes:
+            try:
+                db[collection_name].create_index(keys, **options)
+            except Exception as e:
+                print(f"Failed to create index {keys} on {collection_name}: {e}")
+
 class Database:
     _instance = None
     _client = None
@@ -19,25 +92,54 @@ class Database:
             self.connect()
 
     def connect(self):
+        mongodb_uri = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/haveli_housing')
+        # Request deadlines set maxTimeMS per query; the socket timeout is the
+        # backstop when the server or network stops responding altogether.
+        # Retryable reads and writes let the driver resend an operation once
+        # across a failover; resilience.py handles longer outages.
+        self._client = MongoClient(
+            mongodb_uri,
+            socketTimeoutMS=int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', MAX_DEADLINE_MS + 2000)),
+            connectTimeoutMS=int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+            serverSelectionTimeoutMS=int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+            retryWrites=True,
+            retryReads=True
+        )
+
+        # Extract database name from URI or use default
+        if '/' in mongodb_uri:
+            db_name = mongodb_uri.split('/')[-1]
+        else:
+            db_name = 'haveli_housing'
+
+        self._db = self._client[db_name]
+
+        # Test connection. The client reconnects on its own, so an unreachable
+        # server doesn't stop the app from starting: requests fail fast through
+        # the circuit breaker until it is back, and indexes are created then.
         try:
-            mongodb_uri = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/haveli_housing')
-            self._client = MongoClient(mongodb_uri)
-            
-            # Extract database name from URI or use default
-            if '/' in mongodb_uri:
-                db_name = mongodb_uri.split('/')[-1]
-            else:
-                db_name = 'haveli_housing'
-            
-            self._db = self._client[db_name]
-            
-            # Test connection
             self._client.admin.command('ping')
-            print(f"Successfully connected to MongoDB database: {db_name}")
-            
         except Exception as e:
-            print(f"Failed to connect to MongoDB: {e}")
-            raise
+            print(f"Failed to connect to MongoDB: {e}; retrying in the background")
+            threading.Thread(target=self._await_connection, args=(db_name,), daemon=True).start()
+            return
+        self._connected(db_name)
+
+    def _connected(self, db_name):
+        print(f"Successfully connected to MongoDB database: {db_name}")
+        ensure_indexes(self._db)
+
+    def _await_connection(self, db_name):
+        delay = 1
+        while True:
+            time.sleep(random.uniform(delay / 2, delay))
+            try:
+                self._client.admin.command('ping')
+            except Exception:
+                delay = min(delay * 2, 60)
+                continue
+            self._connected(db_name)
+            return
 
     def get_db(self):
         if self._db is None:
@@ -48,8 +150,38 @@ class Database:
         if self._client:
             self._client.close()
 
-# Global database instance
-db_instance = Database()
+class MemoryStore:
+    """In-memory backend loaded from the bundled JSON files"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            from memory_db import load_json_database
+
+            cls._instance = super(MemoryStore, cls).__new__(cls)
+            cls._instance._db = load_json_database(MEMORY_DATA_DIR)
+            ensure_indexes(cls._instance._db)
+            print(f"Serving data from in-memory store loaded from {MEMORY_DATA_DIR}")
+        return cls._instance
+
+    def get_db(self):
+        return self._db
+
+    def close(self):
+        pass
+
+# Global database instance, created on first use
+db_instance = None
+_db_proxy = None
+_instance_lock = threading.Lock()
 
 def get_database():
-    return db_instance.get_db()
\ No newline at end of file
+    """The database, with the current request's deadline applied to its queries"""
+    global db_instance, _db_proxy
+    if _db_proxy is None:
+        with _instance_lock:
+            if db_instance is None:
+                db_instance = MemoryStore() if DATA_BACKEND == 'memory' else Database()
+            if _db_proxy is None:
+                _db_proxy = DeadlineDatabase(db_instance.get_db())
+    return _db_proxy
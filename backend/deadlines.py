@@ -0,0 +1,199 @@
+"""
+Per-request deadlines, applied to every MongoDB query the request makes.
+
+Each request gets a deadline when it arrives: the route's budget from
+ROUTE_DEADLINES_MS (or REQUEST_DEADLINE_MS), lowered or raised by an
+`X-Request-Timeout` header in milliseconds up to MAX_REQUEST_DEADLINE_MS.
+`get_database()` hands out a proxy that passes the time left to each find,
+count, distinct, aggregate and find-and-modify as `maxTimeMS`, so the server
+abandons a query the client has stopped waiting for. The MongoDB client's
+socket timeout is the backstop for the network itself.
+
+A query that runs out of time marks the request, and app.py turns the
+resulting error into a 504. The proxy also runs every call through
+resilience.py, which retries idempotent reads and trips the circuit breaker
+when the database is down. Outside a request (scripts, background threads)
+it passes calls straight through.
+"""
+
+import functools
+import os
+import time
+
+from flask import g, has_request_context
+from pymongo.collection import Collection
+from pymongo.errors import ConnectionFailure, ExecutionTimeout, NetworkTimeout
+
+import resilience
+from memory_db import MemoryCollection
+
+DEFAULT_DEADLINE_MS = int(os.getenv('REQUEST_DEADLINE_MS', 5000))
+MAX_DEADLINE_MS = int(os.getenv('MAX_REQUEST_DEADLINE_MS', 30000))
+DEADLINE_HEADER = 'X-Request-Timeout'
+
+# Endpoint or blueprint -> budget in milliseconds
+ROUTE_DEADLINES_MS = {
+    'properties.get_properties': 2000,
+    'properties.suggest_properties': 500,
+    'properties.get_properties_near': 1000,
+    'properties.get_property': 1000,
+    'booking.get_bookings': 3000,
+    'booking.get_clients': 2000,
+    'reports': 10000
+}
+
+class DeadlineExceeded(Exception):
+    """The request's deadline passed before a query could be issued"""
+
+def budget_ms(endpoint, header=None):
+    endpoint = endpoint or ''
+    budget = ROUTE_DEADLINES_MS.get(endpoint, ROUTE_DEADLINES_MS.get(endpoint.split('.', 1)[0], DEFAULT_DEADLINE_MS))
+    if header:
+        try:
+            budget = int(header)
+        except ValueError:
+            pass
+    return max(1, min(budget, MAX_DEADLINE_MS))
+
+def start(endpoint, header=None):
+    g.deadline = time.monotonic() + budget_ms(endpoint, header) / 1000
+
+def exceeded():
+    return has_request_context() and g.get('deadline_exceeded', False)
+
+def _mark_exceeded():
+    g.deadline_exceeded = True
+
+def remaining_ms():
+    """Milliseconds left for this request, or None outside a request.
+
+    Raises DeadlineExceeded once the deadline has passed.
+    """
+    if not has_request_context():
+        return None
+    deadline = g.get('deadline')
+    if deadline is None:
+        return None
+    remaining = int((deadline - time.monotonic()) * 1000)
+    if remaining <= 0:
+        _mark_exceeded()
+        raise DeadlineExceeded()
+    return remaining
+
+class DeadlineCursor:
+    """Cursor wrapper that records timeouts raised while iterating.
+
+    Fetching the first batch of a find is an idempotent read, so it goes
+    through the circuit breaker and is retried from the start on a dropped
+    connection. Later batches aren't retried: documents were already handed out.
+    """
+
+    def __init__(self, cursor, retryable=False):
+        self._cursor = cursor
+        self._retryable = retryable
+        self._started = False
+
+    def __iter__(self):
+        return self
+
+    def _first(self):
+        try:
+            return next(self._cursor)
+        except ConnectionFailure:
+            self._cursor.rewind()
+            raise
+
+    def __next__(self):
+        try:
+            if self._started:
+                return next(self._cursor)
+            self._started = True
+            if not self._retryable:
+                return next(self._cursor)
+            return resilience.call(self._first, idempotent=True, remaining_ms=remaining_ms)
+        except (ExecutionTimeout, NetworkTimeout):
+            _mark_exceeded()
+            raise
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if name in ('sort', 'skip', 'limit', 'batch_size', 'hint', 'max_time_ms'):
+            @functools.wraps(attr)
+            def chain(*args, **kwargs):
+                attr(*args, **kwargs)
+                return self
+            return chain
+        return attr
+
+# Read methods -> name of their time limit argument
+_TIMED_METHODS = {
+    'find_one': 'max_time_ms',
+    'count_documents': 'maxTimeMS',
+    'distinct': 'maxTimeMS',
+    'aggregate': 'maxTimeMS',
+    'find_one_and_update': 'maxTimeMS',
+    'find_one_and_replace': 'maxTimeMS',
+    'find_one_and_delete': 'maxTimeMS'
+}
+
+# Safe to send again after a dropped connection
+_IDEMPOTENT_METHODS = {'find_one', 'count_documents', 'distinct', 'aggregate'}
+
+# Go through the circuit breaker, but are never retried here
+_WRITE_METHODS = {
+    'insert_one', 'insert_many', 'update_one', 'update_many', 'replace_one',
+    'delete_one', 'delete_many', 'bulk_write'
+}
+
+class DeadlineCollection:
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if name == 'find':
+            return functools.partial(self._find, attr)
+        if name in _TIMED_METHODS or name in _WRITE_METHODS:
+            return functools.partial(self._call, attr, name)
+        return attr
+
+    def _find(self, find, *args, **kwargs):
+        if not has_request_context():
+            return find(*args, **kwargs)
+        remaining = remaining_ms()
+        cursor = find(*args, **kwargs)
+        if remaining is not None:
+            cursor = cursor.max_time_ms(remaining)
+        return DeadlineCursor(cursor, retryable=True)
+
+    def _call(self, method, name, *args, **kwargs):
+        if not has_request_context():
+            return method(*args, **kwargs)
+        remaining = remaining_ms()
+        if remaining is not None and name in _TIMED_METHODS:
+            kwargs.setdefault(_TIMED_METHODS[name], remaining)
+        try:
+            result = resilience.call(
+                lambda: method(*args, **kwargs),
+                idempotent=name in _IDEMPOTENT_METHODS,
+                remaining_ms=remaining_ms
+            )
+        except (ExecutionTimeout, NetworkTimeout):
+            _mark_exceeded()
+            raise
+        return DeadlineCursor(result) if name == 'aggregate' else result
+
+class DeadlineDatabase:
+    """Database proxy whose collections apply the current request's deadline"""
+
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        attr = getattr(self._db, name)
+        if isinstance(attr, (Collection, MemoryCollection)):
+            return DeadlineCollection(attr)
+        return attr
+
+    def __getitem__(self, name):
+        return DeadlineCollection(self._db[name])
@@ -1,10 +1,34 @@
 from flask import Blueprint, request, jsonify, session
 from database import get_database
-from models import Employee
-from bson import ObjectId
+from models import Employee, ValidationError
+from ids import decode_id, encode_id
+from concurrency import parse_if_match, version_filter, set_version_etag
+from pymongo import ReturnDocument
+from multiget import parse_id_list, invalid_ids, fetch_by_ids
 
 employees_bp = Blueprint('employees', __name__)
 
+# Hides the outbox bookkeeping kept on employee documents, and the
+# ongoing_work arrays stored before it was derived from bookings
+EMPLOYEE_PROJECTION = {'outbox_applied': 0, 'ongoing_work': 0}
+
+def attach_ongoing_work(db, employees):
+    """Set each employee's `ongoing_work` from their pending bookings, in one query"""
+    pending = {employee['_id']: [] for employee in employees}
+    if pending:
+        for booking in db.bookings.find(
+            {'saled_by': {'$in': list(pending)}, 'status': 'pending'},
+            {'saled_by': 1, 'client_id': 1, 'property_id': 1, 'plot_number': 1}
+        ):
+            pending[booking['saled_by']].append({
+                'client_id': booking.get('client_id'),
+                'project_id': booking.get('property_id'),
+                'plot_number': booking.get('plot_number')
+            })
+    for employee in employees:
+        employee['ongoing_work'] = pending[employee['_id']]
+    return employees
+
 @employees_bp.route('/', methods=['GET'])
 def get_employees():
     try:
@@ -38,12 +62,13 @@ def get_employees():
         skip = (page - 1) * limit
         
         # Get employees with pagination
-        employees_cursor = employees_collection.find(query).skip(skip).limit(limit)
+        employees_cursor = employees_collection.find(query, EMPLOYEE_PROJECTION).skip(skip).limit(limit)
         employees = []
         
         for emp_data in employees_cursor:
-            emp_data['_id'] = str(emp_data['_id'])
+            emp_data['_id'] = encode_id(emp_data['_id'])
             employees.append(emp_data)
+        attach_ongoing_work(db, employees)
         
         # Get total count
         total_count = employees_collection.count_documents(query)
@@ -66,6 +91,48 @@ def get_employees():
             'error': 'An error occurred while fetching employees'
         }), 500
 
+@employees_bp.route('/batch', methods=['GET', 'POST'])
+def get_employees_batch():
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required'
+            }), 401
+        
+        try:
+            ids = parse_id_list(request)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        invalid = invalid_ids(ids)
+        if invalid:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid employee ID',
+                'invalid_ids': invalid
+            }), 400
+        
+        db = get_database()
+        employees, missing = fetch_by_ids(db.employees, ids, projection=EMPLOYEE_PROJECTION)
+        attach_ongoing_work(db, employees)
+        
+        return jsonify({
+            'success': True,
+            'employees': employees,
+            'missing_ids': missing
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching employees'
+        }), 500
+
 @employees_bp.route('/<employee_id>', methods=['GET'])
 def get_employee(employee_id):
     try:
@@ -76,8 +143,9 @@ def get_employee(employee_id):
                 'error': 'Authentication required'
             }), 401
         
-        # Validate ObjectId
-        if not ObjectId.is_valid(employee_id):
+        # Decode and validate ID
+        object_id = decode_id(employee_id)
+        if object_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid employee ID'
@@ -86,7 +154,7 @@ def get_employee(employee_id):
         db = get_database()
         employees_collection = db.employees
         
-        employee_data = employees_collection.find_one({'_id': ObjectId(employee_id)})
+        employee_data = employees_collection.find_one({'_id': object_id}, EMPLOYEE_PROJECTION)
         
         if not employee_data:
             return jsonify({
@@ -94,12 +162,14 @@ def get_employee(employee_id):
                 'error': 'Employee not found'
             }), 404
         
-        employee_data['_id'] = str(employee_data['_id'])
+        employee_data['_id'] = encode_id(employee_data['_id'])
+        attach_ongoing_work(db, [employee_data])
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'employee': employee_data
         })
+        return set_version_etag(response, employee_data)
     
     except Exception as e:
         return jsonify({
@@ -117,8 +187,9 @@ def get_employee_performance(employee_id):
                 'error': 'Authentication required'
             }), 401
         
-        # Validate ObjectId
-        if not ObjectId.is_valid(employee_id):
+        # Decode and validate ID
+        object_id = decode_id(employee_id)
+        if object_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid employee ID'
@@ -127,7 +198,7 @@ def get_employee_performance(employee_id):
         db = get_database()
         employees_collection = db.employees
         
-        employee_data = employees_collection.find_one({'_id': ObjectId(employee_id)})
+        employee_data = employees_collection.find_one({'_id': object_id}, {'total_sales': 1})
         
         if not employee_data:
             return jsonify({
@@ -138,7 +209,7 @@ def get_employee_performance(employee_id):
         # Calculate performance metrics
         performance_data = {
             'total_sales': employee_data.get('total_sales', 0),
-            'ongoing_projects': len(employee_data.get('ongoing_work', [])),
+            'ongoing_projects': db.bookings.count_documents({'saled_by': encode_id(object_id), 'status': 'pending'}),
             'completion_rate': 85.5,  # Mock data for demonstration
             'customer_rating': 4.7,   # Mock data for demonstration
             'monthly_target': 10,     # Mock data for demonstration
@@ -166,16 +237,14 @@ def create_employee():
                 'error': 'Authentication required'
             }), 401
         
-        data = request.get_json()
-        
         # Validate required fields
-        required_fields = ['name', 'aadhar_number', 'account_number', 'rera_number', 'superior_name']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'error': f'{field} is required'
-                }), 400
+        try:
+            data = Employee.schema.validate(request.get_json())
+        except ValidationError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
         db = get_database()
         employees_collection = db.employees
@@ -188,22 +257,13 @@ def create_employee():
             }), 409
         
         # Create employee
-        employee_obj = Employee(
-            name=data['name'],
-            aadhar_number=data['aadhar_number'],
-            account_number=data['account_number'],
-            rera_number=data['rera_number'],
-            total_sales=data.get('total_sales', 0),
-            superior_name=data['superior_name'],
-            photo_url=data.get('photo_url', ''),
-            ongoing_work=data.get('ongoing_work', [])
-        )
+        employee_obj = Employee(**data)
         
         result = employees_collection.insert_one(employee_obj.to_dict())
         
         return jsonify({
             'success': True,
-            'employee_id': str(result.inserted_id),
+            'employee_id': encode_id(result.inserted_id),
             'message': 'Employee created successfully'
         }), 201
         
@@ -223,43 +283,71 @@ def update_employee(employee_id):
                 'error': 'Authentication required'
             }), 401
         
-        # Validate ObjectId
-        if not ObjectId.is_valid(employee_id):
+        # Decode and validate ID
+        object_id = decode_id(employee_id)
+        if object_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid employee ID'
             }), 400
         
-        data = request.get_json()
+        try:
+            update_data = Employee.schema.validate(request.get_json(), partial=True)
+        except ValidationError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        try:
+            expected_version = parse_if_match(request.headers.get('If-Match'))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'If-Match must be a version ETag'
+            }), 400
+        
+        if not update_data:
+            return jsonify({
+                'success': False,
+                'error': 'No valid fields to update'
+            }), 400
         
         db = get_database()
         employees_collection = db.employees
         
-        # Check if employee exists
-        if not employees_collection.find_one({'_id': ObjectId(employee_id)}):
+        # Update and fetch in one round trip; If-Match turns it into a compare-and-set
+        query = {'_id': object_id}
+        if expected_version is not None:
+            query.update(version_filter(expected_version))
+        
+        employee_data = employees_collection.find_one_and_update(
+            query,
+            {'$set': update_data, '$inc': {'version': 1}},
+            projection=EMPLOYEE_PROJECTION,
+            return_document=ReturnDocument.AFTER
+        )
+        
+        if not employee_data:
+            if expected_version is not None and employees_collection.count_documents({'_id': object_id}, limit=1):
+                return jsonify({
+                    'success': False,
+                    'error': 'Employee was modified by another request'
+                }), 412
             return jsonify({
                 'success': False,
                 'error': 'Employee not found'
             }), 404
         
-        # Update employee
-        update_data = {k: v for k, v in data.items() if k != '_id'}
+        employee_data['_id'] = encode_id(employee_data['_id'])
+        attach_ongoing_work(db, [employee_data])
         
-        result = employees_collection.update_one(
-            {'_id': ObjectId(employee_id)},
-            {'$set': update_data}
-        )
-        
-        if result.modified_count > 0:
-            return jsonify({
-                'success': True,
-                'message': 'Employee updated successfully'
-            })
-        else:
-            return jsonify({
-                'success': True,
-                'message': 'No changes made to employee'
-            })
+        response = jsonify({
+            'success': True,
+            'employee': employee_data,
+            'message': 'Employee updated successfully'
+        })
+        return set_version_etag(response, employee_data)
         
     except Exception as e:
         return jsonify({
@@ -0,0 +1,142 @@
+"""
+Structured filters and facet counts for the property list.
+
+`parse_filters` turns query parameters into equality/range conditions on
+indexed fields. Facet counts (properties per city and area, and the rate and
+total_plots ranges) come from one `$facet` stage alongside the page of results.
+
+Counts for the whole catalogue, shown when no filter is applied, are kept in
+memory: property writes in this worker update them incrementally, and they are
+recomputed every FACET_CACHE_TTL seconds to pick up other workers' writes.
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+
+FACET_CACHE_TTL = float(os.getenv('FACET_CACHE_TTL', 60))
+
+# Query parameter -> (field, kind)
+FILTERS = {
+    'city': ('address.city', 'in'),
+    'area': ('address.area', 'in'),
+    'min_rate': ('rate', '$gte'),
+    'max_rate': ('rate', '$lte'),
+    'min_plots': ('total_plots', '$gte'),
+    'max_plots': ('total_plots', '$lte')
+}
+
+TERM_FACETS = {'city': 'address.city', 'area': 'address.area'}
+RANGE_FACETS = {'rate': 'rate', 'total_plots': 'total_plots'}
+
+def parse_filters(args):
+    """MongoDB conditions for the filter parameters in `args`.
+
+    `city` and `area` accept comma-separated values. Raises ValueError for
+    ranges that aren't numbers.
+    """
+    query = {}
+    for param, (field, kind) in FILTERS.items():
+        raw = args.get(param, '').strip()
+        if not raw:
+            continue
+        if kind == 'in':
+            values = [v.strip() for v in raw.split(',') if v.strip()]
+            query[field] = values[0] if len(values) == 1 else {'$in': values}
+        else:
+            try:
+                value = float(raw)
+            except ValueError:
+                raise ValueError(f'{param} must be a number')
+            query.setdefault(field, {})[kind] = value
+    return query
+
+def facet_stage(skip, limit):
+    """`$facet` returning a page of results, the total and every facet"""
+    stage = {
+        'results': [{'$skip': skip}, {'$limit': limit}],
+        'total': [{'$count': 'count'}]
+    }
+    for name, field in TERM_FACETS.items():
+        stage[name] = [{'$sortByCount': f'${field}'}]
+    for name, field in RANGE_FACETS.items():
+        stage[name] = [{'$group': {'_id': None, 'min': {'$min': f'${field}'}, 'max': {'$max': f'${field}'}}}]
+    return {'$facet': stage}
+
+def format_facets(result):
+    facets = {}
+    for name in TERM_FACETS:
+        facets[name] = [{'value': row['_id'], 'count': row['count']} for row in result[name] if row['_id'] is not None]
+    for name in RANGE_FACETS:
+        row = result[name][0] if result[name] else {}
+        facets[name] = {'min': row.get('min'), 'max': row.get('max')}
+    return facets
+
+def _facet_values(document):
+    address = document.get('address') or {}
+    values = {'city': address.get('city'), 'area': address.get('area')}
+    for name, field in RANGE_FACETS.items():
+        values[name] = document.get(field)
+    return values
+
+class FacetCounts:
+    """Facet counts for the unfiltered catalogue"""
+
+    def __init__(self, ttl=FACET_CACHE_TTL):
+        self.ttl = ttl
+        self._counters = None
+        self._loaded_at = None
+        self._writes = 0
+        self._stale = False
+        self._lock = threading.Lock()
+
+    def refresh(self, db):
+        if self._counters is not None and not self._stale and time.monotonic() - self._loaded_at <= self.ttl:
+            return
+        writes = self._writes
+        # Counting every value (not just min/max) lets deletes be applied incrementally
+        counters = {name: Counter() for name in list(TERM_FACETS) + list(RANGE_FACETS)}
+        pipeline = [{'$facet': {
+            name: [{'$sortByCount': f'${field}'}]
+            for name, field in list(TERM_FACETS.items()) + list(RANGE_FACETS.items())
+        }}]
+        result = next(db.properties.aggregate(pipeline))
+        for name, rows in result.items():
+            for row in rows:
+                if row['_id'] is not None:
+                    counters[name][row['_id']] = row['count']
+        with self._lock:
+            self._counters = counters
+            self._loaded_at = time.monotonic()
+            # Writes during the aggregation may or may not be in it; recount next time
+            self._stale = self._writes != writes
+
+    def apply(self, old=None, new=None):
+        """Move a property's facet values from `old` to `new` (None for create/delete)"""
+        with self._lock:
+            self._writes += 1
+            if self._counters is None:
+                return
+            for document, sign in ((old, -1), (new, 1)):
+                if not document:
+                    continue
+                for name, value in _facet_values(document).items():
+                    if value is not None:
+                        counter = self._counters[name]
+                        counter[value] += sign
+                        if counter[value] <= 0:
+                            del counter[value]
+
+    def snapshot(self):
+        with self._lock:
+            counters = self._counters
+            facets = {}
+            for name in TERM_FACETS:
+                facets[name] = [{'value': v, 'count': c} for v, c in counters[name].most_common()]
+            for name in RANGE_FACETS:
+                values = counters[name]
+                facets[name] = {'min': min(values) if values else None, 'max': max(values) if values else None}
+            return facets
+
+catalogue_facets = FacetCounts()
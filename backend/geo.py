@@ -0,0 +1,126 @@
+"""
+Geospatial search for properties.
+
+Property locations are GeoJSON Points (`[lng, lat]`) with a 2dsphere index,
+and MongoDB answers "near" queries with `$geoNear`. The in-memory data backend
+has no geo operators, so it uses `GridIndex` instead: properties bucketed into
+fixed-size lat/lng cells, where a query only measures distances to properties
+in the cells overlapping its radius.
+"""
+
+import heapq
+import math
+import os
+import re
+from urllib.parse import urlparse, parse_qs
+
+from cache import RebuiltIndex
+from ids import encode_id
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 100
+GRID_CELL_DEGREES = 0.1
+GRID_INDEX_TTL = float(os.getenv('GEO_INDEX_TTL', 60))
+
+def point(lat, lng):
+    return {'type': 'Point', 'coordinates': [lng, lat]}
+
+def is_point(value):
+    """True for a GeoJSON Point with valid longitude and latitude"""
+    if not isinstance(value, dict) or value.get('type') != 'Point':
+        return False
+    coordinates = value.get('coordinates')
+    if not isinstance(coordinates, list) or len(coordinates) != 2:
+        return False
+    if any(isinstance(c, bool) or not isinstance(c, (int, float)) for c in coordinates):
+        return False
+    lng, lat = coordinates
+    return -180 <= lng <= 180 and -90 <= lat <= 90
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1, math.sqrt(a)))
+
+_COORDINATES = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+def coordinates_from_map_url(url):
+    """(lat, lng) from a Google Maps URL that embeds them, else None.
+
+    Handles `@lat,lng,zoom` paths and `q=`, `ll=` or `query=` parameters that
+    hold coordinates. Place-name queries need a gazetteer instead.
+    """
+    if not url:
+        return None
+    parsed = urlparse(url)
+    candidates = []
+    at = parsed.path.split('@', 1)
+    if len(at) == 2:
+        candidates.append(','.join(at[1].split(',')[:2]))
+    params = parse_qs(parsed.query)
+    for name in ('q', 'll', 'query'):
+        candidates.extend(params.get(name, []))
+
+    for candidate in candidates:
+        match = _COORDINATES.match(candidate)
+        if match:
+            lat, lng = float(match.group(1)), float(match.group(2))
+            if -90 <= lat <= 90 and -180 <= lng <= 180:
+                return lat, lng
+    return None
+
+def near_pipeline(lat, lng, radius_km, limit):
+    return [
+        {'$geoNear': {
+            'near': point(lat, lng),
+            'distanceField': 'distance',
+            'maxDistance': radius_km * 1000,
+            'spherical': True
+        }},
+        {'$limit': limit}
+    ]
+
+class GridIndex(RebuiltIndex):
+    """Property locations bucketed into GRID_CELL_DEGREES cells"""
+
+    def __init__(self, ttl=GRID_INDEX_TTL, cell_degrees=GRID_CELL_DEGREES):
+        super().__init__(ttl)
+        self.cell_degrees = cell_degrees
+        self._cells = {}
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_degrees)), int(math.floor(lng / self.cell_degrees))
+
+    def rebuild(self, db):
+        cells = {}
+        for doc in db.properties.find({'location': {'$exists': True}}, {'location': 1}):
+            if not is_point(doc['location']):
+                continue
+            lng, lat = doc['location']['coordinates']
+            cells.setdefault(self._cell(lat, lng), []).append((lat, lng, encode_id(doc['_id'])))
+        self._cells = cells
+
+    def search(self, lat, lng, radius_km, limit):
+        """[(property_id, distance_km)] within `radius_km`, nearest first"""
+        cells = self._cells
+        lat_span = radius_km / KM_PER_DEGREE
+        # Longitude degrees shrink towards the poles
+        lng_span = min(180, radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6)))
+
+        low_lat, low_lng = self._cell(max(lat - lat_span, -90), lng - lng_span)
+        high_lat, high_lng = self._cell(min(lat + lat_span, 90), lng + lng_span)
+
+        matches = []
+        for cell_lat in range(low_lat, high_lat + 1):
+            for cell_lng in range(low_lng, high_lng + 1):
+                for entry_lat, entry_lng, property_id in cells.get((cell_lat, cell_lng), ()):
+                    distance = distance_km(lat, lng, entry_lat, entry_lng)
+                    if distance <= radius_km:
+                        matches.append((distance, property_id))
+        return [(property_id, distance) for distance, property_id in heapq.nsmallest(limit, matches)]
+
+grid_index = GridIndex()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Expiry of pending bookings that were never confirmed.
+
+A pending booking holds its plot for PENDING_HOLD_HOURS after `booking_date`.
+A scheduler thread in each API process cancels expired holds in batches: a
+sweep every HOLD_SWEEP_SECONDS finds them through the (status, booking_date)
+index, and between sweeps a heap of the holds expiring before the next sweep
+lets the thread wake exactly when each one is due. Only that window is kept
+in memory, however many bookings are pending.
+
+Cancelling is conditional on the booking still being pending and expired, so
+several processes can sweep at once. Each cancelled booking gets an outbox
+entry for its counters and a plot event for live availability streams.
+
+Usage:
+    python holds.py    # run one sweep and exit (e.g. from cron with HOLD_SCHEDULER=off)
+"""
+
+import heapq
+import os
+import threading
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from database import get_database
+from ids import encode_id
+from metrics import metrics
+from outbox import enqueue_many, booking_payload
+from pubsub import publish_plot_change
+
+HOLD_HOURS = float(os.getenv('PENDING_HOLD_HOURS', 72))
+SWEEP_SECONDS = float(os.getenv('HOLD_SWEEP_SECONDS', 300))
+BATCH_SIZE = int(os.getenv('HOLD_BATCH_SIZE', 500))
+SCHEDULER_MODE = os.getenv('HOLD_SCHEDULER', 'thread')
+
+_PROJECTION = {'property_id': 1, 'plot_number': 1, 'amount': 1, 'status': 1, 'saled_by': 1}
+
+def hold_period():
+    return timedelta(hours=HOLD_HOURS)
+
+def expire_bookings(db, booking_ids, cutoff):
+    """Cancel those of `booking_ids` still pending from before `cutoff`; returns how many"""
+    if not booking_ids:
+        return 0
+    batch = ObjectId()
+    db.bookings.update_many(
+        {'_id': {'$in': booking_ids}, 'status': 'pending', 'booking_date': {'$lt': cutoff}},
+        {'$set': {'status': 'cancelled', 'cancel_reason': 'hold_expired', 'expiry_batch': batch}}
+    )
+    # The batch id tells which of them this call cancelled
+    expired = list(db.bookings.find({'_id': {'$in': booking_ids}, 'expiry_batch': batch}, _PROJECTION))
+    if not expired:
+        return 0
+    db.bookings.update_many(
+        {'_id': {'$in': [booking['_id'] for booking in expired]}, 'expiry_batch': batch},
+        {'$unset': {'expiry_batch': ''}}
+    )
+
+    try:
+        enqueue_many(db, [
+            ('booking.status_changed', {
+                'booking': booking_payload(encode_id(booking['_id']), booking),
+                'old_status': 'pending',
+                'new_status': 'cancelled'
+            })
+            for booking in expired
+        ])
+    except Exception as e:
+        print(f"Failed to queue side effects for {len(expired)} expired bookings: {e}")
+    for booking in expired:
+        publish_plot_change(booking.get('property_id'), booking.get('plot_number'), 'cancelled',
+                            encode_id(booking['_id']))
+
+    metrics.incr('holds.expired', len(expired))
+    return len(expired)
+
+def sweep(db, batch_size=BATCH_SIZE):
+    """Cancel every expired hold, oldest first, in batches; returns how many"""
+    total = 0
+    while True:
+        cutoff = datetime.utcnow() - hold_period()
+        ids = [
+            booking['_id'] for booking in db.bookings.find(
+                {'status': 'pending', 'booking_date': {'$lt': cutoff}}, {'_id': 1}
+            ).sort('booking_date', 1).limit(batch_size)
+        ]
+        total += expire_bookings(db, ids, cutoff)
+        if len(ids) < batch_size:
+            return total
+
+class HoldScheduler:
+    """Heap of (expires_at, booking_id) for holds due before the next sweep"""
+
+    def __init__(self, sweep_seconds=SWEEP_SECONDS):
+        self.sweep_seconds = sweep_seconds
+        self._heap = []
+        self._horizon = datetime.min
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+
+    def schedule(self, booking_id, booking_date):
+        """Track a new pending booking if it expires before the next sweep"""
+        expires_at = booking_date + hold_period()
+        with self._condition:
+            if expires_at > self._horizon:
+                return
+            heapq.heappush(self._heap, (expires_at, booking_id))
+            self._condition.notify()
+
+    def _load_window(self, db, now):
+        # Holds expiring before the sweep after next, so none falls between windows
+        horizon = now + timedelta(seconds=2 * self.sweep_seconds)
+        upcoming = db.bookings.find(
+            {'status': 'pending', 'booking_date': {'$gte': now - hold_period(), '$lt': horizon - hold_period()}},
+            {'booking_date': 1}
+        )
+        heap = [(booking['booking_date'] + hold_period(), booking['_id']) for booking in upcoming]
+        heapq.heapify(heap)
+        with self._condition:
+            self._heap = heap
+            self._horizon = horizon
+
+    def _due(self, now):
+        due = []
+        with self._condition:
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap)[1])
+        return due
+
+    def run(self):
+        db = get_database()
+        next_sweep = datetime.min
+        while not self._stop.is_set():
+            now = datetime.utcnow()
+            try:
+                if now >= next_sweep:
+                    sweep(db)
+                    self._load_window(db, now)
+                    next_sweep = now + timedelta(seconds=self.sweep_seconds)
+                due = self._due(now)
+                if due:
+                    expire_bookings(db, due, now - hold_period())
+            except Exception as e:
+                print(f"Hold scheduler error: {e}")
+                next_sweep = now + timedelta(seconds=self.sweep_seconds)
+
+            with self._condition:
+                wake_at = next_sweep
+                if self._heap:
+                    wake_at = min(wake_at, self._heap[0][0])
+                timeout = (wake_at - datetime.utcnow()).total_seconds()
+                if timeout > 0:
+                    self._condition.wait(timeout)
+
+    def stop(self):
+        self._stop.set()
+        with self._condition:
+            self._condition.notify()
+
+scheduler = HoldScheduler()
+_thread = None
+_thread_lock = threading.Lock()
+
+def start_scheduler():
+    """Start this process's scheduler thread once, unless HOLD_SCHEDULER=off or holds never expire"""
+    global _thread
+    if SCHEDULER_MODE == 'off' or HOLD_HOURS <= 0:
+        return
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=scheduler.run, name='hold-scheduler', daemon=True)
+            _thread.start()
+
+if __name__ == '__main__':
+    if HOLD_HOURS <= 0:
+        print("PENDING_HOLD_HOURS is 0: holds never expire")
+    else:
+        print(f"Cancelled {sweep(get_database())} expired pending bookings")
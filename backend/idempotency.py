@@ -0,0 +1,176 @@
+"""
+Idempotency keys for POST routes that clients retry.
+
+A client sends a unique `Idempotency-Key` header with a request and the same
+key on every retry of it. The first request runs and its response is stored
+in the `idempotency_keys` collection (expired by a TTL index after
+IDEMPOTENCY_KEY_HOURS) and in a per-worker cache; a retry gets the stored
+response back, marked `Idempotent-Replayed: true`, without running the route
+again. A retry that arrives while the first request is still running waits
+for it (up to IDEMPOTENCY_WAIT_SECONDS, then 409). Reusing a key with a
+different body is rejected with 422.
+
+Keys are scoped to the logged-in user and the route. Server errors (5xx) are
+not stored, so the client can retry them for real.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app, jsonify, request, session
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from cache import TTLCache
+from database import get_database
+from deadlines import MAX_DEADLINE_MS
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 5))
+POLL_SECONDS = 0.05
+# A claim older than this belongs to a request that died; it can be taken over
+LOCK_SECONDS = MAX_DEADLINE_MS / 1000 + 5
+
+# Completed responses by scoped key
+response_cache = TTLCache(
+    maxsize=int(os.getenv('IDEMPOTENCY_CACHE_SIZE', 4096)),
+    ttl=float(os.getenv('IDEMPOTENCY_CACHE_TTL', 600))
+)
+
+# Scoped key -> Event set when this worker's request for it finishes
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+def _error(message, status):
+    response = jsonify({'success': False, 'error': message})
+    response.status_code = status
+    return response
+
+def _fingerprint():
+    body = request.get_json(silent=True)
+    raw = json.dumps(body, sort_keys=True).encode() if body is not None else request.get_data()
+    return hashlib.sha256(raw).hexdigest()
+
+def _replay(stored, fingerprint):
+    if stored['fingerprint'] != fingerprint:
+        return _error(f'{HEADER} was already used for a different request', 422)
+    response = current_app.response_class(
+        stored['body'], status=stored['status_code'], mimetype=stored['mimetype']
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+def _claim(collection, key, fingerprint):
+    """None once this request owns `key`, else the existing record"""
+    now = datetime.utcnow()
+    try:
+        collection.insert_one({
+            '_id': key,
+            'fingerprint': fingerprint,
+            'state': 'in_progress',
+            'created_at': now,
+            'locked_until': now + timedelta(seconds=LOCK_SECONDS)
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+    # Take over a claim whose request never finished
+    taken = collection.find_one_and_update(
+        {'_id': key, 'state': 'in_progress', 'locked_until': {'$lt': now}},
+        {'$set': {'fingerprint': fingerprint, 'locked_until': now + timedelta(seconds=LOCK_SECONDS)}},
+        return_document=ReturnDocument.AFTER
+    )
+    if taken:
+        return None
+    return collection.find_one({'_id': key}) or {'state': 'in_progress'}
+
+def _wait_for(collection, key, event):
+    """The completed record for `key`, waiting for the request that owns it"""
+    deadline = time.monotonic() + WAIT_SECONDS
+    if event is not None:
+        # The owner is in this worker: no need to poll the database
+        event.wait(WAIT_SECONDS)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return cached
+    while True:
+        record = collection.find_one({'_id': key})
+        if record is None or record['state'] == 'done':
+            return record
+        if time.monotonic() >= deadline:
+            return record
+        time.sleep(POLL_SECONDS)
+
+def idempotent(view):
+    """Route decorator honouring the Idempotency-Key header"""
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(HEADER)
+        user_id = session.get('user_id')
+        if not key or not user_id:
+            return view(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error(f'{HEADER} must be at most {MAX_KEY_LENGTH} characters', 400)
+
+        scoped = f'{user_id}:{request.endpoint}:{key}'
+        fingerprint = _fingerprint()
+
+        cached = response_cache.get(scoped)
+        if cached is not None:
+            return _replay(cached, fingerprint)
+
+        with _in_flight_lock:
+            event = _in_flight.get(scoped)
+            owner = event is None
+            if owner:
+                event = _in_flight[scoped] = threading.Event()
+
+        collection = get_database().idempotency_keys
+        try:
+            existing = _claim(collection, scoped, fingerprint) if owner else {'state': 'in_progress'}
+            if existing is not None:
+                if existing['state'] == 'in_progress':
+                    existing = _wait_for(collection, scoped, None if owner else event)
+                if existing is None:
+                    # The other request failed and released the key
+                    return _error(f'The earlier request with this {HEADER} failed; retry it', 409)
+                if existing['state'] != 'done':
+                    response = _error(f'A request with this {HEADER} is still being processed', 409)
+                    response.headers['Retry-After'] = '1'
+                    return response
+                response_cache.set(scoped, existing)
+                return _replay(existing, fingerprint)
+
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+            except Exception:
+                collection.delete_one({'_id': scoped})
+                raise
+            if response.status_code >= 500:
+                collection.delete_one({'_id': scoped})
+                return response
+
+            stored = {
+                'fingerprint': fingerprint,
+                'state': 'done',
+                'status_code': response.status_code,
+                'body': response.get_data(as_text=True),
+                'mimetype': response.mimetype
+            }
+            collection.update_one({'_id': scoped}, {'$set': stored, '$unset': {'locked_until': ''}})
+            response_cache.set(scoped, stored)
+            return response
+        finally:
+            if owner:
+                with _in_flight_lock:
+                    _in_flight.pop(scoped, None)
+                event.set()
+
+    return wrapper
@@ -0,0 +1,37 @@
+"""
+ID codec shared by the models and blueprints.
+
+Documents are stored with native ObjectId `_id` values so lookups hit the `_id`
+index. The API exchanges IDs as 24-character hex strings; references between
+documents (`property_id`, `client_id`, `project_id`, ...) are stored encoded.
+"""
+
+from bson import ObjectId
+
+def decode_id(value):
+    """Convert an API ID to an ObjectId, or None if it isn't a valid ID"""
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return None
+
+def encode_id(value):
+    """Convert a stored ID to the string form used by the API and references"""
+    return None if value is None else str(value)
+
+def id_created_at(value):
+    """Creation time of an ObjectId ID as a naive UTC datetime, or None for other IDs"""
+    object_id = decode_id(value)
+    return None if object_id is None else object_id.generation_time.replace(tzinfo=None)
+
+def decode_ids(values):
+    """Decode many IDs, returning (decoded, invalid) lists"""
+    decoded, invalid = [], []
+    for value in values:
+        object_id = decode_id(value)
+        if object_id is None:
+            invalid.append(value)
+        else:
+            decoded.append(object_id)
+    return decoded, invalid
@@ -0,0 +1,1114 @@
+"""
+In-memory stand-in for the subset of the pymongo API used by the backend.
+
+Collections keep their documents in a dict keyed by `_id` and maintain hash
+indexes on the keys declared in `database.INDEXES`, so equality and `$in`
+lookups on those keys don't scan the collection. Used for read-only
+catalogue nodes, hermetic tests and benchmarks without a MongoDB server.
+"""
+
+import os
+import re
+import threading
+import time
+from copy import deepcopy
+from datetime import datetime, timedelta
+
+from bson import ObjectId, json_util
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from pymongo.operations import DeleteMany, DeleteOne, InsertOne, ReplaceOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+from ids import decode_id
+
+_MISSING = object()
+
+# ---------------------------------------------------------------------------
+# Document helpers
+# ---------------------------------------------------------------------------
+
+def _hashable(value):
+    if isinstance(value, dict):
+        return tuple((k, _hashable(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return tuple(_hashable(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+def _get_path(doc, path):
+    """All values at a dotted path, descending into arrays like MongoDB does"""
+    values = [doc]
+    for part in path.split('.'):
+        next_values = []
+        for value in values:
+            if isinstance(value, dict):
+                if part in value:
+                    next_values.append(value[part])
+            elif isinstance(value, list):
+                if part.isdigit():
+                    if int(part) < len(value):
+                        next_values.append(value[int(part)])
+                else:
+                    for item in value:
+                        if isinstance(item, dict) and part in item:
+                            next_values.append(item[part])
+        values = next_values
+    return values
+
+def _expand(values):
+    for value in values:
+        yield value
+        if isinstance(value, list):
+            yield from value
+
+def _field_value(doc, path, default=None):
+    """Single value at a dotted path (arrays of sub-documents are mapped)"""
+    value = doc
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list):
+            value = [item.get(part) for item in value if isinstance(item, dict) and part in item]
+        else:
+            value = _MISSING
+        if value is _MISSING:
+            return default
+    return value
+
+def _set_path(doc, path, value):
+    parts = path.split('.')
+    target = doc
+    for part in parts[:-1]:
+        if isinstance(target, list):
+            target = target[int(part)]
+            continue
+        if not isinstance(target.get(part), (dict, list)):
+            target[part] = {}
+        target = target[part]
+    if isinstance(target, list):
+        target[int(parts[-1])] = value
+    else:
+        target[parts[-1]] = value
+
+def _delete_path(doc, path):
+    parts = path.split('.')
+    target = doc
+    for part in parts[:-1]:
+        target = target.get(part) if isinstance(target, dict) else None
+        if target is None:
+            return
+    if isinstance(target, dict):
+        target.pop(parts[-1], None)
+
+def _copy_path(source, target, path):
+    head, _, rest = path.partition('.')
+    if not isinstance(source, dict) or head not in source:
+        return
+    value = source[head]
+    if not rest:
+        target[head] = deepcopy(value)
+    elif isinstance(value, dict):
+        _copy_path(value, target.setdefault(head, {}), rest)
+    elif isinstance(value, list):
+        items = [item for item in value if isinstance(item, dict)]
+        copies = target.setdefault(head, [{} for _ in items])
+        for item, copy in zip(items, copies):
+            _copy_path(item, copy, rest)
+
+def _sort_key(value):
+    if value is None or value is _MISSING:
+        return (1, 0)
+    if isinstance(value, bool):
+        return (8, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    if isinstance(value, dict):
+        return (4, repr(value))
+    if isinstance(value, list):
+        return (5, [_sort_key(v) for v in value])
+    if isinstance(value, ObjectId):
+        return (7, value.binary)
+    if isinstance(value, datetime):
+        return (9, value)
+    return (10, repr(value))
+
+def _sort_docs(docs, spec):
+    for key, direction in reversed(spec):
+        docs.sort(key=lambda d: _sort_key(_field_value(d, key)), reverse=direction < 0)
+    return docs
+
+def _normalize_sort(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction or 1)]
+    if isinstance(key_or_list, dict):
+        return list(key_or_list.items())
+    return list(key_or_list)
+
+def _project(doc, projection):
+    if not projection:
+        return deepcopy(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = {field: 1 for field in projection}
+
+    include_id = projection.get('_id', 1)
+    fields = {k: v for k, v in projection.items() if k != '_id'}
+
+    if fields and any(v not in (0, False) for v in fields.values()):
+        result = {}
+        if include_id and '_id' in doc:
+            result['_id'] = deepcopy(doc['_id'])
+        for path in fields:
+            _copy_path(doc, result, path)
+        return result
+
+    result = deepcopy(doc)
+    for path in fields:
+        _delete_path(result, path)
+    if not include_id:
+        result.pop('_id', None)
+    return result
+
+# ---------------------------------------------------------------------------
+# Query matching
+# ---------------------------------------------------------------------------
+
+_TYPE_ALIASES = {
+    'double': float, 1: float,
+    'string': str, 2: str,
+    'object': dict, 3: dict,
+    'array': list, 4: list,
+    'objectId': ObjectId, 7: ObjectId,
+    'bool': bool, 8: bool,
+    'date': datetime, 9: datetime,
+    'null': type(None), 10: type(None),
+    'int': int, 16: int,
+    'long': int, 18: int,
+    'number': (int, float)
+}
+
+def _is_operator_dict(value):
+    return isinstance(value, dict) and bool(value) and all(str(k).startswith('$') for k in value)
+
+def _equals(value, target):
+    if isinstance(target, re.Pattern):
+        return isinstance(value, str) and target.search(value) is not None
+    if isinstance(value, bool) != isinstance(target, bool):
+        return False
+    return value == target
+
+def _eq_any(values, target):
+    if target is None and not values:
+        return True
+    for value in _expand(values):
+        if _equals(value, target):
+            return True
+    return False
+
+def _compare(values, target, op):
+    for value in _expand(values):
+        if value is None or isinstance(value, list):
+            continue
+        try:
+            if op(value, target):
+                return True
+        except TypeError:
+            continue
+    return False
+
+def _regex(pattern, options=''):
+    if isinstance(pattern, re.Pattern):
+        return pattern
+    flags = 0
+    for option in options or '':
+        flags |= {'i': re.IGNORECASE, 'm': re.MULTILINE, 's': re.DOTALL, 'x': re.VERBOSE}.get(option, 0)
+    return re.compile(pattern, flags)
+
+def _match_operator(values, op, arg, condition):
+    if op == '$eq':
+        return _eq_any(values, arg)
+    if op == '$ne':
+        return not _eq_any(values, arg)
+    if op == '$in':
+        return any(_eq_any(values, target) for target in arg)
+    if op == '$nin':
+        return not any(_eq_any(values, target) for target in arg)
+    if op == '$gt':
+        return _compare(values, arg, lambda a, b: a > b)
+    if op == '$gte':
+        return _compare(values, arg, lambda a, b: a >= b)
+    if op == '$lt':
+        return _compare(values, arg, lambda a, b: a < b)
+    if op == '$lte':
+        return _compare(values, arg, lambda a, b: a <= b)
+    if op == '$exists':
+        return bool(values) == bool(arg)
+    if op == '$regex':
+        pattern = _regex(arg, condition.get('$options', ''))
+        return any(isinstance(v, str) and pattern.search(v) for v in _expand(values))
+    if op == '$options':
+        return True
+    if op == '$type':
+        types = arg if isinstance(arg, list) else [arg]
+        python_types = tuple(
+            t for alias in types
+            for t in (_TYPE_ALIASES[alias] if isinstance(_TYPE_ALIASES[alias], tuple) else (_TYPE_ALIASES[alias],))
+        )
+        return any(
+            isinstance(v, python_types) and not (isinstance(v, bool) and bool not in python_types)
+            for v in values
+        )
+    if op == '$not':
+        return not _match_field(values, arg)
+    if op == '$elemMatch':
+        for value in values:
+            if isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict) and not _is_operator_dict(arg):
+                        if _match(item, arg):
+                            return True
+                    elif _match_field([item], arg):
+                        return True
+        return False
+    if op == '$size':
+        return any(isinstance(v, list) and len(v) == arg for v in values)
+    if op == '$all':
+        return all(_eq_any(values, target) for target in arg)
+    raise OperationFailure(f'Unsupported query operator {op}')
+
+def _match_field(values, condition):
+    if _is_operator_dict(condition):
+        return all(_match_operator(values, op, arg, condition) for op, arg in condition.items())
+    return _eq_any(values, condition)
+
+def _match(doc, query):
+    if not query:
+        return True
+    for key, condition in query.items():
+        if key == '$and':
+            if not all(_match(doc, sub) for sub in condition):
+                return False
+        elif key == '$or':
+            if not any(_match(doc, sub) for sub in condition):
+                return False
+        elif key == '$nor':
+            if any(_match(doc, sub) for sub in condition):
+                return False
+        elif key == '$comment':
+            continue
+        elif not _match_field(_get_path(doc, key), condition):
+            return False
+    return True
+
+# ---------------------------------------------------------------------------
+# Updates
+# ---------------------------------------------------------------------------
+
+def _upsert_seed(query):
+    seed = {}
+    for key, condition in (query or {}).items():
+        if key == '$and':
+            for sub in condition:
+                for k, v in _upsert_seed(sub).items():
+                    seed[k] = v
+        elif key.startswith('$'):
+            continue
+        elif _is_operator_dict(condition):
+            if '$eq' in condition:
+                _set_path(seed, key, deepcopy(condition['$eq']))
+        elif not isinstance(condition, re.Pattern):
+            _set_path(seed, key, deepcopy(condition))
+    return seed
+
+def _apply_update(doc, update, is_insert=False):
+    if isinstance(update, list):
+        raise OperationFailure('Update pipelines are not supported by the in-memory backend')
+
+    if not any(str(k).startswith('$') for k in update):
+        doc_id = doc.get('_id')
+        doc.clear()
+        doc.update(deepcopy(update))
+        if doc_id is not None:
+            doc['_id'] = doc_id
+        return
+
+    for op, fields in update.items():
+        if op == '$set':
+            for path, value in fields.items():
+                _set_path(doc, path, deepcopy(value))
+        elif op == '$setOnInsert':
+            if is_insert:
+                for path, value in fields.items():
+                    _set_path(doc, path, deepcopy(value))
+        elif op == '$unset':
+            for path in fields:
+                _delete_path(doc, path)
+        elif op == '$inc':
+            for path, amount in fields.items():
+                _set_path(doc, path, (_field_value(doc, path) or 0) + amount)
+        elif op == '$mul':
+            for path, factor in fields.items():
+                _set_path(doc, path, (_field_value(doc, path) or 0) * factor)
+        elif op in ('$min', '$max'):
+            for path, value in fields.items():
+                current = _field_value(doc, path, _MISSING)
+                if current is _MISSING or (value < current if op == '$min' else value > current):
+                    _set_path(doc, path, value)
+        elif op == '$currentDate':
+            for path in fields:
+                _set_path(doc, path, datetime.utcnow())
+        elif op in ('$push', '$addToSet'):
+            for path, value in fields.items():
+                array = _field_value(doc, path)
+                array = list(array) if isinstance(array, list) else []
+                items = value.get('$each', []) if isinstance(value, dict) and '$each' in value else [value]
+                for item in items:
+                    if op == '$push' or item not in array:
+                        array.append(deepcopy(item))
+                if isinstance(value, dict) and '$slice' in value:
+                    count = value['$slice']
+                    array = array[count:] if count < 0 else array[:count]
+                _set_path(doc, path, array)
+        elif op == '$pull':
+            for path, condition in fields.items():
+                array = _field_value(doc, path)
+                if isinstance(array, list):
+                    if isinstance(condition, dict) and not _is_operator_dict(condition):
+                        kept = [item for item in array if not (isinstance(item, dict) and _match(item, condition))]
+                    else:
+                        kept = [item for item in array if not _match_field([item], condition)]
+                    _set_path(doc, path, kept)
+        else:
+            raise OperationFailure(f'Unsupported update operator {op}')
+
+# ---------------------------------------------------------------------------
+# Aggregation expressions
+# ---------------------------------------------------------------------------
+
+def _evaluate(doc, expr):
+    if isinstance(expr, str) and expr.startswith('$'):
+        if expr == '$$ROOT':
+            return doc
+        return _field_value(doc, expr[1:])
+    if isinstance(expr, list):
+        return [_evaluate(doc, item) for item in expr]
+    if not isinstance(expr, dict):
+        return expr
+    if not _is_operator_dict(expr):
+        return {key: _evaluate(doc, value) for key, value in expr.items()}
+
+    (op, arg), = expr.items()
+    if op == '$literal':
+        return arg
+
+    args = [_evaluate(doc, a) for a in arg] if isinstance(arg, list) else None
+    if op in ('$add', '$sum'):
+        values = args if args is not None else _evaluate(doc, arg)
+        values = values if isinstance(values, list) else [values]
+        return sum(v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool))
+    if op == '$subtract':
+        return (args[0] or 0) - (args[1] or 0)
+    if op == '$multiply':
+        result = 1
+        for value in args:
+            result *= value or 0
+        return result
+    if op == '$divide':
+        return args[0] / args[1] if args[1] else None
+    if op in ('$eq', '$ne', '$gt', '$gte', '$lt', '$lte'):
+        a, b = args
+        if op == '$eq':
+            return a == b
+        if op == '$ne':
+            return a != b
+        ka, kb = _sort_key(a), _sort_key(b)
+        return {'$gt': ka > kb, '$gte': ka >= kb, '$lt': ka < kb, '$lte': ka <= kb}[op]
+    if op == '$and':
+        return all(args)
+    if op == '$or':
+        return any(args)
+    if op == '$not':
+        return not (args[0] if args is not None else _evaluate(doc, arg))
+    if op == '$in':
+        return args[0] in (args[1] or [])
+    if op == '$cond':
+        if isinstance(arg, dict):
+            condition, then, otherwise = arg['if'], arg['then'], arg['else']
+        else:
+            condition, then, otherwise = arg
+        return _evaluate(doc, then) if _evaluate(doc, condition) else _evaluate(doc, otherwise)
+    if op == '$ifNull':
+        for value in args:
+            if value is not None:
+                return value
+        return None
+    if op == '$toString':
+        value = _evaluate(doc, arg)
+        return None if value is None else str(value)
+    if op == '$toObjectId':
+        value = _evaluate(doc, arg)
+        return ObjectId(value) if isinstance(value, str) else value
+    if op == '$size':
+        value = _evaluate(doc, arg)
+        return len(value) if isinstance(value, list) else 0
+    raise OperationFailure(f'Unsupported aggregation expression {op}')
+
+def _accumulate(docs, op, expr):
+    if op == '$count':
+        return len(docs)
+    values = [_evaluate(doc, expr) for doc in docs]
+    if op == '$sum':
+        return sum(v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool))
+    if op == '$avg':
+        numbers = [v for v in values if isinstance(v, (int, float)) and not isinstance(v, bool)]
+        return sum(numbers) / len(numbers) if numbers else None
+    present = [v for v in values if v is not None]
+    if op == '$min':
+        return min(present, key=_sort_key) if present else None
+    if op == '$max':
+        return max(present, key=_sort_key) if present else None
+    if op == '$first':
+        return values[0] if values else None
+    if op == '$last':
+        return values[-1] if values else None
+    if op == '$push':
+        return values
+    if op == '$addToSet':
+        result = []
+        for value in values:
+            if value not in result:
+                result.append(value)
+        return result
+    raise OperationFailure(f'Unsupported accumulator {op}')
+
+def _group(docs, spec):
+    groups = {}
+    for doc in docs:
+        key = _evaluate(doc, spec['_id'])
+        groups.setdefault(_hashable(key), (key, []))[1].append(doc)
+
+    results = []
+    for key, members in groups.values():
+        result = {'_id': key}
+        for field, accumulator in spec.items():
+            if field == '_id':
+                continue
+            (op, expr), = accumulator.items()
+            result[field] = _accumulate(members, op, expr)
+        results.append(result)
+    return results
+
+def _project_stage(doc, spec):
+    include_id = spec.get('_id', 1)
+    fields = {k: v for k, v in spec.items() if k != '_id'}
+    if fields and all(v in (0, False) for v in fields.values()):
+        return _project(doc, spec)
+
+    result = {}
+    if include_id in (1, True) and '_id' in doc:
+        result['_id'] = doc['_id']
+    elif include_id not in (0, False, 1, True):
+        result['_id'] = _evaluate(doc, include_id)
+    for path, value in fields.items():
+        if value in (1, True):
+            _copy_path(doc, result, path)
+        else:
+            _set_path(result, path, _evaluate(doc, value))
+    return result
+
+# ---------------------------------------------------------------------------
+# Indexes and cursors
+# ---------------------------------------------------------------------------
+
+class _Index:
+    def __init__(self, name, keys, unique=False, sparse=False, expire_after=None):
+        self.name = name
+        self.keys = keys
+        self.field = keys[0][0]
+        self.unique = unique
+        self.sparse = sparse
+        self.expire_after = expire_after
+        self.entries = {}
+
+    def _values(self, doc):
+        values = list(_expand(_get_path(doc, self.field)))
+        return [_hashable(v) for v in values] or [None]
+
+    def add(self, doc):
+        for value in self._values(doc):
+            self.entries.setdefault(value, set()).add(_hashable(doc['_id']))
+
+    def remove(self, doc):
+        for value in self._values(doc):
+            ids = self.entries.get(value)
+            if ids:
+                ids.discard(_hashable(doc['_id']))
+                if not ids:
+                    del self.entries[value]
+
+    def lookup(self, value):
+        return self.entries.get(_hashable(value), set())
+
+    def unique_key(self, doc):
+        return tuple(_hashable(_field_value(doc, field)) for field, _ in self.keys)
+
+class MemoryCursor:
+    def __init__(self, collection, filter=None, projection=None, skip=0, limit=0, sort=None):
+        self._collection = collection
+        self._filter = filter or {}
+        self._projection = projection
+        self._skip = skip or 0
+        self._limit = limit or 0
+        self._sort = _normalize_sort(sort) if sort else None
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        return self
+
+    def hint(self, index):
+        return self
+
+    def close(self):
+        self._results = iter(())
+
+    def rewind(self):
+        self._results = None
+        return self
+
+    def _evaluate(self):
+        docs = self._collection._find_docs(self._filter)
+        if self._sort:
+            docs = _sort_docs(docs, self._sort)
+        if self._skip:
+            docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return iter([_project(doc, self._projection) for doc in docs])
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._results is None:
+            self._results = self._evaluate()
+        return next(self._results)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ---------------------------------------------------------------------------
+# Collections and databases
+# ---------------------------------------------------------------------------
+
+class MemoryCollection:
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self._docs = {}
+        self._positions = {}
+        self._sequence = 0
+        self._indexes = {}
+        self._lock = threading.RLock()
+        self._last_purge = 0
+
+    @property
+    def full_name(self):
+        return f'{self.database.name}.{self.name}'
+
+    def with_options(self, **kwargs):
+        return self
+
+    # Indexes
+
+    def create_index(self, keys, unique=False, sparse=False, name=None, expireAfterSeconds=None, **kwargs):
+        keys = _normalize_sort(keys, 1)
+        name = name or '_'.join(f'{field}_{direction}' for field, direction in keys)
+        with self._lock:
+            if name in self._indexes:
+                return name
+            index = _Index(name, keys, unique, sparse, expireAfterSeconds)
+            seen = set()
+            for doc in self._docs.values():
+                if unique:
+                    key = index.unique_key(doc)
+                    if key in seen:
+                        raise DuplicateKeyError(f'E11000 duplicate key error collection: {self.full_name} index: {name}', 11000)
+                    seen.add(key)
+                index.add(doc)
+            self._indexes[name] = index
+        return name
+
+    def index_information(self):
+        info = {'_id_': {'key': [('_id', 1)]}}
+        for name, index in self._indexes.items():
+            info[name] = {'key': index.keys, 'unique': index.unique}
+            if index.expire_after is not None:
+                info[name]['expireAfterSeconds'] = index.expire_after
+        return info
+
+    def drop_index(self, name):
+        with self._lock:
+            self._indexes.pop(name, None)
+
+    def _index_doc(self, doc):
+        for index in self._indexes.values():
+            index.add(doc)
+
+    def _unindex_doc(self, doc):
+        for index in self._indexes.values():
+            index.remove(doc)
+
+    def _check_unique(self, doc, exclude_id=_MISSING):
+        for index in self._indexes.values():
+            if not index.unique:
+                continue
+            key = index.unique_key(doc)
+            if index.sparse and all(v is None for v in key):
+                continue
+            first = _field_value(doc, index.field)
+            for other_id in index.lookup(first if not isinstance(first, list) else None):
+                if exclude_id is not _MISSING and other_id == _hashable(exclude_id):
+                    continue
+                other = self._docs.get(other_id)
+                if other is not None and index.unique_key(other) == key:
+                    raise DuplicateKeyError(
+                        f'E11000 duplicate key error collection: {self.full_name} index: {index.name} dup key: {key}',
+                        11000
+                    )
+
+    def _purge_expired(self):
+        ttl_indexes = [i for i in self._indexes.values() if i.expire_after is not None]
+        if not ttl_indexes or time.monotonic() - self._last_purge < 1:
+            return
+        self._last_purge = time.monotonic()
+        now = datetime.utcnow()
+        for index in ttl_indexes:
+            cutoff = now - timedelta(seconds=index.expire_after)
+            expired = [
+                doc for doc in self._docs.values()
+                if isinstance(_field_value(doc, index.field), datetime) and _field_value(doc, index.field) < cutoff
+            ]
+            for doc in expired:
+                self._remove(doc)
+
+    # Reads
+
+    def _candidates(self, query):
+        """Narrow the scan using `_id` or an indexed equality/$in condition"""
+        best = None
+        for key, condition in (query or {}).items():
+            if key.startswith('$'):
+                continue
+            if isinstance(condition, dict) and not _is_operator_dict(condition):
+                targets = [condition]
+            elif _is_operator_dict(condition):
+                if '$eq' in condition:
+                    targets = [condition['$eq']]
+                elif '$in' in condition and not any(isinstance(t, (re.Pattern, list)) for t in condition['$in']):
+                    targets = condition['$in']
+                else:
+                    continue
+            elif isinstance(condition, (re.Pattern, list)):
+                continue
+            else:
+                targets = [condition]
+
+            if key == '_id':
+                ids = {_hashable(t) for t in targets}
+            else:
+                index = next((i for i in self._indexes.values() if i.field == key), None)
+                if index is None:
+                    continue
+                ids = set()
+                for target in targets:
+                    ids |= index.lookup(target)
+            if best is None or len(ids) < len(best):
+                best = ids
+
+        if best is None:
+            return list(self._docs.values())
+        return [self._docs[i] for i in best if i in self._docs]
+
+    def _find_docs(self, query):
+        """Matching stored documents (not copies) in natural order"""
+        with self._lock:
+            self._purge_expired()
+            candidates = self._candidates(query)
+            if len(candidates) < len(self._docs):
+                # Index lookups come back unordered; restore insertion order
+                candidates.sort(key=lambda d: self._positions[_hashable(d['_id'])])
+            return [doc for doc in candidates if _match(doc, query)]
+
+    def find(self, filter=None, projection=None, skip=0, limit=0, sort=None, **kwargs):
+        return MemoryCursor(self, filter, projection, skip, limit, sort)
+
+    def find_one(self, filter=None, projection=None, *args, **kwargs):
+        if filter is not None and not isinstance(filter, dict):
+            filter = {'_id': filter}
+        for doc in self.find(filter, projection, sort=kwargs.get('sort'), limit=1):
+            return doc
+        return None
+
+    def count_documents(self, filter, skip=0, limit=0, **kwargs):
+        count = len(self._find_docs(filter)) - (skip or 0)
+        count = max(count, 0)
+        return min(count, limit) if limit else count
+
+    def estimated_document_count(self, **kwargs):
+        return len(self._docs)
+
+    def distinct(self, key, filter=None, **kwargs):
+        values = []
+        for doc in self._find_docs(filter):
+            for value in _expand(_get_path(doc, key)):
+                if not isinstance(value, list) and value not in values:
+                    values.append(deepcopy(value))
+        return values
+
+    # Writes
+
+    def _insert(self, document):
+        if '_id' not in document:
+            document['_id'] = ObjectId()
+        doc = deepcopy(document)
+        key = _hashable(doc['_id'])
+        if key in self._docs:
+            raise DuplicateKeyError(
+                f"E11000 duplicate key error collection: {self.full_name} index: _id_ dup key: {{ _id: {doc['_id']!r} }}",
+                11000
+            )
+        self._check_unique(doc)
+        self._docs[key] = doc
+        self._sequence += 1
+        self._positions[key] = self._sequence
+        self._index_doc(doc)
+        return doc['_id']
+
+    def _remove(self, doc):
+        self._unindex_doc(doc)
+        self._docs.pop(_hashable(doc['_id']), None)
+        self._positions.pop(_hashable(doc['_id']), None)
+
+    def _update_doc(self, doc, update, is_insert=False):
+        """Apply an update in place, keeping indexes consistent. Returns True if modified"""
+        before = deepcopy(doc)
+        self._unindex_doc(doc)
+        try:
+            _apply_update(doc, update, is_insert)
+            if _hashable(doc.get('_id')) != _hashable(before.get('_id')):
+                raise OperationFailure("Performing an update on the path '_id' would modify the immutable field '_id'")
+            self._check_unique(doc, exclude_id=doc['_id'])
+        except Exception:
+            doc.clear()
+            doc.update(before)
+            self._index_doc(doc)
+            raise
+        self._index_doc(doc)
+        return doc != before
+
+    def _upsert(self, filter, update):
+        doc = _upsert_seed(filter)
+        _apply_update(doc, update, is_insert=True)
+        if '_id' not in doc:
+            doc['_id'] = ObjectId()
+        return self._insert(doc)
+
+    def insert_one(self, document, **kwargs):
+        with self._lock:
+            return InsertOneResult(self._insert(document), True)
+
+    def insert_many(self, documents, ordered=True, **kwargs):
+        inserted_ids = []
+        errors = []
+        with self._lock:
+            for index, document in enumerate(documents):
+                try:
+                    inserted_ids.append(self._insert(document))
+                except DuplicateKeyError as e:
+                    errors.append({'index': index, 'code': 11000, 'errmsg': str(e), 'op': document})
+                    if ordered:
+                        break
+        if errors:
+            raise BulkWriteError({
+                'writeErrors': errors,
+                'writeConcernErrors': [],
+                'nInserted': len(inserted_ids),
+                'nUpserted': 0,
+                'nMatched': 0,
+                'nModified': 0,
+                'nRemoved': 0,
+                'upserted': []
+            })
+        return InsertManyResult(inserted_ids, True)
+
+    def _update(self, filter, update, upsert, multi):
+        with self._lock:
+            docs = self._find_docs(filter)
+            if not multi:
+                docs = docs[:1]
+            if not docs and upsert:
+                upserted_id = self._upsert(filter, update)
+                return {'n': 1, 'nModified': 0, 'upserted': upserted_id}
+            modified = sum(1 for doc in docs if self._update_doc(doc, update))
+            return {'n': len(docs), 'nModified': modified}
+
+    def update_one(self, filter, update, upsert=False, **kwargs):
+        return UpdateResult(self._update(filter, update, upsert, multi=False), True)
+
+    def update_many(self, filter, update, upsert=False, **kwargs):
+        return UpdateResult(self._update(filter, update, upsert, multi=True), True)
+
+    def replace_one(self, filter, replacement, upsert=False, **kwargs):
+        if any(str(k).startswith('$') for k in replacement):
+            raise ValueError('replacement can not include $ operators')
+        return UpdateResult(self._update(filter, replacement, upsert, multi=False), True)
+
+    def _delete(self, filter, multi):
+        with self._lock:
+            docs = self._find_docs(filter)
+            if not multi:
+                docs = docs[:1]
+            for doc in docs:
+                self._remove(doc)
+            return {'n': len(docs)}
+
+    def delete_one(self, filter, **kwargs):
+        return DeleteResult(self._delete(filter, multi=False), True)
+
+    def delete_many(self, filter, **kwargs):
+        return DeleteResult(self._delete(filter, multi=True), True)
+
+    def _find_one_and_modify(self, filter, projection, sort, modify):
+        with self._lock:
+            docs = self._find_docs(filter)
+            if sort:
+                docs = _sort_docs(docs, _normalize_sort(sort))
+            return modify(docs[0] if docs else None)
+
+    def find_one_and_update(self, filter, update, projection=None, sort=None, upsert=False,
+                            return_document=ReturnDocument.BEFORE, **kwargs):
+        def modify(doc):
+            if doc is None:
+                if not upsert:
+                    return None
+                upserted_id = self._upsert(filter, update)
+                if return_document == ReturnDocument.AFTER:
+                    return _project(self._docs[_hashable(upserted_id)], projection)
+                return None
+            before = _project(doc, projection)
+            self._update_doc(doc, update)
+            return _project(doc, projection) if return_document == ReturnDocument.AFTER else before
+        return self._find_one_and_modify(filter, projection, sort, modify)
+
+    def find_one_and_replace(self, filter, replacement, projection=None, sort=None, upsert=False,
+                             return_document=ReturnDocument.BEFORE, **kwargs):
+        return self.find_one_and_update(filter, replacement, projection, sort, upsert, return_document)
+
+    def find_one_and_delete(self, filter, projection=None, sort=None, **kwargs):
+        def modify(doc):
+            if doc is None:
+                return None
+            result = _project(doc, projection)
+            self._remove(doc)
+            return result
+        return self._find_one_and_modify(filter, projection, sort, modify)
+
+    def bulk_write(self, requests, ordered=True, **kwargs):
+        result = {
+            'writeErrors': [],
+            'writeConcernErrors': [],
+            'nInserted': 0,
+            'nUpserted': 0,
+            'nMatched': 0,
+            'nModified': 0,
+            'nRemoved': 0,
+            'upserted': []
+        }
+        with self._lock:
+            for index, request in enumerate(requests):
+                try:
+                    if isinstance(request, InsertOne):
+                        self._insert(request._doc)
+                        result['nInserted'] += 1
+                    elif isinstance(request, (UpdateOne, UpdateMany, ReplaceOne)):
+                        raw = self._update(request._filter, request._doc, request._upsert,
+                                           multi=isinstance(request, UpdateMany))
+                        if 'upserted' in raw:
+                            result['nUpserted'] += 1
+                            result['upserted'].append({'index': index, '_id': raw['upserted']})
+                        else:
+                            result['nMatched'] += raw['n']
+                            result['nModified'] += raw['nModified']
+                    elif isinstance(request, (DeleteOne, DeleteMany)):
+                        raw = self._delete(request._filter, multi=isinstance(request, DeleteMany))
+                        result['nRemoved'] += raw['n']
+                    else:
+                        raise TypeError(f'{request!r} is not a valid request')
+                except DuplicateKeyError as e:
+                    result['writeErrors'].append({'index': index, 'code': 11000, 'errmsg': str(e)})
+                    if ordered:
+                        break
+        if result['writeErrors']:
+            raise BulkWriteError(result)
+        return BulkWriteResult(result, True)
+
+    def drop(self):
+        with self._lock:
+            self._docs.clear()
+            self._positions.clear()
+            for index in self._indexes.values():
+                index.entries.clear()
+
+    # Aggregation
+
+    def aggregate(self, pipeline, **kwargs):
+        pipeline = list(pipeline)
+        query = {}
+        if pipeline and '$match' in pipeline[0]:
+            query = pipeline.pop(0)['$match']
+        docs = [deepcopy(doc) for doc in self._find_docs(query)]
+        return iter(self._run_pipeline(docs, pipeline))
+
+    def _run_pipeline(self, docs, pipeline):
+        for stage in pipeline:
+            (op, spec), = stage.items()
+            if op == '$match':
+                docs = [doc for doc in docs if _match(doc, spec)]
+            elif op == '$project':
+                docs = [_project_stage(doc, spec) for doc in docs]
+            elif op in ('$addFields', '$set'):
+                for doc in docs:
+                    for path, expr in spec.items():
+                        _set_path(doc, path, _evaluate(doc, expr))
+            elif op == '$unset':
+                for doc in docs:
+                    for path in ([spec] if isinstance(spec, str) else spec):
+                        _delete_path(doc, path)
+            elif op == '$sort':
+                docs = _sort_docs(docs, list(spec.items()))
+            elif op == '$skip':
+                docs = docs[spec:]
+            elif op == '$limit':
+                docs = docs[:spec]
+            elif op == '$count':
+                docs = [{spec: len(docs)}] if docs else []
+            elif op == '$group':
+                docs = _group(docs, spec)
+            elif op == '$sortByCount':
+                docs = _sort_docs(_group(docs, {'_id': spec, 'count': {'$sum': 1}}), [('count', -1)])
+            elif op == '$replaceRoot':
+                docs = [_evaluate(doc, spec['newRoot']) for doc in docs]
+            elif op == '$unwind':
+                path = spec if isinstance(spec, str) else spec['path']
+                preserve = isinstance(spec, dict) and spec.get('preserveNullAndEmptyArrays', False)
+                unwound = []
+                for doc in docs:
+                    value = _field_value(doc, path[1:], _MISSING)
+                    if isinstance(value, list) and value:
+                        for item in value:
+                            copy = deepcopy(doc)
+                            _set_path(copy, path[1:], item)
+                            unwound.append(copy)
+                    elif isinstance(value, list) or value is _MISSING or value is None:
+                        if preserve:
+                            unwound.append(doc)
+                    else:
+                        unwound.append(doc)
+                docs = unwound
+            elif op == '$lookup':
+                foreign = self.database[spec['from']]
+                for doc in docs:
+                    local = _field_value(doc, spec['localField'])
+                    targets = local if isinstance(local, list) else [local]
+                    matches = [deepcopy(d) for d in foreign._find_docs({spec['foreignField']: {'$in': targets}})]
+                    if spec.get('pipeline'):
+                        matches = foreign._run_pipeline(matches, spec['pipeline'])
+                    _set_path(doc, spec['as'], matches)
+            elif op == '$facet':
+                docs = [{
+                    name: self._run_pipeline([deepcopy(doc) for doc in docs], sub_pipeline)
+                    for name, sub_pipeline in spec.items()
+                }]
+            else:
+                raise OperationFailure(f'Unsupported aggregation stage {op}')
+        return docs
+
+class MemoryDatabase:
+    def __init__(self, name='haveli_housing'):
+        self.name = name
+        self._collections = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.get_collection(name)
+
+    def __getitem__(self, name):
+        return self.get_collection(name)
+
+    def get_collection(self, name, **kwargs):
+        collection = self._collections.get(name)
+        if collection is None:
+            with self._lock:
+                collection = self._collections.setdefault(name, MemoryCollection(self, name))
+        return collection
+
+    def create_collection(self, name, **kwargs):
+        return self.get_collection(name)
+
+    def list_collection_names(self, **kwargs):
+        return [name for name, collection in self._collections.items() if collection._docs]
+
+    def drop_collection(self, name):
+        if name in self._collections:
+            self._collections[name].drop()
+
+    def command(self, command, **kwargs):
+        if command == 'ping' or (isinstance(command, dict) and 'ping' in command):
+            return {'ok': 1.0}
+        raise OperationFailure(f'Unsupported command {command!r}')
+
+def load_json_database(data_dir, name='haveli_housing'):
+    """Build an in-memory database from the `<collection>.json` files in data_dir"""
+    db = MemoryDatabase(name)
+    if not os.path.isdir(data_dir):
+        return db
+
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(data_dir, filename)) as f:
+            documents = json_util.loads(f.read())
+        # Hex string IDs are stored as ObjectIds, like migrate_ids.py does for MongoDB
+        for document in documents:
+            if '_id' in document:
+                document['_id'] = decode_id(document['_id']) or document['_id']
+        if documents:
+            db[filename[:-len('.json')]].insert_many(documents)
+        print(f"Loaded {len(documents)} documents from {filename}")
+
+    return db
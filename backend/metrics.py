@@ -0,0 +1,32 @@
+"""
+Per-worker operational counters, exposed at GET /api/metrics.
+
+Counters are plain integers keyed by dotted names and reset when the worker
+restarts; scrape them periodically and compute rates from the differences.
+"""
+
+import threading
+import time
+
+class Metrics:
+    def __init__(self):
+        self._counters = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def get(self, name):
+        return self._counters.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'counters': dict(sorted(counters.items()))
+        }
+
+metrics = Metrics()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Convert string `_id` values to native ObjectIds.
+
+Older versions of the models stored `_id` as `str(ObjectId())`, which the
+detail routes (querying by ObjectId) could never find. MongoDB can't change
+an `_id` in place, so each batch inserts ObjectId copies and then deletes the
+string originals. Re-running the tool is safe: copies that already exist are
+kept and their string originals removed.
+
+Unique secondary indexes are dropped while a collection is migrated and
+rebuilt afterwards, so stop the API first: nothing checks uniqueness meanwhile.
+
+Usage:
+    python migrate_ids.py [--batch-size 1000] [--dry-run] [collection ...]
+"""
+
+import argparse
+
+from pymongo.errors import BulkWriteError
+
+from database import get_database
+from ids import decode_id
+
+COLLECTIONS = ['users', 'properties', 'employees', 'clients', 'bookings']
+
+def _drop_unique_indexes(collection):
+    """Drop the unique secondary indexes; returns name -> index information to rebuild them"""
+    dropped = {}
+    for name, info in collection.index_information().items():
+        if name != '_id_' and info.get('unique'):
+            collection.drop_index(name)
+            dropped[name] = info
+    return dropped
+
+def _restore_indexes(collection, indexes):
+    for name, info in indexes.items():
+        options = {k: v for k, v in info.items() if k not in ('key', 'v', 'ns')}
+        collection.create_index(info['key'], name=name, **options)
+
+def migrate_collection(collection, batch_size=1000, dry_run=False):
+    # A copy has the same unique keys (email, rera_number, ...) as its original,
+    # so those indexes would reject every copy: drop them until the end
+    unique_indexes = {} if dry_run else _drop_unique_indexes(collection)
+    try:
+        return _migrate(collection, batch_size, dry_run)
+    finally:
+        _restore_indexes(collection, unique_indexes)
+
+def _migrate(collection, batch_size, dry_run):
+    migrated = 0
+    skipped = []
+    last_id = ''
+
+    while True:
+        # Walk string IDs in order so unconvertible ones aren't fetched again
+        batch = list(
+            collection.find({'_id': {'$type': 'string', '$gt': last_id}})
+            .sort('_id', 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+        last_id = batch[-1]['_id']
+
+        copies = []
+        old_ids = []
+        for doc in batch:
+            object_id = decode_id(doc['_id'])
+            if object_id is None:
+                skipped.append(doc['_id'])
+                continue
+            old_ids.append(doc['_id'])
+            copies.append(dict(doc, _id=object_id))
+
+        if dry_run or not copies:
+            migrated += len(copies)
+            continue
+
+        try:
+            collection.insert_many(copies, ordered=False)
+        except BulkWriteError as e:
+            # With the unique secondary indexes gone, duplicates can only be
+            # copies an earlier run already made
+            other_errors = [err for err in e.details['writeErrors'] if err['code'] != 11000]
+            if other_errors:
+                raise
+
+        # Only drop originals whose ObjectId copy is really there
+        copied = {doc['_id'] for doc in collection.find({'_id': {'$in': [c['_id'] for c in copies]}}, {'_id': 1})}
+        collection.delete_many({'_id': {'$in': [old for old, c in zip(old_ids, copies) if c['_id'] in copied]}})
+        if len(copied) < len(copies):
+            raise RuntimeError(f'{collection.name}: {len(copies) - len(copied)} copies are missing; originals kept')
+        migrated += len(copies)
+
+    action = 'Would migrate' if dry_run else 'Migrated'
+    print(f"{collection.name}: {action} {migrated} documents")
+    if skipped:
+        print(f"{collection.name}: left {len(skipped)} non-ObjectId IDs unchanged (e.g. {skipped[:5]})")
+    return migrated
+
+def migrate_ids(collections=None, batch_size=1000, dry_run=False):
+    db = get_database()
+    total = 0
+    for name in collections or COLLECTIONS:
+        total += migrate_collection(db[name], batch_size, dry_run)
+    return total
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert string _id values to ObjectIds')
+    parser.add_argument('collections', nargs='*', help=f'Collections to migrate (default: {", ".join(COLLECTIONS)})')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--dry-run', action='store_true', help='Report what would change without writing')
+    args = parser.parse_args()
+
+    migrate_ids(args.collections, args.batch_size, args.dry_run)
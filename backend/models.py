@@ -1,32 +1,175 @@
 from datetime import datetime
 from bson import ObjectId
+from geo import is_point
 
-class User:
-    def __init__(self, email, name, password_hash, created_at=None):
+NUMBER = (int, float)
+
+class ValidationError(ValueError):
+    """Raised when request data does not match a schema"""
+
+class Field:
+    __slots__ = ('name', 'types', 'required', 'default', 'choices', 'writable')
+
+    def __init__(self, name, types, required=True, default=None, choices=None, writable=True):
+        self.name = name
+        self.types = types if isinstance(types, tuple) else (types,)
+        self.required = required
+        # Callables are used as factories so mutable defaults aren't shared
+        self.default = default
+        self.choices = choices
+        self.writable = writable
+
+    def default_value(self):
+        return self.default() if callable(self.default) else self.default
+
+    def check(self, value):
+        # bool is a subclass of int, but never a valid number here
+        if isinstance(value, bool) and bool not in self.types:
+            return False
+        if not isinstance(value, self.types):
+            return False
+        return self.choices is None or value in self.choices
+
+    def describe(self):
+        if self.choices is not None:
+            return 'one of ' + ', '.join(self.choices)
+        if self.types == NUMBER:
+            return 'a number'
+        return ' or '.join({
+            str: 'a string', int: 'an integer', float: 'a number', dict: 'an object', list: 'a list', bool: 'a boolean'
+        }.get(t, t.__name__) for t in self.types)
+
+class PointField(Field):
+    """A GeoJSON Point, stored as [longitude, latitude]"""
+    __slots__ = ()
+
+    def __init__(self, name, **kwargs):
+        super().__init__(name, dict, **kwargs)
+
+    def check(self, value):
+        return is_point(value)
+
+    def describe(self):
+        return 'a GeoJSON Point with [longitude, latitude] coordinates'
+
+class Schema:
+    """Field definitions shared by request validation and model conversion"""
+
+    def __init__(self, *fields):
+        self.fields = fields
+        self.writable = tuple(f for f in fields if f.writable)
+        self.names = frozenset(f.name for f in self.writable)
+
+    def validate(self, data, partial=False):
+        """Check request data and return only the known fields.
+
+        With partial=True (updates) missing required fields are allowed.
+        """
+        if not isinstance(data, dict):
+            raise ValidationError('Request body must be a JSON object')
+
+        cleaned = {}
+        for field in self.writable:
+            if field.name in data:
+                value = data[field.name]
+                if value is None and not field.required:
+                    continue
+                if not field.check(value):
+                    raise ValidationError(f'{field.name} must be {field.describe()}')
+                cleaned[field.name] = value
+            elif not partial:
+                if field.required:
+                    raise ValidationError(f'{field.name} is required')
+                cleaned[field.name] = field.default_value()
+        return cleaned
+
+def _compile_reader(cls):
+    """A function converting documents to `cls` objects with one attribute store per field.
+
+    Generated like dataclasses does, because a loop of setattr calls is slower
+    than the dict-backed models it replaced. Absent fields read as None, or as
+    their default if it is a constant: factories such as ObjectId and utcnow
+    are for new objects, not for documents stored without the field.
+    """
+    fields = cls.schema.fields
+    lines = [
+        'def read(documents):',
+        '    objects = []',
+        '    append = objects.append',
+        '    for data in documents:',
+        '        obj = new(cls)',
+        '        get = data.get'
+    ]
+    lines += [f'        obj.{field.name} = get({field.name!r}, defaults[{i}])' for i, field in enumerate(fields)]
+    lines += ['        append(obj)', '    return objects']
+    namespace = {
+        'new': cls.__new__,
+        'cls': cls,
+        'defaults': tuple(None if callable(field.default) else field.default for field in fields)
+    }
+    exec('\n'.join(lines), namespace)
+    return namespace['read']
+
+class Model:
+    __slots__ = ()
+    schema = Schema()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._read = staticmethod(_compile_reader(cls))
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        # Skip __init__: documents from the database are already well-formed
+        return cls._read((data,))[0]
+
+    @classmethod
+    def from_documents(cls, documents):
+        """Convert a cursor (or any iterable of documents) into model objects"""
+        return cls._read(documents)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+class User(Model):
+    __slots__ = ('email', 'name', 'password_hash', 'created_at')
+    schema = Schema(
+        Field('email', str),
+        Field('name', str),
+        Field('password_hash', bytes, writable=False),
+        Field('created_at', datetime, required=False, default=datetime.utcnow, writable=False)
+    )
+
+    def __init__(self, email: str, name: str, password_hash: bytes, created_at: datetime = None):
         self.email = email
         self.name = name
         self.password_hash = password_hash
         self.created_at = created_at or datetime.utcnow()
 
-    def to_dict(self):
-        return {
-            'email': self.email,
-            'name': self.name,
-            'password_hash': self.password_hash,
-            'created_at': self.created_at
-        }
-
-    @staticmethod
-    def from_dict(data):
-        return User(
-            email=data['email'],
-            name=data['name'],
-            password_hash=data['password_hash'],
-            created_at=data.get('created_at')
-        )
-
-class Property:
-    def __init__(self, name, rera_number, address, specification, rate, total_plots, description, map_url, _id=None):
+class Property(Model):
+    __slots__ = ('_id', 'name', 'rera_number', 'address', 'specification', 'rate', 'total_plots',
+                 'description', 'map_url', 'location', 'version', 'updated_at')
+    schema = Schema(
+        Field('_id', (ObjectId, str), required=False, default=ObjectId, writable=False),
+        Field('name', str),
+        Field('rera_number', str),
+        Field('address', dict),
+        Field('specification', str),
+        Field('rate', NUMBER),
+        Field('total_plots', int),
+        Field('description', str),
+        Field('map_url', str, required=False, default=''),
+        PointField('location', required=False),
+        Field('version', int, required=False, default=0, writable=False),
+        Field('updated_at', datetime, required=False, default=datetime.utcnow, writable=False)
+    )
+
+    def __init__(self, name: str, rera_number: str, address: dict, specification: str, rate: float,
+                 total_plots: int, description: str, map_url: str, location: dict = None, version: int = 0,
+                 updated_at: datetime = None, _id=None):
         self._id = _id or ObjectId()
         self.name = name
         self.rera_number = rera_number
@@ -36,36 +179,28 @@ class Property:
         self.total_plots = total_plots
         self.description = description
         self.map_url = map_url
+        self.location = location
+        self.version = version
+        self.updated_at = updated_at or datetime.utcnow()
 
-    def to_dict(self):
-        return {
-            '_id': str(self._id),
-            'name': self.name,
-            'rera_number': self.rera_number,
-            'address': self.address,
-            'specification': self.specification,
-            'rate': self.rate,
-            'total_plots': self.total_plots,
-            'description': self.description,
-            'map_url': self.map_url
-        }
-
-    @staticmethod
-    def from_dict(data):
-        return Property(
-            _id=data.get('_id'),
-            name=data['name'],
-            rera_number=data['rera_number'],
-            address=data['address'],
-            specification=data['specification'],
-            rate=data['rate'],
-            total_plots=data['total_plots'],
-            description=data['description'],
-            map_url=data['map_url']
-        )
-
-class Employee:
-    def __init__(self, name, aadhar_number, account_number, rera_number, total_sales, superior_name, photo_url, ongoing_work, _id=None):
+class Employee(Model):
+    __slots__ = ('_id', 'name', 'aadhar_number', 'account_number', 'rera_number', 'total_sales',
+                 'superior_name', 'photo_url', 'version')
+    schema = Schema(
+        Field('_id', (ObjectId, str), required=False, default=ObjectId, writable=False),
+        Field('name', str),
+        Field('aadhar_number', str),
+        Field('account_number', str),
+        Field('rera_number', str),
+        # Kept by the outbox worker and rollups.py, never by API writes
+        Field('total_sales', int, required=False, default=0, writable=False),
+        Field('superior_name', str),
+        Field('photo_url', str, required=False, default=''),
+        Field('version', int, required=False, default=0, writable=False)
+    )
+
+    def __init__(self, name: str, aadhar_number: str, account_number: str, rera_number: str,
+                 superior_name: str, photo_url: str, total_sales: int = 0, version: int = 0, _id=None):
         self._id = _id or ObjectId()
         self.name = name
         self.aadhar_number = aadhar_number
@@ -74,37 +209,25 @@ class Employee:
         self.total_sales = total_sales
         self.superior_name = superior_name
         self.photo_url = photo_url
-        self.ongoing_work = ongoing_work or []
+        self.version = version
 
-    def to_dict(self):
-        return {
-            '_id': str(self._id),
-            'name': self.name,
-            'aadhar_number': self.aadhar_number,
-            'account_number': self.account_number,
-            'rera_number': self.rera_number,
-            'total_sales': self.total_sales,
-            'superior_name': self.superior_name,
-            'photo_url': self.photo_url,
-            'ongoing_work': self.ongoing_work
-        }
-
-    @staticmethod
-    def from_dict(data):
-        return Employee(
-            _id=data.get('_id'),
-            name=data['name'],
-            aadhar_number=data['aadhar_number'],
-            account_number=data['account_number'],
-            rera_number=data['rera_number'],
-            total_sales=data['total_sales'],
-            superior_name=data['superior_name'],
-            photo_url=data['photo_url'],
-            ongoing_work=data.get('ongoing_work', [])
-        )
-
-class Client:
-    def __init__(self, name, aadhar_number, phone_number, project_id, plot_number, payment, status, saled_by, _id=None):
+class Client(Model):
+    __slots__ = ('_id', 'name', 'aadhar_number', 'phone_number', 'project_id', 'plot_number', 'payment',
+                 'status', 'saled_by')
+    schema = Schema(
+        Field('_id', (ObjectId, str), required=False, default=ObjectId, writable=False),
+        Field('name', str),
+        Field('aadhar_number', str),
+        Field('phone_number', str),
+        Field('project_id', str),
+        Field('plot_number', int),
+        Field('payment', dict),
+        Field('status', str),
+        Field('saled_by', str)
+    )
+
+    def __init__(self, name: str, aadhar_number: str, phone_number: str, project_id: str, plot_number: int,
+                 payment: dict, status: str, saled_by: str, _id=None):
         self._id = _id or ObjectId()
         self.name = name
         self.aadhar_number = aadhar_number
@@ -115,35 +238,65 @@ class Client:
         self.status = status
         self.saled_by = saled_by
 
-    def to_dict(self):
-        return {
-            '_id': str(self._id),
-            'name': self.name,
-            'aadhar_number': self.aadhar_number,
-            'phone_number': self.phone_number,
-            'project_id': self.project_id,
-            'plot_number': self.plot_number,
-            'payment': self.payment,
-            'status': self.status,
-            'saled_by': self.saled_by
-        }
-
-    @staticmethod
-    def from_dict(data):
-        return Client(
-            _id=data.get('_id'),
-            name=data['name'],
-            aadhar_number=data['aadhar_number'],
-            phone_number=data['phone_number'],
-            project_id=data['project_id'],
-            plot_number=data['plot_number'],
-            payment=data['payment'],
-            status=data['status'],
-            saled_by=data['saled_by']
-        )
-
-class Booking:
-    def __init__(self, client_id, property_id, plot_number, booking_date, status, amount, _id=None):
+PAYMENT_METHODS = ('cash', 'cheque')
+PAYMENT_SOURCES = ('booking', 'instalment', 'opening')
+
+class Payment(Model):
+    """One entry in the append-only payments ledger"""
+    __slots__ = ('_id', 'client_id', 'property_id', 'amount', 'method', 'paid_at', 'recorded_at', 'recorded_by',
+                 'reference', 'source')
+    schema = Schema(
+        Field('_id', (ObjectId, str), required=False, default=ObjectId, writable=False),
+        Field('client_id', str),
+        Field('property_id', str),
+        Field('amount', NUMBER),
+        Field('method', str, choices=PAYMENT_METHODS),
+        Field('paid_at', datetime, required=False, default=datetime.utcnow),
+        Field('recorded_at', datetime, required=False, default=datetime.utcnow, writable=False),
+        Field('recorded_by', str, required=False),
+        Field('reference', str, required=False, default=''),
+        Field('source', str, required=False, default='instalment', choices=PAYMENT_SOURCES)
+    )
+
+    def __init__(self, client_id: str, property_id: str, amount: float, method: str, paid_at: datetime = None,
+                 recorded_by: str = None, reference: str = '', source: str = 'instalment',
+                 recorded_at: datetime = None, _id=None):
+        self._id = _id or ObjectId()
+        self.client_id = client_id
+        self.property_id = property_id
+        self.amount = amount
+        self.method = method
+        self.recorded_at = recorded_at or datetime.utcnow()
+        self.paid_at = paid_at or self.recorded_at
+        self.recorded_by = recorded_by
+        self.reference = reference or ''
+        self.source = source
+
+BOOKING_STATUSES = ('pending', 'confirmed', 'cancelled')
+
+# Status -> statuses a booking can move to from it
+BOOKING_TRANSITIONS = {
+    'pending': ('confirmed', 'cancelled'),
+    'confirmed': ('cancelled',),
+    'cancelled': ()
+}
+
+class Booking(Model):
+    __slots__ = ('_id', 'client_id', 'property_id', 'plot_number', 'booking_date', 'status', 'amount',
+                 'saled_by')
+    schema = Schema(
+        Field('_id', (ObjectId, str), required=False, default=ObjectId, writable=False),
+        Field('client_id', str),
+        Field('property_id', str),
+        Field('plot_number', int),
+        Field('booking_date', datetime, required=False, default=datetime.utcnow),
+        Field('status', str, choices=BOOKING_STATUSES),
+        Field('amount', NUMBER),
+        Field('saled_by', str, required=False)
+    )
+
+    def __init__(self, client_id: str, property_id: str, plot_number: int, booking_date: datetime, status: str,
+                 amount: float, saled_by: str = None, _id=None):
         self._id = _id or ObjectId()
         self.client_id = client_id
         self.property_id = property_id
@@ -151,26 +304,33 @@ class Booking:
         self.booking_date = booking_date or datetime.utcnow()
         self.status = status
         self.amount = amount
+        self.saled_by = saled_by
 
-    def to_dict(self):
-        return {
-            '_id': str(self._id),
-            'client_id': self.client_id,
-            'property_id': self.property_id,
-            'plot_number': self.plot_number,
-            'booking_date': self.booking_date,
-            'status': self.status,
-            'amount': self.amount
-        }
-
-    @staticmethod
-    def from_dict(data):
-        return Booking(
-            _id=data.get('_id'),
-            client_id=data['client_id'],
-            property_id=data['property_id'],
-            plot_number=data['plot_number'],
-            booking_date=data.get('booking_date'),
-            status=data['status'],
-            amount=data['amount']
-        )
\ No newline at end of file
+# Request bodies that don't map one-to-one onto a model
+
+# A new user's writable fields plus the password to hash
+REGISTER_REQUEST_SCHEMA = Schema(*User.schema.writable, Field('password', str))
+
+BOOKING_REQUEST_SCHEMA = Schema(
+    Field('property_id', str),
+    Field('plot_number', int),
+    Field('amount', NUMBER),
+    Field('client_name', str),
+    Field('client_phone', str),
+    Field('client_aadhar', str),
+    Field('cash_payment', NUMBER, required=False, default=0),
+    Field('cheque_payment', NUMBER, required=False, default=0),
+    Field('employee_id', str, required=False)
+)
+
+BOOKING_STATUS_SCHEMA = Schema(
+    Field('status', str, choices=BOOKING_STATUSES)
+)
+
+# paid_at is an ISO 8601 date or datetime; it defaults to now
+PAYMENT_REQUEST_SCHEMA = Schema(
+    Field('amount', NUMBER),
+    Field('method', str, choices=PAYMENT_METHODS),
+    Field('paid_at', str, required=False),
+    Field('reference', str, required=False, default='')
+)
@@ -0,0 +1,60 @@
+"""
+Batch lookups by ID for the multi-get endpoints.
+
+IDs come from `?ids=a,b,c` or a JSON body `{"ids": [...]}`. Cached documents
+are served first and the rest are fetched with a single `$in` query, so a
+batch costs at most one round trip regardless of its size.
+"""
+
+from ids import decode_id, encode_id
+
+MAX_BATCH_IDS = 100
+
+def parse_id_list(request, max_ids=MAX_BATCH_IDS):
+    """Requested IDs, de-duplicated in request order"""
+    if request.method != 'GET':
+        data = request.get_json(silent=True) or {}
+        raw_ids = data.get('ids') or []
+        if not isinstance(raw_ids, list):
+            raise ValueError('ids must be a list')
+    else:
+        raw_ids = [i for i in request.args.get('ids', '').split(',') if i.strip()]
+
+    ids = []
+    seen = set()
+    for raw_id in raw_ids:
+        id_value = str(raw_id).strip()
+        if id_value not in seen:
+            seen.add(id_value)
+            ids.append(id_value)
+
+    if not ids:
+        raise ValueError('ids are required')
+    if len(ids) > max_ids:
+        raise ValueError(f'At most {max_ids} ids can be given at once')
+    return ids
+
+def invalid_ids(ids):
+    return [i for i in ids if decode_id(i) is None]
+
+def fetch_by_ids(collection, ids, cache=None, projection=None):
+    """Documents for valid encoded `ids` in request order, plus the IDs not found.
+
+    Returned documents have their `_id` encoded. Without a projection, fetched
+    documents are added to `cache`.
+    """
+    found = cache.get_many(ids) if cache is not None and projection is None else {}
+
+    pending = [decode_id(i) for i in ids if i not in found]
+    if pending:
+        fetched = {}
+        for doc in collection.find({'_id': {'$in': pending}}, projection):
+            doc['_id'] = encode_id(doc['_id'])
+            fetched[doc['_id']] = doc
+        if cache is not None and projection is None:
+            cache.set_many(fetched)
+        found.update(fetched)
+
+    documents = [found[i] for i in ids if i in found]
+    missing = [i for i in ids if i not in found]
+    return documents, missing
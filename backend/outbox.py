@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Outbox job queue for the side effects of booking and payment writes.
+
+Creating a booking, changing its status or recording a payment writes the
+document plus one entry in the `outbox` collection and returns. Workers claim
+entries in batches and apply the resulting counter updates (property and
+employee rollups, and `total_sales` on employees): the updates a
+batch makes to one document are merged into a single write, sent in one bulk
+write per collection.
+
+Delivery is at least once: a worker that dies mid-batch leaves its lease to
+expire and the entries are claimed again, so OUTBOX_LEASE_SECONDS must
+comfortably exceed the time a batch takes. Each write records its entries' ids
+in the document's `outbox_applied` array and only applies if none of them is
+there yet, so a redelivered entry changes nothing; the ids are pulled again
+once their entries have left the queue. Failing entries are retried with
+exponential backoff and parked as `failed` after OUTBOX_MAX_ATTEMPTS.
+`rollups.py` rebuilds every counter from scratch if anything drifts.
+
+By default each API process runs a worker thread (OUTBOX_WORKER=thread). With
+OUTBOX_WORKER=off, run dedicated worker processes instead (MongoDB only; the
+in-memory backend lives inside the API process):
+
+Usage:
+    python outbox.py [--workers 4] [--batch-size 200]
+    python outbox.py --once            # drain the queue and exit
+    python outbox.py --retry-failed    # requeue parked entries
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from database import get_database
+from resilience import insert_with_retry
+from rollups import booking_created_updates, booking_status_updates, payment_recorded_updates
+
+BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 200))
+POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', 1))
+# After a wake-up, wait this long so entries queued close together share a batch
+LINGER_SECONDS = float(os.getenv('OUTBOX_LINGER_SECONDS', 0.1))
+LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 60))
+MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+WORKER_MODE = os.getenv('OUTBOX_WORKER', 'thread')
+
+APPLIED_FIELD = 'outbox_applied'
+
+# Event -> function(payload) returning (collection, _id, update, upsert) tuples
+HANDLERS = {
+    'booking.created': lambda payload: booking_created_updates(
+        payload['booking'], payload.get('total_plots'), payload.get('client_payment')
+    ),
+    'booking.status_changed': lambda payload: booking_status_updates(
+        payload['booking'], payload['old_status'], payload['new_status']
+    ),
+    'payment.recorded': lambda payload: payment_recorded_updates(
+        payload['property_id'], payload['method'], payload['amount']
+    )
+}
+
+def booking_payload(booking_id, booking):
+    """The booking fields the handlers need, for an event's `booking`"""
+    return {
+        'booking_id': booking_id,
+        'property_id': booking.get('property_id'),
+        'saled_by': booking.get('saled_by'),
+        'status': booking.get('status'),
+        'amount': booking.get('amount', 0)
+    }
+
+# Set on enqueue so the worker thread in this process picks entries up at once
+_wakeup = threading.Event()
+
+def _entry(event, payload, now):
+    if event not in HANDLERS:
+        raise ValueError(f'Unknown outbox event {event}')
+    return {
+        '_id': ObjectId(),
+        'event': event,
+        'payload': payload,
+        'status': 'pending',
+        'attempts': 0,
+        'available_at': now,
+        'created_at': now
+    }
+
+def enqueue(db, event, payload):
+    """Add an outbox entry; returns its id"""
+    entry = _entry(event, payload, datetime.utcnow())
+    insert_with_retry(db.outbox, entry)
+    _wakeup.set()
+    return entry['_id']
+
+def enqueue_many(db, events):
+    """Add an outbox entry per (event, payload) with a single insert"""
+    now = datetime.utcnow()
+    entries = [_entry(event, payload, now) for event, payload in events]
+    if entries:
+        db.outbox.insert_many(entries, ordered=False)
+        _wakeup.set()
+    return [entry['_id'] for entry in entries]
+
+def _ready(now):
+    return {'$or': [
+        {'status': 'pending', 'available_at': {'$lte': now}},
+        # Claimed by a worker that never finished
+        {'status': 'processing', 'locked_until': {'$lt': now}}
+    ]}
+
+def claim(db, batch_size=BATCH_SIZE):
+    """Lease up to `batch_size` ready entries to this caller, oldest first"""
+    now = datetime.utcnow()
+    ids = [doc['_id'] for doc in db.outbox.find(_ready(now), {'_id': 1}).sort('_id', 1).limit(batch_size)]
+    if not ids:
+        return []
+    lease = ObjectId()
+    # Re-check readiness so entries another worker claimed meanwhile are skipped
+    db.outbox.update_many(
+        {'_id': {'$in': ids}, **_ready(now)},
+        {'$set': {'status': 'processing', 'lease': lease, 'locked_until': now + timedelta(seconds=LEASE_SECONDS)},
+         '$inc': {'attempts': 1}}
+    )
+    return list(db.outbox.find({'lease': lease, 'status': 'processing'}).sort('_id', 1))
+
+def _combine(first, second):
+    """One update doing `first` then `second`, or None if they use different operators on a field"""
+    operators = {}
+    for update in (first, second):
+        for op, fields in update.items():
+            for field in fields:
+                if operators.setdefault(field, op) != op:
+                    return None
+
+    combined = {}
+    for update in (first, second):
+        for op, fields in update.items():
+            target = combined.setdefault(op, {})
+            for field, value in fields.items():
+                if op == '$inc':
+                    target[field] = target.get(field, 0) + value
+                elif op == '$addToSet':
+                    target.setdefault(field, {'$each': []})['$each'].extend(
+                        value['$each'] if isinstance(value, dict) else [value])
+                elif op == '$pull':
+                    target.setdefault(field, {'$in': []})['$in'].extend(
+                        value['$in'] if isinstance(value, dict) else [value])
+                else:
+                    target[field] = value
+    return combined
+
+def apply(db, entries):
+    """Apply the entries' updates, merged into as few writes per document as possible"""
+    entry_ids = [entry['_id'] for entry in entries]
+    effects = [
+        (entry['_id'], collection, target, update, upsert)
+        for entry in entries
+        for collection, target, update, upsert in HANDLERS[entry['event']](entry['payload'])
+    ]
+
+    # Entries already applied to a document by an earlier, interrupted attempt
+    targets = {}
+    for _, collection, target, _, _ in effects:
+        targets.setdefault(collection, set()).add(target)
+    applied = set()
+    for collection, ids in targets.items():
+        for doc in db[collection].find({'_id': {'$in': list(ids)}, APPLIED_FIELD: {'$in': entry_ids}},
+                                       {APPLIED_FIELD: 1}):
+            applied.update((collection, doc['_id'], entry_id) for entry_id in doc[APPLIED_FIELD])
+
+    # (collection, _id) -> [[update, entry ids], ...] in entry order
+    chains = {}
+    upserts = set()
+    for entry_id, collection, target, update, upsert in effects:
+        if (collection, target, entry_id) in applied:
+            continue
+        if upsert:
+            upserts.add((collection, target))
+        chain = chains.setdefault((collection, target), [])
+        combined = _combine(chain[-1][0], update) if chain else None
+        if combined is None:
+            chain.append([update, [entry_id]])
+        else:
+            chain[-1] = [combined, chain[-1][1] + [entry_id]]
+
+    operations = {}
+    for (collection, target), chain in chains.items():
+        ops = operations.setdefault(collection, [])
+        if (collection, target) in upserts:
+            # Create the document first, so the conditional updates can't insert it
+            ops.append(UpdateOne({'_id': target}, {'$setOnInsert': {APPLIED_FIELD: []}}, upsert=True))
+        for update, ids in chain:
+            ops.append(UpdateOne(
+                {'_id': target, APPLIED_FIELD: {'$nin': ids}},
+                dict(update, **{'$push': {APPLIED_FIELD: {'$each': ids}}})
+            ))
+    for collection, ops in operations.items():
+        # Ordered, so each document exists before its updates run, in entry order
+        db[collection].bulk_write(ops, ordered=True)
+
+    db.outbox.delete_many({'_id': {'$in': entry_ids}})
+    # Only after the delete: the entries can't be delivered again
+    touched = {}
+    for entry_id, collection, target, _, _ in effects:
+        touched.setdefault((collection, target), []).append(entry_id)
+    cleanup = {}
+    for (collection, target), ids in touched.items():
+        cleanup.setdefault(collection, []).append(UpdateOne({'_id': target}, {'$pull': {APPLIED_FIELD: {'$in': ids}}}))
+    for collection, ops in cleanup.items():
+        db[collection].bulk_write(ops, ordered=False)
+
+def _retry_later(db, entry, error):
+    attempts = entry.get('attempts', 1)
+    if attempts >= MAX_ATTEMPTS:
+        update = {'status': 'failed', 'last_error': str(error)}
+        print(f"Outbox entry {entry['_id']} ({entry['event']}) failed {attempts} times, parking it: {error}")
+    else:
+        delay = random.uniform(0.5, 1) * min(2 ** attempts, 600)
+        update = {
+            'status': 'pending',
+            'available_at': datetime.utcnow() + timedelta(seconds=delay),
+            'last_error': str(error)
+        }
+    db.outbox.update_one({'_id': entry['_id'], 'lease': entry['lease']}, {'$set': update, '$unset': {'locked_until': ''}})
+
+def process_batch(db, batch_size=BATCH_SIZE):
+    """Claim and apply one batch; returns the number of entries claimed"""
+    entries = claim(db, batch_size)
+    if not entries:
+        return 0
+    try:
+        apply(db, entries)
+    except Exception:
+        # Find the entries that fail on their own; the rest still go through
+        for entry in entries:
+            try:
+                apply(db, [entry])
+            except Exception as e:
+                _retry_later(db, entry, e)
+    return len(entries)
+
+def run_worker(stop=None, batch_size=BATCH_SIZE, poll_seconds=POLL_SECONDS, once=False):
+    db = get_database()
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        try:
+            claimed = process_batch(db, batch_size)
+        except Exception as e:
+            print(f"Outbox worker error: {e}")
+            claimed = 0
+        if claimed == batch_size:
+            continue
+        if once:
+            return
+        if _wakeup.wait(poll_seconds):
+            time.sleep(LINGER_SECONDS)
+        _wakeup.clear()
+
+_thread = None
+_thread_lock = threading.Lock()
+
+def start_worker_thread():
+    """Start this process's worker thread once, unless OUTBOX_WORKER=off"""
+    global _thread
+    if WORKER_MODE == 'off':
+        return
+    with _thread_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=run_worker, name='outbox-worker', daemon=True)
+            _thread.start()
+
+def retry_failed(db):
+    result = db.outbox.update_many(
+        {'status': 'failed'},
+        {'$set': {'status': 'pending', 'attempts': 0, 'available_at': datetime.utcnow()}}
+    )
+    print(f"Requeued {result.modified_count} failed outbox entries")
+
+def _worker_process(batch_size, once):
+    run_worker(batch_size=batch_size, once=once)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Apply booking side effects queued in the outbox')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Entries claimed per batch')
+    parser.add_argument('--once', action='store_true', help='Exit once the queue is drained')
+    parser.add_argument('--retry-failed', action='store_true', help='Requeue failed entries and exit')
+    args = parser.parse_args()
+
+    if args.retry_failed:
+        retry_failed(get_database())
+    elif args.workers == 1:
+        run_worker(batch_size=args.batch_size, once=args.once)
+    else:
+        processes = [
+            multiprocessing.Process(target=_worker_process, args=(args.batch_size, args.once))
+            for _ in range(args.workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
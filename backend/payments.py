@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Payments ledger and client balances.
+
+Every payment a client makes is an append-only document in `payments`,
+indexed by client and date. A client's `payment` keeps running totals that are
+updated with `$inc` as each payment is recorded, never recomputed by hand:
+the increment only applies while `remaining` covers the amount, so concurrent
+instalments can't overpay a plot. Payments taken with a new booking go in the
+ledger too, so `cash`, `cheque` and `remaining` can always be derived from it.
+
+The ledger entry is written before the balance, so a crash in between leaves
+the ledger right and the balance behind. The verification job recomputes
+balances from the ledger in batches of clients and reports (or with `--fix`
+corrects) any that disagree, leaving alone clients created or paid within
+PAYMENTS_VERIFY_GRACE_SECONDS, which may still have writes in flight. Clients
+created before the ledger have no entries at all; they are reported, never
+zeroed, until `--backfill` records their current totals as opening entries.
+
+Usage:
+    python payments.py [--fix] [--batch-size 1000]    # verify balances against the ledger
+    python payments.py --backfill                     # opening entries for clients without any
+"""
+
+import argparse
+import os
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument, UpdateOne
+
+from database import get_database
+from ids import encode_id, id_created_at
+from models import Payment, PAYMENT_METHODS
+from outbox import enqueue
+from resilience import insert_with_retry
+from rollups import rebuild_rollups
+
+BATCH_SIZE = int(os.getenv('PAYMENTS_BATCH_SIZE', 1000))
+VERIFY_GRACE_SECONDS = int(os.getenv('PAYMENTS_VERIFY_GRACE_SECONDS', 300))
+
+def opening_entries(client, source, paid_at=None, recorded_by=None):
+    """Ledger entries for the cash and cheque already on a client's `payment`"""
+    payment = client.get('payment') or {}
+    return [
+        Payment(
+            client_id=encode_id(client['_id']),
+            property_id=client.get('project_id'),
+            amount=payment[method],
+            method=method,
+            paid_at=paid_at or id_created_at(client['_id']),
+            recorded_by=recorded_by,
+            source=source
+        ).to_dict()
+        for method in PAYMENT_METHODS
+        if payment.get(method)
+    ]
+
+def record_payment(db, client, amount, method, paid_at=None, reference='', recorded_by=None):
+    """Add an instalment to the ledger and take it off the client's balance.
+
+    Returns (payment, client payment, client status), or None without
+    recording anything if the amount exceeds what the client still owes.
+    """
+    payment = Payment(
+        client_id=encode_id(client['_id']),
+        property_id=client.get('project_id'),
+        amount=amount,
+        method=method,
+        paid_at=paid_at,
+        recorded_by=recorded_by,
+        reference=reference
+    ).to_dict()
+    insert_with_retry(db.payments, payment)
+
+    updated = db.clients.find_one_and_update(
+        {'_id': client['_id'], 'payment.remaining': {'$gte': amount}},
+        {'$inc': {f'payment.{method}': amount, 'payment.remaining': -amount}},
+        projection={'payment': 1, 'status': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if updated is None:
+        db.payments.delete_one({'_id': payment['_id']})
+        return None
+
+    status = updated.get('status')
+    if status == 'ongoing' and updated['payment']['remaining'] <= 0:
+        db.clients.update_one(
+            {'_id': client['_id'], 'status': 'ongoing', 'payment.remaining': {'$lte': 0}},
+            {'$set': {'status': 'completed'}}
+        )
+        status = 'completed'
+
+    # The rollups can always be rebuilt, so a failure here must not fail the payment
+    try:
+        enqueue(db, 'payment.recorded', {
+            'property_id': payment['property_id'],
+            'method': method,
+            'amount': amount
+        })
+    except Exception as e:
+        print(f"Failed to queue side effects for payment {payment['_id']}: {e}")
+
+    return payment, updated['payment'], status
+
+def _client_batches(db, batch_size, projection):
+    last_id = None
+    while True:
+        query = {'_id': {'$gt': last_id}} if last_id is not None else {}
+        batch = list(db.clients.find(query, projection).sort('_id', 1).limit(batch_size))
+        if not batch:
+            return
+        yield batch
+        last_id = batch[-1]['_id']
+        if len(batch) < batch_size:
+            return
+
+def ledger_totals(db, client_ids):
+    """Encoded client id -> {'cash', 'cheque', 'last_recorded_at'} from the ledger"""
+    totals = {}
+    groups = db.payments.aggregate([
+        {'$match': {'client_id': {'$in': client_ids}}},
+        {'$group': {
+            '_id': {'client_id': '$client_id', 'method': '$method'},
+            'amount': {'$sum': '$amount'},
+            'last_recorded_at': {'$max': '$recorded_at'}
+        }}
+    ])
+    for group in groups:
+        client_totals = totals.setdefault(group['_id']['client_id'], {
+            **{method: 0 for method in PAYMENT_METHODS},
+            'last_recorded_at': datetime.min
+        })
+        client_totals[group['_id']['method']] += group['amount']
+        client_totals['last_recorded_at'] = max(client_totals['last_recorded_at'], group['last_recorded_at'])
+    return totals
+
+def verify_balances(db=None, fix=False, batch_size=BATCH_SIZE):
+    """Compare every client's payment totals with the ledger; returns (checked, mismatched, fixed)"""
+    db = db or get_database()
+    checked = mismatched = fixed = 0
+    settled_before = datetime.utcnow() - timedelta(seconds=VERIFY_GRACE_SECONDS)
+
+    for batch in _client_batches(db, batch_size, {'payment': 1}):
+        totals = ledger_totals(db, [encode_id(client['_id']) for client in batch])
+        operations = []
+        for client in batch:
+            payment = client.get('payment') or {}
+            ledger = totals.get(encode_id(client['_id']), {method: 0 for method in PAYMENT_METHODS})
+            expected = {method: ledger[method] for method in PAYMENT_METHODS}
+            expected['remaining'] = payment.get('total', 0) - sum(expected.values())
+            current = {field: payment.get(field, 0) for field in expected}
+            if current == expected:
+                continue
+
+            mismatched += 1
+            if encode_id(client['_id']) not in totals:
+                # Never zero a balance the ledger knows nothing about
+                print(f"Client {encode_id(client['_id'])}: balance {current}, no ledger entries (run --backfill)")
+                continue
+            print(f"Client {encode_id(client['_id'])}: balance {current}, ledger {expected}")
+            # A client created or paid within the grace window may still have writes in flight
+            last_write = max(ledger['last_recorded_at'], id_created_at(client['_id']) or datetime.min)
+            if fix and last_write < settled_before:
+                # Only if no payment has changed the balance since it was read
+                operations.append(UpdateOne(
+                    {'_id': client['_id'], **{f'payment.{field}': value for field, value in current.items()}},
+                    {'$set': {f'payment.{field}': value for field, value in expected.items()}}
+                ))
+        if operations:
+            fixed += db.clients.bulk_write(operations, ordered=False).modified_count
+        checked += len(batch)
+
+    print(f"Checked {checked} clients: {mismatched} disagree with the ledger, {fixed} fixed")
+    if fixed:
+        # Property collection totals come from client balances
+        rebuild_rollups(db)
+    return checked, mismatched, fixed
+
+def backfill_opening(db=None, batch_size=BATCH_SIZE):
+    """Record the current totals of clients with no ledger entries as opening entries"""
+    db = db or get_database()
+    created = 0
+    for batch in _client_batches(db, batch_size, {'payment': 1, 'project_id': 1}):
+        has_entries = set(db.payments.distinct(
+            'client_id', {'client_id': {'$in': [encode_id(client['_id']) for client in batch]}}
+        ))
+        entries = [
+            entry
+            for client in batch if encode_id(client['_id']) not in has_entries
+            for entry in opening_entries(client, 'opening')
+        ]
+        if entries:
+            db.payments.insert_many(entries, ordered=False)
+            created += len(entries)
+    print(f"Created {created} opening payment entries")
+    return created
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Verify client balances against the payments ledger')
+    parser.add_argument('--fix', action='store_true', help='Correct balances that disagree with the ledger')
+    parser.add_argument('--backfill', action='store_true', help='Add opening entries for clients without any and exit')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Clients checked per batch')
+    args = parser.parse_args()
+
+    if args.backfill:
+        backfill_opening(batch_size=args.batch_size)
+    else:
+        verify_balances(fix=args.fix, batch_size=args.batch_size)
@@ -1,10 +1,27 @@
-from flask import Blueprint, request, jsonify, session
-from database import get_database
-from models import Property
-from bson import ObjectId
+from flask import Blueprint, Response, current_app, request, jsonify, session, stream_with_context
+from database import get_database, DATA_BACKEND
+from models import Property, ValidationError
+from rollups import record_property_plots
+from ids import decode_id, encode_id
+from concurrency import parse_if_match, version_filter, set_version_etag
+from pymongo import ReturnDocument
+from cache import property_cache
+from multiget import parse_id_list, invalid_ids, fetch_by_ids
+from changefeed import read_changes, record_tombstone, timestamp, TokenExpired
+from pubsub import get_broker, stream_topic, SubscriberLimitReached, RECONNECT_MILLISECONDS
+from singleflight import SingleFlight
+from suggest import suggest_index, MAX_SUGGESTIONS
+from facets import parse_filters, facet_stage, format_facets, catalogue_facets
+from geo import near_pipeline, grid_index, DEFAULT_RADIUS_KM, MAX_RADIUS_KM
+from resilience import is_unavailable
+from metrics import metrics
 
 properties_bp = Blueprint('properties', __name__)
 
+# Identical concurrent reads in this worker share one database fetch
+list_flight = SingleFlight('properties.list')
+detail_flight = SingleFlight('properties.detail')
+
 @properties_bp.route('/', methods=['GET'])
 def get_properties():
     try:
@@ -16,42 +33,210 @@ def get_properties():
         limit = int(request.args.get('limit', 10))
         search = request.args.get('search', '')
         
+        with_facets = request.args.get('facets', '').lower() in ('1', 'true')
+        
+        try:
+            filters = parse_filters(request.args)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
         # Build query
-        query = {}
+        query = dict(filters)
         if search:
-            query = {
-                '$or': [
-                    {'name': {'$regex': search, '$options': 'i'}},
-                    {'address.city': {'$regex': search, '$options': 'i'}},
-                    {'address.area': {'$regex': search, '$options': 'i'}},
-                    {'specification': {'$regex': search, '$options': 'i'}}
-                ]
-            }
+            query['$or'] = [
+                {'name': {'$regex': search, '$options': 'i'}},
+                {'address.city': {'$regex': search, '$options': 'i'}},
+                {'address.area': {'$regex': search, '$options': 'i'}},
+                {'specification': {'$regex': search, '$options': 'i'}}
+            ]
         
         # Calculate skip value
         skip = (page - 1) * limit
         
-        # Get properties with pagination
-        properties_cursor = properties_collection.find(query).skip(skip).limit(limit)
-        properties = []
+        def fetch():
+            facets = None
+            if with_facets and query:
+                # Page, total and facet counts for the filtered set in one round trip
+                result = next(properties_collection.aggregate([{'$match': query}, facet_stage(skip, limit)]))
+                properties = result['results']
+                total_count = result['total'][0]['count'] if result['total'] else 0
+                facets = format_facets(result)
+            else:
+                # Get properties with pagination
+                properties = list(properties_collection.find(query).skip(skip).limit(limit))
+                
+                # Get total count
+                total_count = properties_collection.count_documents(query)
+                
+                if with_facets:
+                    catalogue_facets.refresh(db)
+                    facets = catalogue_facets.snapshot()
+            
+            for prop_data in properties:
+                prop_data['_id'] = encode_id(prop_data['_id'])
+            
+            payload = {
+                'success': True,
+                'properties': properties,
+                'pagination': {
+                    'current_page': page,
+                    'total_pages': (total_count + limit - 1) // limit,
+                    'total_count': total_count,
+                    'has_next': skip + limit < total_count,
+                    'has_prev': page > 1
+                }
+            }
+            if facets is not None:
+                payload['facets'] = facets
+            
+            # Serialized once and shared by every coalesced request
+            return current_app.json.dumps(payload)
+        
+        key = (page, limit, search, with_facets, tuple(sorted((k, str(v)) for k, v in filters.items())))
+        body = list_flight.do(key, fetch)
+        return current_app.response_class(body, mimetype='application/json')
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching properties'
+        }), 500
+
+@properties_bp.route('/changes', methods=['GET'])
+def get_property_changes():
+    try:
+        limit = min(int(request.args.get('limit', 500)), 1000)
+        
+        db = get_database()
         
-        for prop_data in properties_cursor:
-            prop_data['_id'] = str(prop_data['_id'])
-            properties.append(prop_data)
+        try:
+            properties, deleted_ids, next_token, has_more = read_changes(db, request.args.get('since'), limit)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        except TokenExpired:
+            return jsonify({
+                'success': False,
+                'error': 'Sync token has expired, start a full sync without since'
+            }), 410
         
-        # Get total count
-        total_count = properties_collection.count_documents(query)
+        for prop_data in properties:
+            prop_data['_id'] = encode_id(prop_data['_id'])
         
         return jsonify({
             'success': True,
             'properties': properties,
-            'pagination': {
-                'current_page': page,
-                'total_pages': (total_count + limit - 1) // limit,
-                'total_count': total_count,
-                'has_next': skip + limit < total_count,
-                'has_prev': page > 1
-            }
+            'deleted_ids': deleted_ids,
+            'next_token': next_token,
+            'has_more': has_more
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching property changes'
+        }), 500
+
+@properties_bp.route('/suggest', methods=['GET'])
+def suggest_properties():
+    try:
+        query = request.args.get('q', '')
+        limit = min(int(request.args.get('limit', 10)), MAX_SUGGESTIONS)
+        
+        suggest_index.refresh(get_database())
+        
+        return jsonify({
+            'success': True,
+            'suggestions': suggest_index.search(query, limit)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching suggestions'
+        }), 500
+
+@properties_bp.route('/near', methods=['GET'])
+def get_properties_near():
+    try:
+        try:
+            lat = float(request.args['lat'])
+            lng = float(request.args['lng'])
+            radius = float(request.args.get('radius', DEFAULT_RADIUS_KM))
+            limit = min(int(request.args.get('limit', 20)), 100)
+        except (KeyError, ValueError):
+            return jsonify({
+                'success': False,
+                'error': 'lat and lng are required; lat, lng and radius (km) must be numbers'
+            }), 400
+        
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180) or not 0 < radius <= MAX_RADIUS_KM or limit < 1:
+            return jsonify({
+                'success': False,
+                'error': f'Coordinates out of range, or radius not between 0 and {MAX_RADIUS_KM} km'
+            }), 400
+        
+        db = get_database()
+        
+        if DATA_BACKEND == 'memory':
+            # No geo operators in the in-memory backend; use the grid index
+            grid_index.refresh(db)
+            nearest = grid_index.search(lat, lng, radius, limit)
+            documents, _ = fetch_by_ids(db.properties, [property_id for property_id, _ in nearest], cache=property_cache)
+            by_id = {doc['_id']: doc for doc in documents}
+            properties = [
+                dict(by_id[property_id], distance_km=round(distance, 3))
+                for property_id, distance in nearest if property_id in by_id
+            ]
+        else:
+            properties = []
+            for prop_data in db.properties.aggregate(near_pipeline(lat, lng, radius, limit)):
+                prop_data['_id'] = encode_id(prop_data['_id'])
+                prop_data['distance_km'] = round(prop_data.pop('distance') / 1000, 3)
+                properties.append(prop_data)
+        
+        return jsonify({
+            'success': True,
+            'properties': properties
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while searching nearby properties'
+        }), 500
+
+@properties_bp.route('/batch', methods=['GET', 'POST'])
+def get_properties_batch():
+    try:
+        try:
+            ids = parse_id_list(request)
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        invalid = invalid_ids(ids)
+        if invalid:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid property ID',
+                'invalid_ids': invalid
+            }), 400
+        
+        db = get_database()
+        properties, missing = fetch_by_ids(db.properties, ids, cache=property_cache)
+        
+        return jsonify({
+            'success': True,
+            'properties': properties,
+            'missing_ids': missing
         })
         
     except Exception as e:
@@ -60,38 +245,122 @@ def get_properties():
             'error': 'An error occurred while fetching properties'
         }), 500
 
+def load_property(properties_collection, object_id):
+    """Fetch a property and cache it under its encoded ID"""
+    property_data = properties_collection.find_one({'_id': object_id})
+    if property_data:
+        property_data['_id'] = encode_id(property_data['_id'])
+        property_cache.set(property_data['_id'], property_data)
+    return property_data
+
 @properties_bp.route('/<property_id>', methods=['GET'])
 def get_property(property_id):
     try:
         db = get_database()
         properties_collection = db.properties
         
-        # Validate ObjectId
-        if not ObjectId.is_valid(property_id):
+        # Decode and validate ID
+        object_id = decode_id(property_id)
+        if object_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid property ID'
             }), 400
         
-        property_data = properties_collection.find_one({'_id': ObjectId(property_id)})
+        property_data = property_cache.get(property_id)
+        
+        if property_data is None:
+            property_data = detail_flight.do(property_id, lambda: load_property(properties_collection, object_id))
+            
+            if not property_data:
+                return jsonify({
+                    'success': False,
+                    'error': 'Property not found'
+                }), 404
+        
+        response = jsonify({
+            'success': True,
+            'property': property_data
+        })
+        return set_version_etag(response, property_data)
         
+    except Exception as e:
+        # With the database down, an expired cache entry beats an error page
+        stale = property_cache.get_stale(property_id) if is_unavailable(e) else None
+        if stale is not None:
+            metrics.incr('resilience.stale_served')
+            response = jsonify({
+                'success': True,
+                'property': stale,
+                'stale': True
+            })
+            response.headers['Warning'] = '110 - "Response is Stale"'
+            return set_version_etag(response, stale)
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching property details'
+        }), 500
+
+@properties_bp.route('/<property_id>/plots/stream', methods=['GET'])
+def stream_plot_availability(property_id):
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required'
+            }), 401
+        
+        object_id = decode_id(property_id)
+        if object_id is None:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid property ID'
+            }), 400
+        
+        db = get_database()
+        property_data = db.properties.find_one({'_id': object_id}, {'total_plots': 1})
         if not property_data:
             return jsonify({
                 'success': False,
                 'error': 'Property not found'
             }), 404
         
-        property_data['_id'] = str(property_data['_id'])
-        
-        return jsonify({
-            'success': True,
-            'property': property_data
-        })
+        try:
+            subscription = get_broker().subscribe(property_id)
+        except SubscriberLimitReached:
+            response = jsonify({
+                'success': False,
+                'error': 'Too many live connections, try again shortly'
+            })
+            response.headers['Retry-After'] = str(RECONNECT_MILLISECONDS // 1000)
+            return response, 503
+        
+        # Subscribed first, so a booking made while reading the snapshot is still pushed
+        try:
+            taken = db.bookings.find(
+                {'property_id': property_id, 'status': {'$in': ['pending', 'confirmed']}},
+                {'_id': 0, 'plot_number': 1, 'status': 1}
+            )
+            snapshot = {
+                'property_id': property_id,
+                'total_plots': property_data.get('total_plots'),
+                'plots': list(taken)
+            }
+        except Exception:
+            get_broker().unsubscribe(subscription)
+            raise
+        
+        return Response(
+            stream_with_context(stream_topic(subscription, snapshot)),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
         
     except Exception as e:
         return jsonify({
             'success': False,
-            'error': 'An error occurred while fetching property details'
+            'error': 'An error occurred while opening the availability stream'
         }), 500
 
 @properties_bp.route('/', methods=['POST'])
@@ -104,16 +373,14 @@ def create_property():
                 'error': 'Authentication required'
             }), 401
         
-        data = request.get_json()
-        
         # Validate required fields
-        required_fields = ['name', 'rera_number', 'address', 'specification', 'rate', 'total_plots', 'description']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'error': f'{field} is required'
-                }), 400
+        try:
+            data = Property.schema.validate(request.get_json())
+        except ValidationError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
         
         db = get_database()
         properties_collection = db.properties
@@ -126,22 +393,17 @@ def create_property():
             }), 409
         
         # Create property
-        property_obj = Property(
-            name=data['name'],
-            rera_number=data['rera_number'],
-            address=data['address'],
-            specification=data['specification'],
-            rate=data['rate'],
-            total_plots=data['total_plots'],
-            description=data['description'],
-            map_url=data.get('map_url', '')
-        )
+        property_obj = Property(**data, updated_at=timestamp())
         
-        result = properties_collection.insert_one(property_obj.to_dict())
+        property_doc = property_obj.to_dict()
+        result = properties_collection.insert_one(property_doc)
+        suggest_index.invalidate()
+        grid_index.invalidate()
+        catalogue_facets.apply(new=property_doc)
         
         return jsonify({
             'success': True,
-            'property_id': str(result.inserted_id),
+            'property_id': encode_id(result.inserted_id),
             'message': 'Property created successfully'
         }), 201
         
@@ -161,43 +423,84 @@ def update_property(property_id):
                 'error': 'Authentication required'
             }), 401
         
-        # Validate ObjectId
-        if not ObjectId.is_valid(property_id):
+        # Decode and validate ID
+        object_id = decode_id(property_id)
+        if object_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid property ID'
             }), 400
         
-        data = request.get_json()
+        try:
+            update_data = Property.schema.validate(request.get_json(), partial=True)
+        except ValidationError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        try:
+            expected_version = parse_if_match(request.headers.get('If-Match'))
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'If-Match must be a version ETag'
+            }), 400
+        
+        if not update_data:
+            return jsonify({
+                'success': False,
+                'error': 'No valid fields to update'
+            }), 400
         
         db = get_database()
         properties_collection = db.properties
         
-        # Check if property exists
-        if not properties_collection.find_one({'_id': ObjectId(property_id)}):
+        # Update and fetch in one round trip; If-Match turns it into a compare-and-set
+        query = {'_id': object_id}
+        if expected_version is not None:
+            query.update(version_filter(expected_version))
+        
+        changes = dict(update_data, updated_at=timestamp())
+        # The previous document is needed to move facet counts; the updated one
+        # is derived from it, since only top-level fields are set
+        previous = properties_collection.find_one_and_update(
+            query,
+            {'$set': changes, '$inc': {'version': 1}},
+            return_document=ReturnDocument.BEFORE
+        )
+        
+        if not previous:
+            if expected_version is not None and properties_collection.count_documents({'_id': object_id}, limit=1):
+                return jsonify({
+                    'success': False,
+                    'error': 'Property was modified by another request'
+                }), 412
             return jsonify({
                 'success': False,
                 'error': 'Property not found'
             }), 404
         
-        # Update property
-        update_data = {k: v for k, v in data.items() if k != '_id'}
+        if 'total_plots' in update_data:
+            record_property_plots(db, property_id, update_data['total_plots'])
         
-        result = properties_collection.update_one(
-            {'_id': ObjectId(property_id)},
-            {'$set': update_data}
-        )
+        property_data = dict(previous, **changes, version=previous.get('version', 0) + 1)
+        catalogue_facets.apply(previous, property_data)
         
-        if result.modified_count > 0:
-            return jsonify({
-                'success': True,
-                'message': 'Property updated successfully'
-            })
-        else:
-            return jsonify({
-                'success': True,
-                'message': 'No changes made to property'
-            })
+        if 'name' in update_data or 'address' in update_data:
+            suggest_index.invalidate()
+        if 'location' in update_data:
+            grid_index.invalidate()
+        
+        property_data['_id'] = encode_id(property_data['_id'])
+        property_cache.set(property_data['_id'], property_data)
+        
+        response = jsonify({
+            'success': True,
+            'property': property_data,
+            'message': 'Property updated successfully'
+        })
+        return set_version_etag(response, property_data)
         
     except Exception as e:
         return jsonify({
@@ -215,8 +518,9 @@ def delete_property(property_id):
                 'error': 'Authentication required'
             }), 401
         
-        # Validate ObjectId
-        if not ObjectId.is_valid(property_id):
+        # Decode and validate ID
+        object_id = decode_id(property_id)
+        if object_id is None:
             return jsonify({
                 'success': False,
                 'error': 'Invalid property ID'
@@ -225,9 +529,19 @@ def delete_property(property_id):
         db = get_database()
         properties_collection = db.properties
         
-        result = properties_collection.delete_one({'_id': ObjectId(property_id)})
-        
-        if result.deleted_count > 0:
+        deleted = properties_collection.find_one_and_delete(
+            {'_id': object_id},
+            projection={'address': 1, 'rate': 1, 'total_plots': 1}
+        )
+        property_cache.delete(encode_id(object_id))
+        
+        if deleted:
+            # Leave a tombstone so synced clients learn about the delete
+            record_tombstone(db, object_id)
+            suggest_index.invalidate()
+            grid_index.invalidate()
+            catalogue_facets.apply(old=deleted)
+            
             return jsonify({
                 'success': True,
                 'message': 'Property deleted successfully'
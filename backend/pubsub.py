@@ -0,0 +1,196 @@
+"""
+Publish/subscribe for live plot availability.
+
+Booking writes publish plot state changes per property, and the SSE endpoint in
+properties.py streams them to subscribed browsers. Each subscriber gets a
+bounded queue: a consumer too slow to keep up is told to resync (fetch a fresh
+snapshot) rather than letting its queue grow without limit.
+
+PUBSUB_BACKEND selects how events reach subscribers:
+
+- `local` (default): fan out within this worker only. Enough for a single
+  process, and the stand-in for development and the in-memory data backend.
+- `mongo`: events go through a capped collection that every worker tails, so
+  subscribers see bookings made on any worker.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid
+
+PUBSUB_BACKEND = os.getenv('PUBSUB_BACKEND', 'local')
+MAX_SUBSCRIBERS = int(os.getenv('SSE_MAX_SUBSCRIBERS', 200))
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv('SSE_QUEUE_SIZE', 100))
+HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+RECONNECT_MILLISECONDS = 3000
+
+EVENTS_COLLECTION = 'plot_events'
+EVENTS_COLLECTION_BYTES = 16 * 1024 * 1024
+
+class SubscriberLimitReached(Exception):
+    """This worker already serves MAX_SUBSCRIBERS streams"""
+
+class Subscription:
+    """A subscriber's bounded queue of messages for one topic"""
+
+    def __init__(self, topic, maxsize):
+        self.topic = topic
+        self.overflowed = False
+        self._queue = queue.Queue(maxsize)
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            # Dropping a message would leave the client with a wrong picture,
+            # so mark it for a resync instead
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Next message, or None if nothing arrived within `timeout` seconds"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class LocalBroker:
+    """Fans messages out to subscribers in this worker"""
+
+    def __init__(self, max_subscribers=MAX_SUBSCRIBERS, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self._topics = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic):
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise SubscriberLimitReached()
+            subscription = Subscription(topic, self.queue_size)
+            self._topics.setdefault(topic, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._topics.get(subscription.topic)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                self._count -= 1
+                if not subscribers:
+                    del self._topics[subscription.topic]
+
+    def subscriber_count(self):
+        return self._count
+
+    def deliver(self, topic, message):
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            subscription.put(message)
+
+    def publish(self, topic, message):
+        self.deliver(topic, message)
+
+class MongoBroker(LocalBroker):
+    """Shares events between workers through a capped collection.
+
+    Each worker runs one thread tailing the collection and delivering new
+    events to its local subscribers, including events it published itself.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(**kwargs)
+        try:
+            db.create_collection(EVENTS_COLLECTION, capped=True, size=EVENTS_COLLECTION_BYTES)
+        except CollectionInvalid:
+            pass  # Already created by another worker
+        self._events = db[EVENTS_COLLECTION]
+        self._tailer = threading.Thread(target=self._tail, name='plot-events-tailer', daemon=True)
+        self._tailer.start()
+
+    def publish(self, topic, message):
+        self._events.insert_one({'topic': topic, 'message': message})
+
+    def _tail(self):
+        # Only events published after this worker started are of interest
+        latest = self._events.find_one(sort=[('$natural', -1)])
+        last_id = latest['_id'] if latest else None
+
+        while True:
+            try:
+                query = {'_id': {'$gt': last_id}} if last_id else {}
+                cursor = self._events.find(query, cursor_type=CursorType.TAILABLE_AWAIT)
+                while cursor.alive:
+                    for event in cursor:
+                        last_id = event['_id']
+                        self.deliver(event['topic'], event['message'])
+            except Exception as e:
+                print(f"Plot event tailer error: {e}")
+            # A tailable cursor on an empty collection dies immediately
+            time.sleep(1)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                if PUBSUB_BACKEND == 'mongo':
+                    from database import get_database
+                    _broker = MongoBroker(get_database())
+                else:
+                    _broker = LocalBroker()
+    return _broker
+
+def publish_plot_change(property_id, plot_number, status, booking_id):
+    """Tell subscribers of `property_id` that a plot changed state.
+
+    Subscribers can always resync from bookings, so failures are only logged.
+    """
+    message = {
+        'property_id': property_id,
+        'plot_number': plot_number,
+        'status': status,
+        'booking_id': booking_id,
+        'at': datetime.utcnow().isoformat()
+    }
+    try:
+        get_broker().publish(property_id, message)
+    except Exception as e:
+        print(f"Failed to publish plot change for property {property_id}: {e}")
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def stream_topic(subscription, snapshot, heartbeat=HEARTBEAT_SECONDS):
+    """Yield SSE frames: the snapshot, then messages, with heartbeats while idle.
+
+    `subscription` must be taken before `snapshot` is read so no change falls
+    between the two. The caller's broker subscription is released when the
+    client disconnects.
+    """
+    broker = get_broker()
+    try:
+        yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+        yield sse_event('snapshot', snapshot)
+        while True:
+            message = subscription.get(timeout=heartbeat)
+            if subscription.overflowed:
+                yield sse_event('resync', {'reason': 'Subscriber fell behind'})
+                return
+            if message is None:
+                yield ': heartbeat\n\n'
+            else:
+                yield sse_event('plot', message)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,206 @@
+from flask import Blueprint, request, jsonify, session
+from database import get_database
+from ids import encode_id
+
+reports_bp = Blueprint('reports', __name__)
+
+def _format_property_rollup(rollup):
+    sold = rollup.get('plots_sold', 0)
+    pending = rollup.get('plots_pending', 0)
+    total_plots = rollup.get('total_plots', 0)
+    return {
+        'property_id': rollup['_id'],
+        'total_plots': total_plots,
+        'plots_sold': sold,
+        'plots_pending': pending,
+        'plots_free': max(total_plots - sold - pending, 0),
+        'bookings': rollup.get('bookings', 0),
+        'revenue': rollup.get('revenue', 0),
+        'payments': {
+            'cash': rollup.get('cash', 0),
+            'cheque': rollup.get('cheque', 0),
+            'remaining': rollup.get('remaining', 0)
+        },
+        'updated_at': rollup.get('updated_at')
+    }
+
+def _format_employee_rollup(rollup):
+    return {
+        'employee_id': rollup['_id'],
+        'bookings': rollup.get('bookings', 0),
+        'confirmed': rollup.get('confirmed', 0),
+        'revenue': rollup.get('revenue', 0),
+        'updated_at': rollup.get('updated_at')
+    }
+
+@reports_bp.route('/properties', methods=['GET'])
+def get_property_reports():
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required'
+            }), 401
+
+        db = get_database()
+        rollups = [_format_property_rollup(r) for r in db.property_rollups.find()]
+
+        return jsonify({
+            'success': True,
+            'properties': rollups
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching property reports'
+        }), 500
+
+@reports_bp.route('/properties/<property_id>', methods=['GET'])
+def get_property_report(property_id):
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required'
+            }), 401
+
+        db = get_database()
+        rollup = db.property_rollups.find_one({'_id': property_id})
+
+        if not rollup:
+            return jsonify({
+                'success': False,
+                'error': 'No report available for this property'
+            }), 404
+
+        return jsonify({
+            'success': True,
+            'report': _format_property_rollup(rollup)
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching property report'
+        }), 500
+
+@reports_bp.route('/employees', methods=['GET'])
+def get_employee_reports():
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required'
+            }), 401
+
+        db = get_database()
+
+        # League table order: highest revenue first
+        sort_field = request.args.get('sort', 'revenue')
+        if sort_field not in ['revenue', 'bookings', 'confirmed']:
+            sort_field = 'revenue'
+
+        rollups = [
+            _format_employee_rollup(r)
+            for r in db.employee_rollups.find().sort(sort_field, -1)
+        ]
+
+        return jsonify({
+            'success': True,
+            'employees': rollups
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching employee reports'
+        }), 500
+
+@reports_bp.route('/employees/<employee_id>', methods=['GET'])
+def get_employee_report(employee_id):
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required'
+            }), 401
+
+        db = get_database()
+        rollup = db.employee_rollups.find_one({'_id': employee_id})
+
+        if not rollup:
+            return jsonify({
+                'success': False,
+                'error': 'No report available for this employee'
+            }), 404
+
+        return jsonify({
+            'success': True,
+            'report': _format_employee_rollup(rollup)
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching employee report'
+        }), 500
+
+@reports_bp.route('/outstanding', methods=['GET'])
+def get_outstanding_dues():
+    try:
+        user_id = session.get('user_id')
+        if not user_id:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required'
+            }), 401
+
+        db = get_database()
+
+        page = int(request.args.get('page', 1))
+        limit = int(request.args.get('limit', 10))
+        property_id = request.args.get('property_id', '')
+        skip = (page - 1) * limit
+
+        # Balances are kept current by the payments ledger, so this is a range
+        # scan of the payment.remaining indexes rather than a pass over clients
+        query = {'payment.remaining': {'$gt': 0}}
+        if property_id:
+            query['project_id'] = property_id
+
+        clients = list(
+            db.clients.find(query, {'name': 1, 'phone_number': 1, 'project_id': 1, 'plot_number': 1, 'payment': 1})
+            .sort('payment.remaining', -1).skip(skip).limit(limit)
+        )
+        for client in clients:
+            client['_id'] = encode_id(client['_id'])
+
+        totals = next(db.clients.aggregate([
+            {'$match': query},
+            {'$group': {'_id': None, 'clients': {'$sum': 1}, 'remaining': {'$sum': '$payment.remaining'}}}
+        ]), {'clients': 0, 'remaining': 0})
+        total_count = totals['clients']
+
+        return jsonify({
+            'success': True,
+            'clients': clients,
+            'total_remaining': totals['remaining'],
+            'pagination': {
+                'current_page': page,
+                'total_pages': (total_count + limit - 1) // limit,
+                'total_count': total_count,
+                'has_next': skip + limit < total_count,
+                'has_prev': page > 1
+            }
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': 'An error occurred while fetching outstanding dues'
+        }), 500
@@ -0,0 +1,156 @@
+"""
+Retries and a circuit breaker for MongoDB calls made while serving requests.
+
+Idempotent reads that fail with a connection error (for example during a
+primary election) are retried with jittered exponential backoff, never past
+the request's deadline. Writes aren't retried here: the client uses MongoDB's
+retryable writes, and `insert_with_retry` covers inserts whose `_id` is set
+by the application.
+
+Every call reports to a shared circuit breaker. After BREAKER_FAILURES
+consecutive connection failures it opens, and for BREAKER_RESET_SECONDS calls
+fail immediately with CircuitOpen instead of piling up threads on a dead
+server; then a single trial call decides whether it closes again. app.py
+answers requests that failed this way with 503 and Retry-After.
+"""
+
+import os
+import random
+import threading
+import time
+
+from flask import g, has_request_context
+from pymongo.errors import ConnectionFailure, DuplicateKeyError, NetworkTimeout
+
+from metrics import metrics
+
+RETRY_ATTEMPTS = int(os.getenv('DB_RETRY_ATTEMPTS', 3))
+RETRY_BASE_DELAY = float(os.getenv('DB_RETRY_BASE_DELAY', 0.05))
+RETRY_MAX_DELAY = float(os.getenv('DB_RETRY_MAX_DELAY', 1))
+BREAKER_FAILURES = int(os.getenv('BREAKER_FAILURES', 5))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', 10))
+
+class CircuitOpen(ConnectionFailure):
+    """The database is considered down; the call was not attempted"""
+
+def is_unavailable(error):
+    """True for errors meaning the database couldn't be reached (not timeouts)"""
+    return isinstance(error, ConnectionFailure) and not isinstance(error, NetworkTimeout)
+
+def _mark_unavailable():
+    if has_request_context():
+        g.database_unavailable = True
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'open' if time.monotonic() - self.opened_at < self.reset_seconds else 'half-open'
+
+    def retry_after(self):
+        if self.opened_at is None:
+            return 0
+        return max(1, int(self.reset_seconds - (time.monotonic() - self.opened_at) + 0.999))
+
+    def before_call(self):
+        """Raise CircuitOpen unless the call may go ahead"""
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return
+        metrics.incr('resilience.short_circuited')
+        raise CircuitOpen('Database circuit breaker is open')
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                print("Database reachable again, closing circuit breaker")
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.failures >= self.failure_threshold and (self.opened_at is None or self.state == 'half-open'):
+                self.opened_at = time.monotonic()
+                metrics.incr('resilience.circuit_opened')
+                print(f"Database failing ({self.failures} consecutive errors), opening circuit breaker")
+
+breaker = CircuitBreaker()
+
+def _backoff(attempt):
+    # Full jitter, so workers retrying together don't hit the server in waves
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+def call(fn, idempotent=False, remaining_ms=None):
+    """Run `fn` through the circuit breaker, retrying connection errors if idempotent.
+
+    `remaining_ms` returns the milliseconds left before the request deadline
+    (or None), so backoff never sleeps past it.
+    """
+    attempts = RETRY_ATTEMPTS if idempotent else 1
+    for attempt in range(attempts):
+        try:
+            breaker.before_call()
+        except CircuitOpen:
+            _mark_unavailable()
+            raise
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_unavailable(e):
+                # The server answered (or timed out); that's not an outage
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            delay = _backoff(attempt)
+            left = remaining_ms() if remaining_ms else None
+            if attempt + 1 >= attempts or (left is not None and left < delay * 1000):
+                _mark_unavailable()
+                raise
+            metrics.incr('resilience.retries')
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+def insert_with_retry(collection, document):
+    """insert_one that can be retried safely because `_id` is set by the caller.
+
+    If an earlier attempt reached the server before the connection dropped,
+    the retry hits a duplicate `_id`, which means the insert already happened.
+    """
+    if '_id' not in document:
+        raise ValueError('insert_with_retry needs a document with an _id')
+
+    def insert():
+        try:
+            return collection.insert_one(document)
+        except DuplicateKeyError:
+            if collection.find_one({'_id': document['_id']}, {'_id': 1}) is None:
+                raise
+            return None
+
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            insert()
+            return document['_id']
+        except Exception as e:
+            if not is_unavailable(e) or isinstance(e, CircuitOpen) or attempt + 1 >= RETRY_ATTEMPTS:
+                raise
+            metrics.incr('resilience.retries')
+            time.sleep(_backoff(attempt))
@@ -0,0 +1,261 @@
+from database import get_database
+from archive import ARCHIVES
+from ids import encode_id, decode_id
+from pymongo import UpdateOne
+from datetime import datetime
+from itertools import chain
+
+# Booking status -> plot counter kept on the property rollup
+PLOT_COUNTERS = {
+    'pending': 'plots_pending',
+    'confirmed': 'plots_sold'
+}
+
+def _merge_increments(*increments):
+    merged = {}
+    for inc in increments:
+        for key, value in inc.items():
+            merged[key] = merged.get(key, 0) + value
+    return {k: v for k, v in merged.items() if v != 0}
+
+def _property_increments(status, amount, sign):
+    """Property counters for a booking entering (sign=1) or leaving (sign=-1) a status"""
+    inc = {}
+    counter = PLOT_COUNTERS.get(status)
+    if counter:
+        inc[counter] = sign
+    if status == 'confirmed':
+        inc['revenue'] = sign * amount
+    return inc
+
+def _employee_increments(status, amount, sign):
+    """Employee counters for a booking entering (sign=1) or leaving (sign=-1) a status"""
+    if status == 'confirmed':
+        return {'confirmed': sign, 'revenue': sign * amount}
+    return {}
+
+def _employee_document_updates(booking, status, sign):
+    """Denormalized counters on the employee document for a booking entering or leaving a status"""
+    if status == 'confirmed':
+        return {'$inc': {'total_sales': sign}}
+    return {}
+
+def _merge_updates(*updates):
+    merged = {}
+    for update in updates:
+        for op, fields in update.items():
+            if op == '$inc':
+                merged['$inc'] = _merge_increments(merged.get('$inc', {}), fields)
+            else:
+                merged.setdefault(op, {}).update(fields)
+    return {op: fields for op, fields in merged.items() if fields}
+
+def booking_created_updates(booking, total_plots=None, client_payment=None):
+    """Counter updates for a freshly inserted booking (and the payment of the client created with it).
+
+    Returns (collection, _id, update, upsert) tuples; `booking` holds its
+    booking_id, property_id, saled_by, status and amount.
+    """
+    now = datetime.utcnow()
+
+    property_inc = _merge_increments(
+        {'bookings': 1},
+        _property_increments(booking['status'], booking['amount'], 1)
+    )
+    if client_payment:
+        property_inc = _merge_increments(property_inc, {
+            'cash': client_payment.get('cash', 0),
+            'cheque': client_payment.get('cheque', 0),
+            'remaining': client_payment.get('remaining', 0)
+        })
+
+    property_set = {'updated_at': now}
+    if total_plots is not None:
+        property_set['total_plots'] = total_plots
+
+    updates = [('property_rollups', booking['property_id'], {'$inc': property_inc, '$set': property_set}, True)]
+
+    if booking.get('saled_by'):
+        employee_inc = _merge_increments(
+            {'bookings': 1},
+            _employee_increments(booking['status'], booking['amount'], 1)
+        )
+        updates.append(('employee_rollups', booking['saled_by'], {'$inc': employee_inc, '$set': {'updated_at': now}}, True))
+        employee_update = _employee_document_updates(booking, booking['status'], 1)
+        employee_id = decode_id(booking['saled_by'])
+        if employee_update and employee_id is not None:
+            updates.append(('employees', employee_id, employee_update, False))
+    return updates
+
+def booking_status_updates(booking, old_status, new_status):
+    """Counter updates moving a booking between statuses, in the format of booking_created_updates"""
+    if old_status == new_status:
+        return []
+
+    now = datetime.utcnow()
+    amount = booking.get('amount', 0)
+    updates = []
+
+    property_inc = _merge_increments(
+        _property_increments(old_status, amount, -1),
+        _property_increments(new_status, amount, 1)
+    )
+    if property_inc:
+        updates.append(('property_rollups', booking['property_id'], {'$inc': property_inc, '$set': {'updated_at': now}}, True))
+
+    if not booking.get('saled_by'):
+        return updates
+
+    employee_inc = _merge_increments(
+        _employee_increments(old_status, amount, -1),
+        _employee_increments(new_status, amount, 1)
+    )
+    if employee_inc:
+        updates.append(('employee_rollups', booking['saled_by'], {'$inc': employee_inc, '$set': {'updated_at': now}}, True))
+
+    employee_update = _merge_updates(
+        _employee_document_updates(booking, old_status, -1),
+        _employee_document_updates(booking, new_status, 1)
+    )
+    employee_id = decode_id(booking['saled_by'])
+    if employee_update and employee_id is not None:
+        updates.append(('employees', employee_id, employee_update, False))
+    return updates
+
+def payment_recorded_updates(property_id, method, amount):
+    """Collection counters for an instalment paid on a client of the property"""
+    return [('property_rollups', property_id, {
+        '$inc': {method: amount, 'remaining': -amount},
+        '$set': {'updated_at': datetime.utcnow()}
+    }, True)]
+
+def record_property_plots(db, property_id, total_plots):
+    """Keep the plot total on the rollup in step with the property document"""
+    db.property_rollups.update_one(
+        {'_id': property_id},
+        {'$set': {'total_plots': total_plots, 'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+
+def _empty_property_rollup(property_id):
+    return {
+        '_id': property_id,
+        'total_plots': 0,
+        'bookings': 0,
+        'plots_pending': 0,
+        'plots_sold': 0,
+        'revenue': 0,
+        'cash': 0,
+        'cheque': 0,
+        'remaining': 0
+    }
+
+def _empty_employee_rollup(employee_id):
+    return {
+        '_id': employee_id,
+        'bookings': 0,
+        'confirmed': 0,
+        'revenue': 0
+    }
+
+def rebuild_rollups(db=None):
+    """Recompute every rollup document from bookings, clients and properties"""
+    db = db or get_database()
+    now = datetime.utcnow()
+
+    property_rollups = {}
+    employee_rollups = {}
+
+    def property_rollup(property_id):
+        if property_id not in property_rollups:
+            property_rollups[property_id] = _empty_property_rollup(property_id)
+        return property_rollups[property_id]
+
+    def employee_rollup(employee_id):
+        if employee_id not in employee_rollups:
+            employee_rollups[employee_id] = _empty_employee_rollup(employee_id)
+        return employee_rollups[employee_id]
+
+    for prop_data in db.properties.find({}, {'total_plots': 1}):
+        property_rollup(encode_id(prop_data['_id']))['total_plots'] = prop_data.get('total_plots', 0)
+
+    # Archived bookings and clients still count towards the totals
+    bookings = (db.bookings, db[ARCHIVES['bookings']])
+    clients = (db.clients, db[ARCHIVES['clients']])
+
+    # Booking counters grouped by property and status
+    booking_groups = chain.from_iterable(collection.aggregate([
+        {'$group': {
+            '_id': {'property_id': '$property_id', 'status': '$status'},
+            'count': {'$sum': 1},
+            'amount': {'$sum': '$amount'}
+        }}
+    ]) for collection in bookings)
+    for group in booking_groups:
+        rollup = property_rollup(group['_id']['property_id'])
+        status = group['_id'].get('status')
+        rollup['bookings'] += group['count']
+        counter = PLOT_COUNTERS.get(status)
+        if counter:
+            rollup[counter] += group['count']
+        if status == 'confirmed':
+            rollup['revenue'] += group['amount']
+
+    # Collections grouped by project
+    payment_groups = chain.from_iterable(collection.aggregate([
+        {'$group': {
+            '_id': '$project_id',
+            'cash': {'$sum': '$payment.cash'},
+            'cheque': {'$sum': '$payment.cheque'},
+            'remaining': {'$sum': '$payment.remaining'}
+        }}
+    ]) for collection in clients)
+    for group in payment_groups:
+        rollup = property_rollup(group['_id'])
+        rollup['cash'] += group['cash']
+        rollup['cheque'] += group['cheque']
+        rollup['remaining'] += group['remaining']
+
+    # Employee counters grouped by seller and status
+    seller_groups = chain.from_iterable(collection.aggregate([
+        {'$match': {'saled_by': {'$ne': None}}},
+        {'$group': {
+            '_id': {'saled_by': '$saled_by', 'status': '$status'},
+            'count': {'$sum': 1},
+            'amount': {'$sum': '$amount'}
+        }}
+    ]) for collection in bookings)
+    for group in seller_groups:
+        rollup = employee_rollup(group['_id']['saled_by'])
+        rollup['bookings'] += group['count']
+        if group['_id'].get('status') == 'confirmed':
+            rollup['confirmed'] += group['count']
+            rollup['revenue'] += group['amount']
+
+    for collection, rollups in ((db.property_rollups, property_rollups), (db.employee_rollups, employee_rollups)):
+        operations = []
+        for rollup in rollups.values():
+            rollup['updated_at'] = now
+            fields = {k: v for k, v in rollup.items() if k != '_id'}
+            operations.append(UpdateOne({'_id': rollup['_id']}, {'$set': fields}, upsert=True))
+        if operations:
+            collection.bulk_write(operations, ordered=False)
+        # Drop rollups for properties/employees that no longer have any data
+        collection.delete_many({'_id': {'$nin': list(rollups.keys())}})
+
+    operations = []
+    for employee in db.employees.find({}, {'_id': 1}):
+        employee_id = encode_id(employee['_id'])
+        rollup = employee_rollups.get(employee_id)
+        operations.append(UpdateOne({'_id': employee['_id']}, {
+            '$set': {'total_sales': rollup['confirmed'] if rollup else 0},
+            # Derived from pending bookings on read since it stopped being stored
+            '$unset': {'ongoing_work': ''}
+        }))
+    if operations:
+        db.employees.bulk_write(operations, ordered=False)
+
+    print(f"Rebuilt {len(property_rollups)} property rollups and {len(employee_rollups)} employee rollups")
+
+if __name__ == '__main__':
+    rebuild_rollups()
@@ -1,8 +1,253 @@
+#!/usr/bin/env python3
+"""
+Seed the database.
+
+Without options this loads the small demo data set. `--scale N` adds synthetic
+data on top for load testing: per unit of scale, 10 properties, 2 employees,
+1 user and 100 clients each with a booking (so `--scale 10000` is about two
+million documents). Output depends only on `--seed` and the day it runs, and
+references between collections are consistent: active bookings never share a
+plot, and client payments match their booking.
+
+Usage:
+    python seed_data.py [--scale N] [--seed 42] [--batch-size 5000] [--unique-passwords]
+"""
+
+import argparse
+import random
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+
+from bson import ObjectId
+
 from database import get_database
 from models import User, Property, Employee, Client
+from ids import encode_id
+from changefeed import timestamp
+from backfill_locations import backfill_locations, load_gazetteer, DEFAULT_GAZETTEER
+from geo import point
+from rollups import rebuild_rollups
+from holds import HOLD_HOURS
+from payments import backfill_opening
 import bcrypt
 
-def seed_database():
+SEED_PASSWORD = '12345678'
+
+PROPERTIES_PER_SCALE = 10
+EMPLOYEES_PER_SCALE = 2
+USERS_PER_SCALE = 1
+SALES_PER_SCALE = 100
+
+FIRST_NAMES = ['Aarav', 'Vivaan', 'Aditya', 'Vihaan', 'Arjun', 'Sai', 'Reyansh', 'Krishna', 'Ishaan', 'Rohan',
+               'Ananya', 'Diya', 'Priya', 'Kavya', 'Neha', 'Pooja', 'Riya', 'Sneha', 'Meera', 'Anjali',
+               'Rahul', 'Vikram', 'Suresh', 'Mahesh', 'Deepak', 'Sunita', 'Geeta', 'Rekha', 'Manoj', 'Ramesh']
+LAST_NAMES = ['Sharma', 'Verma', 'Gupta', 'Agarwal', 'Jain', 'Meena', 'Rathore', 'Shekhawat', 'Choudhary',
+              'Saini', 'Yadav', 'Singh', 'Kumawat', 'Khandelwal', 'Mathur', 'Joshi', 'Soni', 'Bansal']
+PROJECT_PREFIXES = ['VRB', 'Elite', 'Royal', 'Shree', 'Green', 'Golden', 'Ring', 'Heritage', 'Pink City', 'Aravali']
+PROJECT_SUFFIXES = ['Enclave', 'City', 'Park', 'Residency', 'Greens', 'Vihar', 'Heights', 'Avenue', 'Township']
+SPECIFICATIONS = ['Luxury Modern Community', 'Modern Vastu-Compliant Layout', 'Smart Investment Destination',
+                  'Affordable Family Housing', 'Eco-Friendly Green Living', 'Gated Plotted Development']
+PLOT_SIZES = [100, 111, 133, 150, 167, 200, 250]  # square yards
+
+def _object_id(rng, created):
+    """Deterministic ObjectId whose timestamp is `created`"""
+    seconds = int(created.replace(tzinfo=timezone.utc).timestamp())
+    return ObjectId(struct.pack('>I', seconds) + rng.getrandbits(64).to_bytes(8, 'big'))
+
+def _aadhar(prefix, i):
+    # Unique per index; the prefix keeps generated numbers apart from the demo data
+    digits = f'{prefix}{i:011d}'
+    return f'{digits[:4]}-{digits[4:8]}-{digits[8:]}'
+
+def _person(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+def _insert_batches(collection, documents, batch_size):
+    count = 0
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            count += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        count += len(batch)
+    return count
+
+def _hash_password(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+
+def generate_users(rng, count, password_hash=None, workers=None):
+    """Test users user<i>@havelhousing.test.
+
+    With `password_hash` every user shares it (password SEED_PASSWORD);
+    otherwise each gets password `password<i>`, hashed in a process pool
+    since bcrypt is deliberately slow.
+    """
+    created = datetime.utcnow()
+    if password_hash is not None:
+        hashes = [password_hash] * count
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            hashes = list(pool.map(_hash_password, (f'password{i}' for i in range(count)), chunksize=64))
+    for i, hashed in enumerate(hashes):
+        yield {
+            '_id': _object_id(rng, created),
+            'email': f'user{i}@havelhousing.test',
+            'name': _person(rng),
+            'password_hash': hashed,
+            'created_at': created
+        }
+
+def generate_properties(rng, count, localities, now):
+    places = [(city, area, coordinates) for (city, area), coordinates in localities.items() if area]
+    for i in range(count):
+        city, area, (lat, lng) = rng.choice(places)
+        name = f'{rng.choice(PROJECT_PREFIXES)} {rng.choice(PROJECT_SUFFIXES)} {i + 1}'
+        # Plain dicts rather than Property objects: at this volume the model round trip shows
+        yield {
+            '_id': _object_id(rng, now - timedelta(days=rng.randint(30, 1000))),
+            'name': name,
+            'rera_number': f'RAJSYN{i:08d}',
+            'address': {'city': city.title(), 'area': area.title()},
+            'specification': rng.choice(SPECIFICATIONS),
+            'rate': rng.randrange(1800, 6000, 50),
+            'total_plots': rng.randint(50, 300),
+            'description': f'{rng.choice(SPECIFICATIONS)} in {area.title()}, {city.title()}',
+            'map_url': f'https://maps.google.com/?q={name.replace(" ", "+")}+{area.title().replace(" ", "+")}',
+            'location': point(round(lat + rng.uniform(-0.03, 0.03), 5), round(lng + rng.uniform(-0.03, 0.03), 5)),
+            'version': 0,
+            'updated_at': now
+        }
+
+def generate_sales(rng, properties, employee_ids, count, now, sales_by_employee):
+    """Yield (client, booking) pairs.
+
+    Properties are picked with a skewed popularity, so some launches are hot.
+    Plots are handed out in order from a random start; once a property is full
+    its extra bookings are cancelled ones on already-held plots.
+    """
+    weights = list(accumulate(1 / (rank + 1) ** 0.8 for rank in range(len(properties))))
+    next_plot = [0] * len(properties)
+    starts = [rng.randrange(p['total_plots']) for p in properties]
+
+    for i in range(count):
+        index = rng.choices(range(len(properties)), cum_weights=weights)[0]
+        prop = properties[index]
+        property_id = encode_id(prop['_id'])
+        total_plots = prop['total_plots']
+
+        sold = next_plot[index]
+        next_plot[index] += 1
+        plot_number = (starts[index] + sold) % total_plots + 1
+        if sold >= total_plots:
+            status = 'cancelled'
+        else:
+            status = rng.choices(('confirmed', 'pending', 'cancelled'), weights=(60, 25, 15))[0]
+
+        minutes_ago = rng.randint(0, 365 * 24 * 60)
+        if status == 'pending' and HOLD_HOURS > 0:
+            # Well within the hold (`now` is midnight), or the scheduler would cancel it on startup
+            minutes_ago %= max(1, int(HOLD_HOURS * 30))
+        booking_date = now - timedelta(minutes=minutes_ago)
+        amount = prop['rate'] * rng.choice(PLOT_SIZES)
+        if status == 'confirmed' and rng.random() < 0.3:
+            paid = amount
+        elif status == 'confirmed':
+            paid = round(amount * rng.uniform(0.4, 1))
+        elif status == 'pending':
+            paid = round(amount * rng.uniform(0.1, 0.3))
+        else:
+            paid = round(amount * rng.uniform(0, 0.2))
+        cash = round(paid * rng.random())
+        saled_by = rng.choice(employee_ids)
+        if status == 'confirmed':
+            sales_by_employee[saled_by] = sales_by_employee.get(saled_by, 0) + 1
+
+        client_id = _object_id(rng, booking_date)
+        client = {
+            '_id': client_id,
+            'name': _person(rng),
+            'aadhar_number': _aadhar('9', i),
+            'phone_number': f'{rng.randint(6, 9)}{rng.randrange(10 ** 9):09d}',
+            'project_id': property_id,
+            'plot_number': plot_number,
+            'payment': {'cash': cash, 'cheque': paid - cash, 'total': amount, 'remaining': amount - paid},
+            'status': 'completed' if paid >= amount else 'ongoing',
+            'saled_by': saled_by
+        }
+        booking = {
+            '_id': _object_id(rng, booking_date),
+            'client_id': encode_id(client_id),
+            'property_id': property_id,
+            'plot_number': plot_number,
+            'booking_date': booking_date,
+            'status': status,
+            'amount': amount,
+            'saled_by': saled_by
+        }
+        yield client, booking
+
+def seed_scale(db, scale, seed=42, batch_size=5000, unique_passwords=False, workers=None):
+    """Add synthetic data for `scale` units on top of whatever is in `db`"""
+    rng = random.Random(seed)
+    now = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    started = time.monotonic()
+
+    password_hash = None if unique_passwords else _hash_password(SEED_PASSWORD)
+    users = _insert_batches(db.users, generate_users(rng, scale * USERS_PER_SCALE, password_hash, workers), batch_size)
+    print(f"Created {users} users...")
+
+    properties = list(generate_properties(rng, scale * PROPERTIES_PER_SCALE, load_gazetteer(DEFAULT_GAZETTEER), now))
+    _insert_batches(db.properties, properties, batch_size)
+    print(f"Created {len(properties)} properties...")
+
+    employee_count = scale * EMPLOYEES_PER_SCALE
+    employee_dates = [now - timedelta(days=rng.randint(30, 2000)) for _ in range(employee_count)]
+    employee_ids = [encode_id(_object_id(rng, created)) for created in employee_dates]
+
+    # Clients and bookings are streamed in pairs so memory stays flat at any scale
+    sales_by_employee = {}
+    clients_batch, bookings_batch = [], []
+    sales = 0
+    for client, booking in generate_sales(rng, properties, employee_ids, scale * SALES_PER_SCALE, now, sales_by_employee):
+        clients_batch.append(client)
+        bookings_batch.append(booking)
+        if len(clients_batch) >= batch_size:
+            db.clients.insert_many(clients_batch, ordered=False)
+            db.bookings.insert_many(bookings_batch, ordered=False)
+            sales += len(clients_batch)
+            clients_batch, bookings_batch = [], []
+    if clients_batch:
+        db.clients.insert_many(clients_batch, ordered=False)
+        db.bookings.insert_many(bookings_batch, ordered=False)
+        sales += len(clients_batch)
+    print(f"Created {sales} clients and bookings...")
+
+    employees = (
+        {
+            '_id': ObjectId(employee_id),
+            'name': _person(rng),
+            'aadhar_number': _aadhar('8', i),
+            'account_number': f'{rng.randrange(10 ** 11, 10 ** 12)}',
+            'rera_number': f'RAJSYNEMP{i:07d}',
+            'total_sales': sales_by_employee.get(employee_id, 0),
+            'superior_name': _person(rng),
+            'photo_url': '',
+            'version': 0
+        }
+        for i, employee_id in enumerate(employee_ids)
+    )
+    print(f"Created {_insert_batches(db.employees, employees, batch_size)} employees...")
+
+    print(f"Synthetic data took {time.monotonic() - started:.1f}s")
+
+def seed_database(scale=0, seed=42, batch_size=5000, unique_passwords=False, workers=None):
     """Seed the database with initial data"""
     db = get_database()
     
@@ -11,6 +256,15 @@ def seed_database():
     db.properties.delete_many({})
     db.employees.delete_many({})
     db.clients.delete_many({})
+    db.bookings.delete_many({})
+    db.clients_archive.delete_many({})
+    db.bookings_archive.delete_many({})
+    db.payments.delete_many({})
+    # Derived from the data above, so stale as soon as it is replaced
+    db.property_rollups.delete_many({})
+    db.employee_rollups.delete_many({})
+    db.outbox.delete_many({})
+    db.property_tombstones.delete_many({})
     
     print("Cleared existing data...")
     
@@ -28,6 +282,7 @@ def seed_database():
         }
     ]
     
+    users = []
     for user_data in users_data:
         password_hash = bcrypt.hashpw(user_data['password'].encode('utf-8'), bcrypt.gensalt())
         user = User(
@@ -35,7 +290,8 @@ def seed_database():
             name=user_data['name'],
             password_hash=password_hash
         )
-        db.users.insert_one(user.to_dict())
+        users.append(user.to_dict())
+    db.users.insert_many(users)
     
     print("Created users...")
     
@@ -108,14 +364,15 @@ def seed_database():
         }
     ]
     
-    property_ids = []
-    for prop_data in properties_data:
-        property_obj = Property(**prop_data)
-        result = db.properties.insert_one(property_obj.to_dict())
-        property_ids.append(str(result.inserted_id))
+    result = db.properties.insert_many([
+        Property(**prop_data, updated_at=timestamp()).to_dict() for prop_data in properties_data
+    ])
+    property_ids = [encode_id(inserted_id) for inserted_id in result.inserted_ids]
     
     print("Created properties...")
     
+    backfill_locations()
+    
     # Create employees
     employees_data = [
         {
@@ -123,18 +380,13 @@ def seed_database():
             "aadhar_number": "7890-1234-5678",
             "account_number": "100200300456",
             "rera_number": "RAJ2025EMP001",
-            "total_sales": 5,
             "superior_name": "Anil Rathore",
-            "photo_url": "https://yourdomain.com/images/sandeep.jpg",
-            "ongoing_work": []
+            "photo_url": "https://yourdomain.com/images/sandeep.jpg"
         }
     ]
     
-    employee_ids = []
-    for emp_data in employees_data:
-        employee_obj = Employee(**emp_data)
-        result = db.employees.insert_one(employee_obj.to_dict())
-        employee_ids.append(str(result.inserted_id))
+    result = db.employees.insert_many([Employee(**emp_data).to_dict() for emp_data in employees_data])
+    employee_ids = [encode_id(inserted_id) for inserted_id in result.inserted_ids]
     
     print("Created employees...")
     
@@ -149,7 +401,7 @@ def seed_database():
                 "plot_number": 21,
                 "payment": {
                     "cash": 300000,
-                    "cheque": 200000,
+                    "cheque": 100000,
                     "total": 500000,
                     "remaining": 100000
                 },
@@ -158,13 +410,27 @@ def seed_database():
             }
         ]
         
-        for client_data in clients_data:
-            client_obj = Client(**client_data)
-            db.clients.insert_one(client_obj.to_dict())
+        db.clients.insert_many([Client(**client_data).to_dict() for client_data in clients_data])
         
         print("Created clients...")
     
+    if scale:
+        seed_scale(db, scale, seed, batch_size, unique_passwords, workers)
+    
+    # Every client's payments so far, as ledger entries
+    backfill_opening(db, batch_size)
+    rebuild_rollups(db)
+    
     print("Database seeded successfully!")
 
 if __name__ == '__main__':
-    seed_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Seed the database')
+    parser.add_argument('--scale', type=int, default=0, help='Units of synthetic data to add (0 for the demo data only)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic data')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--unique-passwords', action='store_true',
+                        help=f'Hash a distinct password per synthetic user instead of sharing {SEED_PASSWORD!r}')
+    parser.add_argument('--workers', type=int, default=None, help='Processes for --unique-passwords hashing')
+    args = parser.parse_args()
+
+    seed_database(args.scale, args.seed, args.batch_size, args.unique_passwords, args.workers)
\ No newline at end of file
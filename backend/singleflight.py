@@ -0,0 +1,57 @@
+"""
+Single-flight coalescing for identical concurrent reads.
+
+When many requests for the same key arrive together, the first one runs the
+fetch and the rest wait for its result instead of issuing their own queries.
+Nothing is cached: once the leader finishes, the next request for the key
+starts a new fetch. Results are shared between requests, so return immutable
+values (serialized response bodies, for example).
+"""
+
+import threading
+
+from metrics import metrics
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Return fn(), sharing one call among concurrent callers with the same key.
+
+        If the leader's call raises, every waiting caller gets the same exception.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.incr(f'singleflight.{self.name}.coalesced')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.incr(f'singleflight.{self.name}.executed')
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
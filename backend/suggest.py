@@ -0,0 +1,87 @@
+"""
+Typeahead suggestions for the property search box.
+
+Suggestions come from an in-memory index over property names, cities and
+areas. Every word of a name can start a match ("ave" finds "Ring Avenue
+Enclave"), and matches are ranked by popularity: bookings recorded in
+`property_rollups`, summed over the properties of a city or area.
+
+The index is a sorted array of (key, rank, suggestion) searched with bisect,
+built in one pass over a projection of the catalogue. Property writes in this
+worker mark it stale, and it is also rebuilt every SUGGEST_INDEX_TTL seconds
+to pick up other workers' writes and new bookings. Requests keep using the
+previous index while a rebuild runs.
+"""
+
+import heapq
+import os
+from bisect import bisect_left
+
+from cache import RebuiltIndex
+from ids import encode_id
+
+INDEX_TTL = float(os.getenv('SUGGEST_INDEX_TTL', 60))
+MAX_SUGGESTIONS = 20
+
+def normalize(text):
+    return ' '.join(str(text).casefold().split())
+
+class SuggestIndex(RebuiltIndex):
+    def __init__(self, ttl=INDEX_TTL):
+        super().__init__(ttl)
+        self._index = ([], [])
+
+    def rebuild(self, db):
+        popularity = {
+            doc['_id']: doc.get('bookings', 0)
+            for doc in db.property_rollups.find({}, {'bookings': 1})
+        }
+
+        suggestions = []
+        places = {}
+        for doc in db.properties.find({}, {'name': 1, 'address.city': 1, 'address.area': 1}):
+            property_id = encode_id(doc['_id'])
+            score = popularity.get(property_id, 0)
+            if doc.get('name'):
+                suggestions.append(({'type': 'property', 'text': doc['name'], 'property_id': property_id}, score))
+
+            address = doc.get('address') or {}
+            for kind in ('city', 'area'):
+                value = address.get(kind)
+                if value:
+                    place = places.setdefault((kind, normalize(value)), {'type': kind, 'text': value, 'count': 0, 'score': 0})
+                    place['count'] += 1
+                    place['score'] += score
+
+        for place in places.values():
+            suggestions.append(({'type': place['type'], 'text': place['text'], 'count': place['count']}, place.pop('score')))
+
+        # Rank 0 is the most popular; ties are broken alphabetically
+        suggestions.sort(key=lambda s: (-s[1], normalize(s[0]['text'])))
+
+        rows = []
+        for rank, (suggestion, _) in enumerate(suggestions):
+            words = normalize(suggestion['text']).split(' ')
+            for i in range(len(words)):
+                rows.append((' '.join(words[i:]), rank, suggestion))
+        rows.sort(key=lambda row: (row[0], row[1]))
+
+        # Swapped in as one tuple so readers never see a half-built index
+        self._index = ([row[0] for row in rows], rows)
+
+    def search(self, query, limit=10):
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        keys, entries = self._index
+
+        start = bisect_left(keys, prefix)
+        end = bisect_left(keys, prefix + '\uffff', start)
+
+        # A suggestion can match on several of its words; keep its best rank once
+        matches = {}
+        for _, rank, suggestion in entries[start:end]:
+            matches.setdefault(rank, suggestion)
+        return [matches[rank] for rank in heapq.nsmallest(limit, matches)]
+
+suggest_index = SuggestIndex()
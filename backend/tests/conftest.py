@@ -0,0 +1,64 @@
+import os
+import sys
+
+# Select the in-memory backend, without background threads, before the app's modules are imported
+os.environ['DATA_BACKEND'] = 'memory'
+os.environ.setdefault('HOLD_SCHEDULER', 'off')
+os.environ.setdefault('OUTBOX_WORKER', 'off')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from memory_db import MemoryDatabase
+
+@pytest.fixture
+def db():
+    """An empty in-memory database"""
+    return MemoryDatabase()
+
+@pytest.fixture
+def seeded_db():
+    """The app's database, reseeded with the demo data"""
+    from database import get_database
+    from seed_data import seed_database
+
+    seed_database(scale=0)
+    return get_database()
+
+@pytest.fixture
+def client(seeded_db):
+    """A test client logged in as a seeded user"""
+    from app import app
+
+    test_client = app.test_client()
+    response = test_client.post('/api/auth/login', json={
+        'email': 'harshit@havelhousing.com',
+        'password': '12345678'
+    })
+    assert response.status_code == 200
+    return test_client
+
+@pytest.fixture
+def add_booking(seeded_db):
+    """Insert a booking for the seeded client and return its encoded id"""
+    from ids import encode_id
+    from models import Booking
+
+    customer = seeded_db.clients.find_one({})
+    employee = seeded_db.employees.find_one({})
+
+    def add(status='pending', plot_number=1, amount=500000, **fields):
+        booking = Booking(
+            client_id=encode_id(customer['_id']),
+            property_id=customer['project_id'],
+            plot_number=plot_number,
+            booking_date=None,
+            status=status,
+            amount=amount,
+            saled_by=encode_id(employee['_id'])
+        ).to_dict()
+        booking.update(fields)
+        return encode_id(seeded_db.bookings.insert_one(booking).inserted_id)
+
+    return add
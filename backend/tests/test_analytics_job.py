@@ -0,0 +1,53 @@
+"""
+The month-end analytics job.
+"""
+
+from datetime import datetime
+
+from bson import ObjectId
+
+from analytics_job import run_month_end
+from ids import encode_id
+from models import Booking
+
+def _client(db, created, remaining, project_id='p1'):
+    _id = ObjectId.from_datetime(created) if created else 'c001'
+    db.clients.insert_one({
+        '_id': _id,
+        'aadhar_number': str(_id),
+        'project_id': project_id,
+        'payment': {'cash': 0, 'cheque': 0, 'total': remaining, 'remaining': remaining}
+    })
+
+def _ageing(report):
+    return {row['bucket']: (row['clients'], row['remaining']) for row in report['ageing'] if row['clients']}
+
+def test_past_month_leaves_out_later_clients(seeded_db):
+    seeded_db.clients.delete_many({})
+    _client(seeded_db, datetime(2026, 1, 20), 1000)
+    _client(seeded_db, datetime(2025, 12, 10), 2000)
+    _client(seeded_db, datetime(2026, 3, 5), 4000)
+    _client(seeded_db, None, 8000)
+
+    report = run_month_end('2026-01', batch_size=2)
+
+    assert report['clients_processed'] == 3
+    assert _ageing(report) == {'0-30': (1, 1000), '31-60': (1, 2000), 'unknown': (1, 8000)}
+    assert report['collections_outstanding']['total'] == 11000
+
+def test_month_counts_its_bookings(seeded_db):
+    employee_id = encode_id(seeded_db.employees.find_one()['_id'])
+    for day, status, amount in ((3, 'confirmed', 100), (9, 'pending', 200), (28, 'confirmed', 400)):
+        seeded_db.bookings.insert_one(Booking(
+            client_id='c', property_id='p1', plot_number=day, booking_date=datetime(2026, 2, day),
+            status=status, amount=amount, saled_by=employee_id
+        ).to_dict())
+
+    report = run_month_end('2026-02')
+
+    assert report['bookings_processed'] == 3
+    assert [(row['property_id'], row['bookings'], row['revenue']) for row in report['revenue_by_property']] == [
+        ('p1', 3, 500)
+    ]
+    assert report['employee_league_table'][0]['employee_id'] == employee_id
+    assert seeded_db.reports.find_one({'_id': 'month_end:2026-02'})['bookings_processed'] == 3
@@ -0,0 +1,65 @@
+"""
+Archival of old bookings and clients, and reads that fall back to the archives.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import archive
+from ids import encode_id
+
+MISSING_ID = str(ObjectId())
+
+@pytest.fixture
+def archived(seeded_db, add_booking):
+    """An archived and a hot booking, and the seeded client archived"""
+    old = add_booking('cancelled', plot_number=1,
+                      booking_date=datetime.utcnow() - timedelta(days=archive.BOOKINGS_AFTER_DAYS + 1))
+    hot = add_booking('cancelled', plot_number=2)
+    archive.run_archive(seeded_db)
+    seeded_db.clients.update_many({}, {'$set': {'status': 'completed'}})
+    archive.archive_collection(seeded_db, 'clients', {'status': 'completed'}, '_id')
+    return old, hot
+
+def test_archive_moves_only_old_documents(seeded_db, archived):
+    old, hot = archived
+    assert [encode_id(doc['_id']) for doc in seeded_db.bookings.find()] == [hot]
+    assert [encode_id(doc['_id']) for doc in seeded_db.bookings_archive.find()] == [old]
+    assert seeded_db.clients.count_documents({}) == 0
+    assert seeded_db.clients_archive.count_documents({}) == 1
+
+def test_archive_rerun_skips_existing_copies(seeded_db, add_booking):
+    query = {'status': 'cancelled'}
+    booking_id = add_booking('cancelled')
+    # A copy left by a run that died before deleting the original
+    seeded_db.bookings_archive.insert_one(seeded_db.bookings.find_one({'_id': ObjectId(booking_id)}))
+    assert archive.archive_collection(seeded_db, 'bookings', query, 'booking_date') == 1
+    assert seeded_db.bookings.count_documents({}) == 0
+    assert seeded_db.bookings_archive.count_documents({}) == 1
+
+def test_single_reads_fall_back_to_the_archive(client, archived):
+    old, _ = archived
+    assert client.get(f'/api/booking/{old}').status_code == 200
+    assert client.get(f'/api/booking/{MISSING_ID}').status_code == 404
+
+def test_batch_reads_fall_back_to_the_archive_in_request_order(client, seeded_db, archived):
+    old, hot = archived
+    body = client.get(f'/api/booking/batch?ids={old},{MISSING_ID},{hot}').get_json()
+    assert [booking['_id'] for booking in body['bookings']] == [old, hot]
+    assert body['missing_ids'] == [MISSING_ID]
+
+    client_id = encode_id(seeded_db.clients_archive.find_one()['_id'])
+    body = client.post('/api/booking/clients/batch', json={'ids': [client_id]}).get_json()
+    assert [doc['_id'] for doc in body['clients']] == [client_id]
+
+def test_lists_include_the_archive_only_when_asked(client, archived):
+    old, hot = archived
+    listed = client.get('/api/booking/').get_json()
+    assert [booking['_id'] for booking in listed['bookings']] == [hot]
+    listed = client.get('/api/booking/?include_archived=true&expand=client').get_json()
+    assert [booking['_id'] for booking in listed['bookings']] == [hot, old]
+    assert listed['pagination']['total_count'] == 2
+    # The client was archived too, and still expands
+    assert all(booking['client']['name'] == 'Amit Sharma' for booking in listed['bookings'])
@@ -0,0 +1,70 @@
+"""
+Booking status transitions, one at a time and in bulk.
+"""
+
+from bson import ObjectId
+
+from memory_db import MemoryCollection
+
+MISSING_ID = str(ObjectId())
+
+def _status(db, booking_id):
+    return db.bookings.find_one({'_id': ObjectId(booking_id)})['status']
+
+def _bulk(client, ids, status):
+    response = client.put('/api/booking/batch/status', json={'ids': ids, 'status': status})
+    assert response.status_code == 200
+    body = response.get_json()
+    return body, {result['booking_id']: result['outcome'] for result in body['results']}
+
+def test_single_status_follows_the_transitions(client, seeded_db, add_booking):
+    pending, cancelled = add_booking('pending'), add_booking('cancelled', plot_number=2)
+    assert client.put(f'/api/booking/{pending}/status', json={'status': 'confirmed'}).status_code == 200
+    assert client.put(f'/api/booking/{pending}/status', json={'status': 'confirmed'}).status_code == 200
+    assert client.put(f'/api/booking/{pending}/status', json={'status': 'pending'}).status_code == 409
+    assert client.put(f'/api/booking/{cancelled}/status', json={'status': 'confirmed'}).status_code == 409
+    assert client.put(f'/api/booking/{MISSING_ID}/status', json={'status': 'cancelled'}).status_code == 404
+    assert _status(seeded_db, pending) == 'confirmed'
+    assert _status(seeded_db, cancelled) == 'cancelled'
+
+def test_bulk_status_reports_each_outcome(client, seeded_db, add_booking):
+    pending = add_booking('pending')
+    confirmed = add_booking('confirmed', plot_number=2)
+    cancelled = add_booking('cancelled', plot_number=3)
+    body, outcomes = _bulk(client, [pending, confirmed, cancelled, MISSING_ID, 'nope'], 'cancelled')
+    assert outcomes == {
+        pending: 'updated',
+        confirmed: 'updated',
+        cancelled: 'unchanged',
+        MISSING_ID: 'not_found',
+        'nope': 'invalid'
+    }
+    assert body['updated_count'] == 2
+    assert _status(seeded_db, pending) == _status(seeded_db, confirmed) == 'cancelled'
+
+def test_bulk_status_rejects_invalid_transitions(client, seeded_db, add_booking):
+    pending, cancelled = add_booking('pending'), add_booking('cancelled', plot_number=2)
+    body, outcomes = _bulk(client, [pending, cancelled], 'confirmed')
+    assert outcomes == {pending: 'updated', cancelled: 'invalid_transition'}
+    assert _status(seeded_db, cancelled) == 'cancelled'
+
+def test_bulk_status_reports_bookings_changed_meanwhile(client, seeded_db, add_booking, monkeypatch):
+    first, second = add_booking('pending'), add_booking('pending', plot_number=2)
+    bulk_write = MemoryCollection.bulk_write
+
+    def cancel_second_first(collection, requests, **kwargs):
+        if collection.name == 'bookings':
+            collection.update_one({'_id': ObjectId(second)}, {'$set': {'status': 'cancelled'}})
+        return bulk_write(collection, requests, **kwargs)
+
+    monkeypatch.setattr(MemoryCollection, 'bulk_write', cancel_second_first)
+    body, outcomes = _bulk(client, [first, second], 'confirmed')
+    assert outcomes == {first: 'updated', second: 'conflict'}
+    assert body['updated_count'] == 1
+    assert _status(seeded_db, second) == 'cancelled'
+
+def test_bulk_status_leaves_no_batch_marker(client, seeded_db, add_booking):
+    booking_id = add_booking('pending')
+    _bulk(client, [booking_id], 'confirmed')
+    assert 'status_batch' not in seeded_db.bookings.find_one({'_id': ObjectId(booking_id)})
+    assert 'status_batch' not in client.get(f'/api/booking/{booking_id}').get_json()['booking']
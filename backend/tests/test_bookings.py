@@ -0,0 +1,53 @@
+"""
+Creating bookings.
+"""
+
+import pytest
+from bson import ObjectId
+
+import outbox
+from ids import encode_id
+
+@pytest.fixture
+def new_booking(seeded_db):
+    return {
+        'property_id': encode_id(seeded_db.properties.find_one()['_id']),
+        'plot_number': 77,
+        'amount': 900000,
+        'client_name': 'Ravi Kumar',
+        'client_phone': '9000000000',
+        'client_aadhar': '1111-2222-3333',
+        'cash_payment': 1000
+    }
+
+def _employee_bookings(db, employee_id):
+    rollup = db.employee_rollups.find_one({'_id': employee_id})
+    return rollup['bookings'] if rollup else 0
+
+def test_booking_credits_the_given_employee(client, seeded_db, new_booking):
+    employee_id = encode_id(seeded_db.employees.find_one()['_id'])
+    response = client.post('/api/booking/', json={**new_booking, 'employee_id': employee_id})
+    assert response.status_code == 201
+    booking = seeded_db.bookings.find_one({'_id': ObjectId(response.get_json()['booking_id'])})
+    assert booking['saled_by'] == employee_id
+    outbox.run_worker(once=True)
+    assert _employee_bookings(seeded_db, employee_id) == 1
+
+def test_booking_without_employee_credits_nobody(client, seeded_db, new_booking):
+    employee_id = encode_id(seeded_db.employees.find_one()['_id'])
+    response = client.post('/api/booking/', json=new_booking)
+    assert response.status_code == 201
+    booking = seeded_db.bookings.find_one({'_id': ObjectId(response.get_json()['booking_id'])})
+    assert booking['saled_by'] is None
+    outbox.run_worker(once=True)
+    assert _employee_bookings(seeded_db, employee_id) == 0
+    assert seeded_db.property_rollups.find_one({'_id': new_booking['property_id']})['plots_pending'] == 1
+
+@pytest.mark.parametrize('employee_id, status, error', [
+    ('nope', 400, 'Invalid employee ID'),
+    (str(ObjectId()), 404, 'Employee not found')
+])
+def test_booking_rejects_unknown_employees(client, seeded_db, new_booking, employee_id, status, error):
+    response = client.post('/api/booking/', json={**new_booking, 'employee_id': employee_id})
+    assert (response.status_code, response.get_json()['error']) == (status, error)
+    assert seeded_db.bookings.count_documents({}) == 0
@@ -0,0 +1,62 @@
+"""
+Optimistic concurrency on employee and property updates.
+"""
+
+import pytest
+
+from concurrency import parse_if_match
+from ids import encode_id
+
+@pytest.mark.parametrize('header, version', [
+    (None, None), ('*', None), ('"3"', 3), ('W/"3"', 3), ('4', 4)
+])
+def test_parse_if_match(header, version):
+    assert parse_if_match(header) == version
+
+def test_parse_if_match_rejects_other_etags():
+    with pytest.raises(ValueError):
+        parse_if_match('"abc"')
+
+@pytest.fixture
+def employee_url(seeded_db):
+    return f"/api/employees/{encode_id(seeded_db.employees.find_one()['_id'])}"
+
+def _rename(client, url, name, if_match=None):
+    headers = {'If-Match': if_match} if if_match is not None else {}
+    return client.put(url, json={'name': name}, headers=headers)
+
+def test_update_with_current_version_bumps_the_etag(client, employee_url):
+    etag = client.get(employee_url).headers['ETag']
+    assert etag == '"0"'
+    response = _rename(client, employee_url, 'First', etag)
+    assert response.status_code == 200
+    assert response.headers['ETag'] == '"1"'
+    assert client.get(employee_url).headers['ETag'] == '"1"'
+
+def test_update_with_stale_version_is_rejected(client, employee_url):
+    _rename(client, employee_url, 'First', '"0"')
+    response = _rename(client, employee_url, 'Second', '"0"')
+    assert response.status_code == 412
+    assert client.get(employee_url).get_json()['employee']['name'] == 'First'
+
+def test_update_without_if_match_always_applies(client, employee_url):
+    _rename(client, employee_url, 'First', '"0"')
+    assert _rename(client, employee_url, 'Second').status_code == 200
+    assert _rename(client, employee_url, 'Third', '*').status_code == 200
+    assert client.get(employee_url).headers['ETag'] == '"3"'
+
+def test_documents_without_a_version_count_as_zero(client, seeded_db, employee_url):
+    seeded_db.employees.update_one({}, {'$unset': {'version': ''}})
+    assert _rename(client, employee_url, 'First', '"0"').status_code == 200
+
+def test_invalid_if_match_and_unknown_ids(client, employee_url):
+    assert _rename(client, employee_url, 'First', '"abc"').status_code == 400
+    missing = '/api/employees/0123456789abcdef01234567'
+    assert _rename(client, missing, 'First', '"0"').status_code == 404
+
+def test_property_update_honours_if_match(client, seeded_db):
+    url = f"/api/properties/{encode_id(seeded_db.properties.find_one()['_id'])}"
+    etag = client.get(url).headers['ETag']
+    assert client.put(url, json={'rate': 1500}, headers={'If-Match': f'W/{etag}'}).status_code == 200
+    assert client.put(url, json={'rate': 1600}, headers={'If-Match': etag}).status_code == 412
+    assert client.get(url).get_json()['property']['rate'] == 1500
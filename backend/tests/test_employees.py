@@ -0,0 +1,33 @@
+"""
+Employee responses and the fields derived from bookings.
+"""
+
+import pytest
+
+from ids import encode_id
+
+@pytest.fixture
+def employee_id(seeded_db):
+    return encode_id(seeded_db.employees.find_one()['_id'])
+
+def test_ongoing_work_lists_pending_bookings(client, seeded_db, add_booking, employee_id):
+    add_booking('pending', plot_number=5)
+    add_booking('confirmed', plot_number=6)
+    add_booking('cancelled', plot_number=7)
+    customer = seeded_db.clients.find_one()
+    expected = [{'client_id': encode_id(customer['_id']), 'project_id': customer['project_id'], 'plot_number': 5}]
+
+    assert client.get(f'/api/employees/{employee_id}').get_json()['employee']['ongoing_work'] == expected
+    listed = client.get('/api/employees/').get_json()['employees']
+    assert [employee['ongoing_work'] for employee in listed if employee['_id'] == employee_id] == [expected]
+    batch = client.get(f'/api/employees/batch?ids={employee_id}').get_json()['employees']
+    assert [employee['ongoing_work'] for employee in batch] == [expected]
+
+def test_ongoing_work_follows_status_changes(client, add_booking, employee_id):
+    booking_id = add_booking('pending', plot_number=5)
+    client.put(f'/api/booking/{booking_id}/status', json={'status': 'confirmed'})
+    assert client.get(f'/api/employees/{employee_id}').get_json()['employee']['ongoing_work'] == []
+
+def test_stored_ongoing_work_is_not_returned(client, seeded_db, employee_id):
+    seeded_db.employees.update_one({}, {'$set': {'ongoing_work': [{'client_id': 'stale'}]}})
+    assert client.get(f'/api/employees/{employee_id}').get_json()['employee']['ongoing_work'] == []
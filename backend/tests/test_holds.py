@@ -0,0 +1,82 @@
+"""
+Expiry of pending booking holds.
+"""
+
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+import holds
+import outbox
+from rollups import rebuild_rollups
+
+def _aged(hours):
+    return {'booking_date': datetime.utcnow() - timedelta(hours=hours)}
+
+def _booking(db, booking_id):
+    return db.bookings.find_one({'_id': ObjectId(booking_id)})
+
+def test_sweep_cancels_only_expired_pending_bookings(seeded_db, add_booking):
+    expired = add_booking('pending', plot_number=1, **_aged(holds.HOLD_HOURS + 1))
+    fresh = add_booking('pending', plot_number=2, **_aged(holds.HOLD_HOURS - 1))
+    confirmed = add_booking('confirmed', plot_number=3, **_aged(holds.HOLD_HOURS + 1))
+
+    assert holds.sweep(seeded_db) == 1
+    cancelled = _booking(seeded_db, expired)
+    assert (cancelled['status'], cancelled['cancel_reason']) == ('cancelled', 'hold_expired')
+    assert 'expiry_batch' not in cancelled
+    assert _booking(seeded_db, fresh)['status'] == 'pending'
+    assert _booking(seeded_db, confirmed)['status'] == 'confirmed'
+    assert holds.sweep(seeded_db) == 0
+
+def test_sweep_works_through_every_batch(seeded_db, add_booking):
+    for plot_number in range(5):
+        add_booking('pending', plot_number=plot_number, **_aged(holds.HOLD_HOURS + plot_number + 1))
+    assert holds.sweep(seeded_db, batch_size=2) == 5
+    assert seeded_db.bookings.count_documents({'status': 'pending'}) == 0
+
+def test_expired_holds_update_the_rollups(seeded_db, add_booking):
+    add_booking('pending', plot_number=1)
+    add_booking('pending', plot_number=2, **_aged(holds.HOLD_HOURS + 1))
+    rebuild_rollups(seeded_db)
+
+    holds.sweep(seeded_db)
+    outbox.run_worker(once=True)
+    rollup = seeded_db.property_rollups.find_one({'_id': seeded_db.clients.find_one()['project_id']})
+    assert (rollup['plots_pending'], rollup['bookings']) == (1, 2)
+
+def test_expired_plot_can_be_booked_again(client, seeded_db, add_booking):
+    add_booking('pending', plot_number=9, **_aged(holds.HOLD_HOURS + 1))
+    holds.sweep(seeded_db)
+    response = client.post('/api/booking/', json={
+        'property_id': seeded_db.clients.find_one()['project_id'],
+        'plot_number': 9,
+        'amount': 100000,
+        'client_name': 'Ravi Kumar',
+        'client_phone': '9000000000',
+        'client_aadhar': '1111-2222-3333'
+    })
+    assert response.status_code == 201
+
+def test_expiry_skips_bookings_confirmed_meanwhile(seeded_db, add_booking):
+    booking_id = add_booking('pending', **_aged(holds.HOLD_HOURS + 1))
+    seeded_db.bookings.update_one({'_id': ObjectId(booking_id)}, {'$set': {'status': 'confirmed'}})
+    cutoff = datetime.utcnow() - holds.hold_period()
+    assert holds.expire_bookings(seeded_db, [ObjectId(booking_id)], cutoff) == 0
+    assert _booking(seeded_db, booking_id)['status'] == 'confirmed'
+
+def test_scheduler_wakes_for_holds_due_before_the_next_sweep(seeded_db, add_booking):
+    scheduler = holds.HoldScheduler(sweep_seconds=60)
+    now = datetime.utcnow()
+    soon = add_booking('pending', plot_number=1, booking_date=now - holds.hold_period() + timedelta(seconds=30))
+    add_booking('pending', plot_number=2, booking_date=now)
+    scheduler._load_window(seeded_db, now)
+
+    assert scheduler._due(now) == []
+    assert scheduler._due(now + timedelta(seconds=31)) == [ObjectId(soon)]
+
+    # New bookings are tracked only if they expire inside the loaded window
+    late = ObjectId()
+    scheduler.schedule(late, now)
+    scheduler.schedule(ObjectId(soon), now - holds.hold_period() + timedelta(seconds=60))
+    assert scheduler._due(now + timedelta(seconds=61)) == [ObjectId(soon)]
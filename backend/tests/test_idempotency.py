@@ -0,0 +1,87 @@
+"""
+Idempotency-Key replay on POST routes.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import booking
+import idempotency
+
+@pytest.fixture
+def payments_url(seeded_db):
+    return f"/api/booking/clients/{seeded_db.clients.find_one()['_id']}/payments"
+
+def _pay(client, url, key, amount=1000):
+    return client.post(url, json={'amount': amount, 'method': 'cash'}, headers={idempotency.HEADER: key})
+
+def _instalments(db):
+    return db.payments.count_documents({'source': 'instalment'})
+
+def test_retry_replays_the_first_response(client, seeded_db, payments_url):
+    first = _pay(client, payments_url, 'k1')
+    retry = _pay(client, payments_url, 'k1')
+    assert first.status_code == retry.status_code == 201
+    assert retry.get_json() == first.get_json()
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert 'Idempotent-Replayed' not in first.headers
+    assert _instalments(seeded_db) == 1
+
+def test_retry_replays_from_the_database(client, seeded_db, payments_url):
+    first = _pay(client, payments_url, 'k1')
+    # As another worker would, without this one's cached response
+    idempotency.response_cache.clear()
+    retry = _pay(client, payments_url, 'k1')
+    assert retry.get_json() == first.get_json()
+    assert retry.headers['Idempotent-Replayed'] == 'true'
+    assert _instalments(seeded_db) == 1
+
+def test_different_keys_run_separately(client, seeded_db, payments_url):
+    _pay(client, payments_url, 'k1')
+    _pay(client, payments_url, 'k2')
+    assert _instalments(seeded_db) == 2
+
+def test_reusing_a_key_for_another_body_is_rejected(client, seeded_db, payments_url):
+    _pay(client, payments_url, 'k1')
+    assert _pay(client, payments_url, 'k1', amount=2000).status_code == 422
+    assert _instalments(seeded_db) == 1
+
+def test_key_still_in_progress_conflicts(client, seeded_db, payments_url, monkeypatch):
+    monkeypatch.setattr(idempotency, 'WAIT_SECONDS', 0.1)
+    assert _pay(client, payments_url, 'k1').status_code == 201
+    seeded_db.idempotency_keys.update_many({}, {'$set': {
+        'state': 'in_progress',
+        'locked_until': datetime.utcnow() + timedelta(minutes=1)
+    }})
+    idempotency.response_cache.clear()
+    response = _pay(client, payments_url, 'k1')
+    assert response.status_code == 409
+    assert response.headers['Retry-After'] == '1'
+
+def test_abandoned_claim_is_taken_over(client, seeded_db, payments_url):
+    assert _pay(client, payments_url, 'k1').status_code == 201
+    seeded_db.idempotency_keys.update_many({}, {'$set': {
+        'state': 'in_progress',
+        'locked_until': datetime.utcnow() - timedelta(seconds=1)
+    }})
+    idempotency.response_cache.clear()
+    response = _pay(client, payments_url, 'k1')
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+
+def test_server_errors_are_not_stored(client, seeded_db, payments_url, monkeypatch):
+    def fail(*args, **kwargs):
+        raise ConnectionError('database unavailable')
+
+    monkeypatch.setattr(booking, 'record_payment', fail)
+    assert _pay(client, payments_url, 'k-error').status_code == 500
+    assert seeded_db.idempotency_keys.count_documents({'_id': {'$regex': ':k-error$'}}) == 0
+
+    monkeypatch.undo()
+    response = _pay(client, payments_url, 'k-error')
+    assert response.status_code == 201
+    assert 'Idempotent-Replayed' not in response.headers
+
+def test_overlong_keys_are_rejected(client, payments_url):
+    assert _pay(client, payments_url, 'k' * (idempotency.MAX_KEY_LENGTH + 1)).status_code == 400
@@ -0,0 +1,113 @@
+"""
+The in-memory backend against the pymongo behaviour the blueprints rely on.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from database import get_database
+
+def test_get_database_uses_memory_backend():
+    db = get_database()
+    assert db.properties.count_documents({}) > 0
+    assert 'email_1' in db.users.index_information()
+
+def test_facet_runs_each_pipeline_on_the_same_input(db):
+    db.items.insert_many([{'kind': kind, 'n': n} for n, kind in enumerate('aabbb')])
+    result = list(db.items.aggregate([
+        {'$match': {'n': {'$gte': 1}}},
+        {'$facet': {
+            'by_kind': [{'$group': {'_id': '$kind', 'count': {'$sum': 1}}}, {'$sort': {'_id': 1}}],
+            'total': [{'$count': 'count'}],
+            'first': [{'$sort': {'n': 1}}, {'$limit': 1}, {'$project': {'_id': 0, 'n': 1}}]
+        }}
+    ]))
+    assert result == [{
+        'by_kind': [{'_id': 'a', 'count': 1}, {'_id': 'b', 'count': 3}],
+        'total': [{'count': 4}],
+        'first': [{'n': 1}]
+    }]
+
+def test_add_to_set_skips_existing_values(db):
+    db.items.insert_one({'_id': 1, 'tags': ['a']})
+    db.items.update_one({'_id': 1}, {'$addToSet': {'tags': 'a'}})
+    db.items.update_one({'_id': 1}, {'$addToSet': {'tags': {'$each': ['b', 'a', 'c']}}})
+    db.items.update_one({'_id': 1}, {'$addToSet': {'new': 'x'}})
+    assert db.items.find_one({'_id': 1}) == {'_id': 1, 'tags': ['a', 'b', 'c'], 'new': ['x']}
+
+def test_pull_removes_matching_values_and_documents(db):
+    db.items.insert_one({'_id': 1, 'tags': ['a', 'b', 'a'], 'holds': [{'plot': 1}, {'plot': 2}], 'n': [1, 5, 9]})
+    db.items.update_one({'_id': 1}, {'$pull': {'tags': 'a', 'holds': {'plot': 2}, 'n': {'$gt': 4}}})
+    assert db.items.find_one({'_id': 1}) == {'_id': 1, 'tags': ['b'], 'holds': [{'plot': 1}], 'n': [1]}
+
+def test_find_one_and_update_returns_before_by_default(db):
+    db.items.insert_one({'_id': 1, 'n': 1})
+    assert db.items.find_one_and_update({'_id': 1}, {'$inc': {'n': 1}}) == {'_id': 1, 'n': 1}
+    assert db.items.find_one({'_id': 1})['n'] == 2
+
+def test_find_one_and_update_returns_after(db):
+    db.items.insert_one({'_id': 1, 'n': 1, 'other': True})
+    updated = db.items.find_one_and_update(
+        {'_id': 1}, {'$inc': {'n': 1}}, projection={'n': 1}, return_document=ReturnDocument.AFTER
+    )
+    assert updated == {'_id': 1, 'n': 2}
+
+def test_find_one_and_update_no_match(db):
+    db.items.insert_one({'_id': 1, 'n': 1})
+    assert db.items.find_one_and_update({'_id': 1, 'n': {'$gte': 5}}, {'$inc': {'n': 1}}) is None
+    assert db.items.find_one({'_id': 1})['n'] == 1
+
+def test_find_one_and_update_upsert(db):
+    assert db.items.find_one_and_update(
+        {'key': 'k'}, {'$set': {'n': 1}}, upsert=True, return_document=ReturnDocument.BEFORE
+    ) is None
+    upserted = db.items.find_one_and_update(
+        {'key': 'j'}, {'$set': {'n': 2}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    assert {key: upserted[key] for key in ('key', 'n')} == {'key': 'j', 'n': 2}
+    assert db.items.count_documents({}) == 2
+
+def test_ttl_index_expires_old_documents(db):
+    db.items.create_index('created_at', expireAfterSeconds=60)
+    now = datetime.utcnow()
+    db.items.insert_many([
+        {'_id': 'old', 'created_at': now - timedelta(seconds=120)},
+        {'_id': 'new', 'created_at': now},
+        {'_id': 'undated', 'created_at': 'not a date'}
+    ])
+    assert sorted(doc['_id'] for doc in db.items.find()) == ['new', 'undated']
+    assert db.items.index_information()['created_at_1']['expireAfterSeconds'] == 60
+
+def test_unique_index_rejects_duplicates(db):
+    db.items.create_index('email', unique=True)
+    db.items.insert_one({'email': 'a@example.com'})
+    with pytest.raises(DuplicateKeyError) as error:
+        db.items.insert_one({'email': 'a@example.com'})
+    assert error.value.code == 11000
+
+    other = db.items.insert_one({'email': 'b@example.com'}).inserted_id
+    with pytest.raises(DuplicateKeyError):
+        db.items.update_one({'_id': other}, {'$set': {'email': 'a@example.com'}})
+    assert db.items.find_one({'_id': other})['email'] == 'b@example.com'
+
+def test_unique_index_on_existing_duplicates_fails(db):
+    db.items.insert_many([{'email': 'a@example.com'}, {'email': 'a@example.com'}])
+    with pytest.raises(DuplicateKeyError):
+        db.items.create_index('email', unique=True)
+
+def test_sparse_unique_index_allows_missing_values(db):
+    db.items.create_index('code', unique=True, sparse=True)
+    db.items.insert_many([{'name': 'x'}, {'name': 'y'}])
+    assert db.items.count_documents({}) == 2
+
+def test_insert_many_unordered_reports_duplicates(db):
+    db.items.create_index('email', unique=True)
+    with pytest.raises(BulkWriteError) as error:
+        db.items.insert_many(
+            [{'email': 'a@example.com'}, {'email': 'a@example.com'}, {'email': 'b@example.com'}], ordered=False
+        )
+    assert [e['code'] for e in error.value.details['writeErrors']] == [11000]
+    assert db.items.count_documents({}) == 2
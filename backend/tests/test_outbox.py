@@ -0,0 +1,121 @@
+"""
+Outbox delivery: each entry's side effects apply exactly once, in any order.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+import outbox
+from ids import encode_id
+from memory_db import MemoryCollection
+from rollups import rebuild_rollups
+
+@pytest.fixture
+def book(client, seeded_db):
+    property_id = encode_id(seeded_db.properties.find_one()['_id'])
+    employee_id = encode_id(seeded_db.employees.find_one()['_id'])
+
+    def book(plot_number, status=None):
+        response = client.post('/api/booking/', json={
+            'property_id': property_id,
+            'plot_number': plot_number,
+            'amount': 100000,
+            'client_name': f'Client {plot_number}',
+            'client_phone': '9000000000',
+            'client_aadhar': f'aadhar-{plot_number}',
+            'cash_payment': 1000,
+            'employee_id': employee_id
+        })
+        assert response.status_code == 201
+        booking_id = response.get_json()['booking_id']
+        if status:
+            assert client.put(f'/api/booking/{booking_id}/status', json={'status': status}).status_code == 200
+        return booking_id
+
+    return book
+
+def _counters(db):
+    """Rollups and employee totals, without bookkeeping fields or counters still at zero"""
+    def strip(doc):
+        return {k: v for k, v in doc.items() if k not in ('updated_at', outbox.APPLIED_FIELD) and v != 0}
+    return (
+        sorted((strip(doc) for doc in db.property_rollups.find()), key=lambda doc: doc['_id']),
+        sorted((strip(doc) for doc in db.employee_rollups.find()), key=lambda doc: doc['_id']),
+        sorted((encode_id(doc['_id']), doc.get('total_sales')) for doc in db.employees.find())
+    )
+
+def _assert_matches_rebuild(db):
+    applied = _counters(db)
+    rebuild_rollups(db)
+    assert applied == _counters(db)
+
+def test_worker_applies_queued_side_effects(seeded_db, book):
+    book(1, 'confirmed')
+    book(2)
+    book(3, 'cancelled')
+    assert seeded_db.outbox.count_documents({}) == 5
+    outbox.run_worker(once=True)
+    assert seeded_db.outbox.count_documents({}) == 0
+    assert seeded_db.employees.find_one()['total_sales'] == 1
+    assert not any(doc.get(outbox.APPLIED_FIELD) for doc in seeded_db.property_rollups.find())
+    _assert_matches_rebuild(seeded_db)
+
+def test_entries_commute_when_applied_out_of_order(seeded_db, book):
+    book(1, 'confirmed')
+    created = seeded_db.outbox.find_one({'event': 'booking.created'})
+    later = datetime.utcnow() + timedelta(hours=1)
+    seeded_db.outbox.update_one({'_id': created['_id']}, {'$set': {'available_at': later}})
+    outbox.run_worker(once=True)
+    assert seeded_db.outbox.count_documents({}) == 1
+
+    seeded_db.outbox.update_one({'_id': created['_id']}, {'$set': {'available_at': datetime.utcnow()}})
+    outbox.run_worker(once=True)
+    _assert_matches_rebuild(seeded_db)
+
+def test_redelivered_entries_change_nothing(seeded_db, book, monkeypatch):
+    book(1, 'confirmed')
+    book(2)
+    entries = outbox.claim(seeded_db)
+    delete_many = MemoryCollection.delete_many
+
+    def crash_before_dequeue(collection, filter, **kwargs):
+        if collection.name == 'outbox':
+            raise ConnectionError('worker died')
+        return delete_many(collection, filter, **kwargs)
+
+    # The worker writes the counters, then dies before removing its entries
+    monkeypatch.setattr(MemoryCollection, 'delete_many', crash_before_dequeue)
+    with pytest.raises(ConnectionError):
+        outbox.apply(seeded_db, entries)
+    monkeypatch.setattr(MemoryCollection, 'delete_many', delete_many)
+
+    # Its lease runs out and another worker claims the entries again
+    seeded_db.outbox.update_many({}, {'$set': {'locked_until': datetime.utcnow() - timedelta(seconds=1)}})
+    outbox.run_worker(once=True)
+    assert seeded_db.outbox.count_documents({}) == 0
+    assert seeded_db.employees.find_one()['total_sales'] == 1
+    _assert_matches_rebuild(seeded_db)
+
+def test_failing_entries_back_off_and_park(seeded_db, book, monkeypatch):
+    book(1)
+    bad = outbox.enqueue(seeded_db, 'payment.recorded', {'method': 'cash', 'amount': 5})
+    outbox.run_worker(once=True)
+
+    # The good entry still went through; the bad one waits for a retry
+    entry = seeded_db.outbox.find_one({})
+    assert (entry['_id'], entry['status'], entry['attempts']) == (bad, 'pending', 1)
+    assert entry['available_at'] > datetime.utcnow()
+    _assert_matches_rebuild(seeded_db)
+
+    monkeypatch.setattr(outbox, 'MAX_ATTEMPTS', 2)
+    seeded_db.outbox.update_one({'_id': bad}, {'$set': {'available_at': datetime.utcnow()}})
+    outbox.run_worker(once=True)
+    assert seeded_db.outbox.find_one({'_id': bad})['status'] == 'failed'
+
+    outbox.retry_failed(seeded_db)
+    assert seeded_db.outbox.find_one({'_id': bad})['status'] == 'pending'
+
+def test_unknown_events_are_rejected(seeded_db):
+    with pytest.raises(ValueError):
+        outbox.enqueue(seeded_db, 'booking.deleted', {})
@@ -0,0 +1,87 @@
+"""
+The payments ledger: instalments, opening entries and balance verification.
+"""
+
+import pytest
+
+import payments
+from ids import encode_id
+
+@pytest.fixture
+def customer(seeded_db):
+    return seeded_db.clients.find_one({'name': 'Amit Sharma'})
+
+def _ledger(db, client_id):
+    return sorted((p['method'], p['amount'], p['source']) for p in db.payments.find({'client_id': encode_id(client_id)}))
+
+def test_seed_opens_the_ledger(seeded_db, customer):
+    assert _ledger(seeded_db, customer['_id']) == [('cash', 300000, 'opening'), ('cheque', 100000, 'opening')]
+    assert payments.verify_balances(seeded_db) == (1, 0, 0)
+
+def test_record_payment_adds_entry_and_takes_it_off_the_balance(client, seeded_db, customer):
+    response = client.post(f"/api/booking/clients/{customer['_id']}/payments", json={'amount': 40000, 'method': 'cash'})
+    assert response.status_code == 201
+    assert response.get_json()['balance'] == {'cash': 340000, 'cheque': 100000, 'total': 500000, 'remaining': 60000}
+    assert ('cash', 40000, 'instalment') in _ledger(seeded_db, customer['_id'])
+    assert payments.verify_balances(seeded_db) == (1, 0, 0)
+
+def test_final_payment_completes_the_client(client, customer):
+    response = client.post(f"/api/booking/clients/{customer['_id']}/payments", json={'amount': 100000, 'method': 'cheque'})
+    assert response.status_code == 201
+    assert response.get_json()['client_status'] == 'completed'
+
+def test_overpayment_is_rejected_without_a_ledger_entry(client, seeded_db, customer):
+    response = client.post(f"/api/booking/clients/{customer['_id']}/payments", json={'amount': 100001, 'method': 'cash'})
+    assert response.status_code == 409
+    assert len(_ledger(seeded_db, customer['_id'])) == 2
+    assert seeded_db.clients.find_one({'_id': customer['_id']})['payment'] == customer['payment']
+
+def test_new_booking_opens_the_client_ledger(client, seeded_db):
+    response = client.post('/api/booking/', json={
+        'property_id': encode_id(seeded_db.properties.find_one()['_id']),
+        'plot_number': 77,
+        'amount': 900000,
+        'client_name': 'Ravi Kumar',
+        'client_phone': '9000000000',
+        'client_aadhar': '1111-2222-3333',
+        'cash_payment': 1000,
+        'cheque_payment': 2000,
+        'employee_id': encode_id(seeded_db.employees.find_one()['_id'])
+    })
+    assert response.status_code == 201
+    client_id = response.get_json()['client_id']
+    assert _ledger(seeded_db, client_id) == [('cash', 1000, 'booking'), ('cheque', 2000, 'booking')]
+    assert payments.verify_balances(seeded_db) == (2, 0, 0)
+
+def test_verify_fixes_settled_drift(seeded_db, customer, monkeypatch):
+    monkeypatch.setattr(payments, 'VERIFY_GRACE_SECONDS', 0)
+    seeded_db.clients.update_one({'_id': customer['_id']}, {'$inc': {'payment.cash': 7, 'payment.remaining': -7}})
+    assert payments.verify_balances(seeded_db, fix=True) == (1, 1, 1)
+    assert seeded_db.clients.find_one({'_id': customer['_id']})['payment'] == customer['payment']
+
+def test_verify_leaves_recent_clients_alone(seeded_db, customer):
+    seeded_db.clients.update_one({'_id': customer['_id']}, {'$inc': {'payment.cash': 7, 'payment.remaining': -7}})
+    assert payments.verify_balances(seeded_db, fix=True) == (1, 1, 0)
+    assert seeded_db.clients.find_one({'_id': customer['_id']})['payment']['cash'] == 300007
+
+def test_verify_never_zeroes_clients_without_entries(seeded_db, customer, monkeypatch):
+    monkeypatch.setattr(payments, 'VERIFY_GRACE_SECONDS', 0)
+    seeded_db.payments.delete_many({})
+    assert payments.verify_balances(seeded_db, fix=True) == (1, 1, 0)
+    assert seeded_db.clients.find_one({'_id': customer['_id']})['payment'] == customer['payment']
+
+def test_backfill_and_verify_clients_with_string_ids(db, monkeypatch):
+    monkeypatch.setattr(payments, 'VERIFY_GRACE_SECONDS', 0)
+    db.clients.insert_one({
+        '_id': 'c001',
+        'project_id': 'p001',
+        'payment': {'cash': 300000, 'cheque': 200000, 'total': 500000, 'remaining': 0}
+    })
+    assert payments.backfill_opening(db) == 2
+    entry = db.payments.find_one({'client_id': 'c001', 'method': 'cash'})
+    assert entry['paid_at'] == entry['recorded_at']
+
+    # Without an ObjectId only the ledger entries count towards the grace window
+    db.clients.update_one({'_id': 'c001'}, {'$set': {'payment.cash': 0, 'payment.remaining': 300000}})
+    assert payments.verify_balances(db, fix=True) == (1, 1, 1)
+    assert db.clients.find_one({'_id': 'c001'})['payment']['cash'] == 300000
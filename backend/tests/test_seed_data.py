@@ -0,0 +1,32 @@
+"""
+Reseeding replaces the data and everything derived from it.
+"""
+
+from seed_data import seed_database
+from ids import encode_id
+
+def _rollup_ids(db, collection):
+    return {rollup['_id'] for rollup in db[collection].find({}, {'_id': 1})}
+
+def test_reseed_rebuilds_rollups_for_the_new_data(seeded_db):
+    seeded_db.property_rollups.insert_one({'_id': 'gone', 'bookings': 3})
+    seeded_db.employee_rollups.insert_one({'_id': 'gone', 'bookings': 3})
+    seeded_db.outbox.insert_one({'event': 'booking.created', 'payload': {}})
+    seeded_db.property_tombstones.insert_one({'property_id': 'gone'})
+
+    seed_database(scale=0)
+
+    assert _rollup_ids(seeded_db, 'property_rollups') == {
+        encode_id(prop['_id']) for prop in seeded_db.properties.find({}, {'_id': 1})
+    }
+    assert 'gone' not in _rollup_ids(seeded_db, 'employee_rollups')
+    assert seeded_db.outbox.count_documents({}) == 0
+    assert seeded_db.property_tombstones.count_documents({}) == 0
+
+def test_seeded_reports_match_the_clients(client, seeded_db):
+    customer = seeded_db.clients.find_one({})
+    response = client.get(f"/api/reports/properties/{customer['project_id']}")
+    assert response.status_code == 200
+    assert response.get_json()['report']['payments'] == {
+        field: customer['payment'][field] for field in ('cash', 'cheque', 'remaining')
+    }